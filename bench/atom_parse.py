@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""
+Compares how many entries per second the Atom parser turns into activities
+when it looks for each child with find() and findall(), as it used to, and
+when it walks each element's children once, as it does now.
+
+Entries get more and more extra links and extension elements, since every
+find() had to scan past them.
+
+"""
+
+from os.path import abspath, dirname, join
+import sys
+import timeit
+import xml.etree.ElementTree as etree
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+from feeds import synthetic_feed
+from giraffe.aggregator.activitystreams import Activity, Object, MediaLink
+from giraffe.aggregator.activitystreams.atom import *
+from giraffe.aggregator.activitystreams.dates import parse_w3cdtf
+
+
+# The parser as it was before.
+def old_make_activities_from_entry(entry_elem, feed_elem):
+    object_elems = entry_elem.findall(ACTIVITY_OBJECT)
+
+    activity_is_implied = False
+
+    if len(object_elems) == 0:
+        activity_is_implied = True
+        object_elems = [ entry_elem ]
+
+    author_elem = entry_elem.find(ATOM_AUTHOR)
+    if author_elem is None:
+        source_elem = entry_elem.find(ATOM_SOURCE)
+        if source_elem is not None:
+            author_elem = source_elem.find(ATOM_AUTHOR)
+        if author_elem is None:
+            author_elem = feed_elem.find(ATOM_AUTHOR)
+
+    target_elem = entry_elem.find(ACTIVITY_TARGET)
+
+    published_elem = entry_elem.find(ATOM_PUBLISHED)
+    published_datetime = None
+    if published_elem is not None:
+        published_w3cdtf = published_elem.text
+        published_datetime = parse_w3cdtf(published_w3cdtf)
+        if published_datetime is None:
+            published_datetime = parse_w3cdtf("1970-01-01T00:00:00Z")
+
+    verb_elem = entry_elem.find(ACTIVITY_VERB)
+    verb = None
+    if verb_elem is not None:
+        verb = verb_elem.text
+    else:
+        verb = POST_VERB
+
+    generator_elem = entry_elem.find(ATOM_GENERATOR)
+
+    icon_url = None
+    icon_elem = entry_elem.find(ATOM_ICON)
+    if icon_elem is not None:
+        icon_url = icon_elem.text
+
+    target = None
+    if target_elem is not None and len(target_elem):
+        target = old_make_object_from_elem(target_elem, feed_elem, ObjectParseMode.ACTIVITY_OBJECT)
+
+    actor = None
+    if author_elem is not None and len(author_elem):
+        actor = old_make_object_from_elem(author_elem, feed_elem, ObjectParseMode.ATOM_AUTHOR)
+
+    activities = []
+    for object_elem in object_elems:
+        if activity_is_implied:
+            object = old_make_object_from_elem(object_elem, feed_elem, ObjectParseMode.ATOM_ENTRY)
+        else:
+            object = old_make_object_from_elem(object_elem, feed_elem, ObjectParseMode.ACTIVITY_OBJECT)
+
+        activity = Activity(object=object, actor=actor, target=target, verb=verb, time=published_datetime, icon_url=icon_url)
+        activities.append(activity)
+
+    return activities
+
+
+def old_make_object_from_elem(object_elem, feed_elem, mode):
+    id = None
+    id_elem = object_elem.find(ATOM_ID)
+    if id_elem is not None:
+        id = id_elem.text
+
+    summary = None
+    summary_elem = object_elem.find(ATOM_SUMMARY)
+    if summary_elem is not None:
+        summary = summary_elem.text
+
+    name_tag_name = ATOM_TITLE
+    if mode == ObjectParseMode.ATOM_AUTHOR:
+        name_tag_name = ATOM_NAME
+    name = None
+    name_elem = object_elem.find(name_tag_name)
+    if name_elem is not None:
+        name = name_elem.text
+
+    url = None
+    image = None
+    for link_elem in object_elem.findall(ATOM_LINK):
+        type = link_elem.get("type")
+        rel = link_elem.get("rel")
+        if rel is None or rel == "alternate":
+            if type is None or type == "text/html":
+                url = link_elem.get("href")
+        if rel == "preview":
+            if type is None or type == "image/jpeg" or type == "image/gif" or type == "image/png":
+                image = MediaLink(url=link_elem.get("href"))
+
+    if url is None and mode == ObjectParseMode.ATOM_AUTHOR:
+        uri_elem = object_elem.find(ATOM_URI)
+        if uri_elem is not None:
+            url = uri_elem.text
+
+    object_type_elem = object_elem.find(ACTIVITY_OBJECT_TYPE)
+    object_type = None
+    if object_type_elem is not None:
+        object_type = object_type_elem.text
+
+    return Object(id=id, name=name, url=url, object_type=object_type, image=image, summary=summary)
+
+
+def summarise(activities):
+    def obj(o):
+        if o is None:
+            return None
+        return (o.id, o.name, o.url, o.object_type, o.summary, o.image and o.image.url)
+    return [(a.verb, a.time, a.icon_url, obj(a.actor), obj(a.object), obj(a.target))
+        for a in activities]
+
+
+def run(func, feed_elem, entry_elems):
+    activities = []
+    for entry_elem in entry_elems:
+        activities.extend(func(entry_elem, feed_elem))
+    return activities
+
+
+def main(entries=1000):
+    print '%6s %10s %16s %16s' % ('links', 'extensions', 'old entries/sec', 'new entries/sec')
+    for extra in (0, 5, 20, 50):
+        feed_elem = etree.fromstring(synthetic_feed(entries, links=extra, extensions=extra))
+        entry_elems = feed_elem.findall(ATOM_ENTRY)
+
+        old = run(old_make_activities_from_entry, feed_elem, entry_elems)
+        new = run(make_activities_from_entry, feed_elem, entry_elems)
+        assert summarise(old) == summarise(new), 'old and new parsers disagree'
+
+        rates = []
+        for func in (old_make_activities_from_entry, make_activities_from_entry):
+            best = min(timeit.repeat(lambda: run(func, feed_elem, entry_elems), number=1, repeat=5))
+            rates.append(entries / best)
+        print '%6d %10d %16.0f %16.0f  (%.1fx)' % (extra, extra, rates[0], rates[1], rates[1] / rates[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Compares the throughput of the old per-call W3CDTF parser with
+giraffe.aggregator.activitystreams.dates.parse_w3cdtf.
+
+The sample mimics a feed: mostly `YYYY-MM-DDTHH:MM:SSZ` timestamps, some
+repeated, plus a few with offsets, fractions and Julian dates.
+
+"""
+
+import datetime
+from os.path import abspath, dirname, join
+import re
+import sys
+import time
+import timeit
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+from giraffe.aggregator.activitystreams import dates
+
+
+# The parser as it was before, pilfered from Universal Feed Parser.
+def old_parse_date_w3cdtf(dateString):
+    def __extract_date(m):
+        year = int(m.group('year'))
+        if year < 100:
+            year = 100 * int(time.gmtime()[0] / 100) + int(year)
+        if year < 1000:
+            return 0, 0, 0
+        julian = m.group('julian')
+        if julian:
+            julian = int(julian)
+            month = julian / 30 + 1
+            day = julian % 30 + 1
+            jday = None
+            while jday != julian:
+                t = time.mktime((year, month, day, 0, 0, 0, 0, 0, 0))
+                jday = time.gmtime(t)[-2]
+                diff = abs(jday - julian)
+                if jday > julian:
+                    if diff < day:
+                        day = day - diff
+                    else:
+                        month = month - 1
+                        day = 31
+                elif jday < julian:
+                    if day + diff < 28:
+                       day = day + diff
+                    else:
+                        month = month + 1
+            return year, month, day
+        month = m.group('month')
+        day = 1
+        if month is None:
+            month = 1
+        else:
+            month = int(month)
+            day = m.group('day')
+            if day:
+                day = int(day)
+            else:
+                day = 1
+        return year, month, day
+
+    def __extract_time(m):
+        if not m:
+            return 0, 0, 0
+        hours = m.group('hours')
+        if not hours:
+            return 0, 0, 0
+        hours = int(hours)
+        minutes = int(m.group('minutes'))
+        seconds = m.group('seconds')
+        if seconds:
+            seconds = int(float(seconds))
+        else:
+            seconds = 0
+        return hours, minutes, seconds
+
+    def __extract_tzd(m):
+        '''Return the Time Zone Designator as an offset in seconds from UTC.'''
+        if not m:
+            return 0
+        tzd = m.group('tzd')
+        if not tzd:
+            return 0
+        if tzd == 'Z':
+            return 0
+        hours = int(m.group('tzdhours'))
+        minutes = m.group('tzdminutes')
+        if minutes:
+            minutes = int(minutes)
+        else:
+            minutes = 0
+        offset = (hours*60 + minutes) * 60
+        if tzd[0] == '+':
+            return -offset
+        return offset
+
+    __date_re = ('(?P<year>\d\d\d\d)'
+                 '(?:(?P<dsep>-|)'
+                 '(?:(?P<julian>\d\d\d)'
+                 '|(?P<month>\d\d)(?:(?P=dsep)(?P<day>\d\d))?))?')
+    __tzd_re = '(?P<tzd>[-+](?P<tzdhours>\d\d)(?::?(?P<tzdminutes>\d\d))|Z)'
+    __tzd_rx = re.compile(__tzd_re)
+    __time_re = ('(?P<hours>\d\d)(?P<tsep>:|)(?P<minutes>\d\d)'
+                 '(?:(?P=tsep)(?P<seconds>\d\d(?:[.,]\d+)?))?'
+                 + __tzd_re)
+    __datetime_re = '%s(?:T%s)?' % (__date_re, __time_re)
+    __datetime_rx = re.compile(__datetime_re)
+    m = __datetime_rx.match(dateString)
+    if (m is None) or (m.group() != dateString): return
+    gmt = __extract_date(m) + __extract_time(m) + (0, 0, 0)
+    if gmt[0] == 0: return
+    return datetime.datetime.utcfromtimestamp(time.mktime(gmt) + __extract_tzd(m) - time.timezone)
+
+
+def sample():
+    stamps = []
+    start = datetime.datetime(2010, 9, 1)
+    for i in range(400):
+        when = start + datetime.timedelta(minutes=37 * i)
+        stamps.append(when.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        if i % 4 == 0:
+            # Activities that share their entry's timestamp.
+            stamps.append(stamps[-1])
+    for i in range(20):
+        stamps.append('2010-09-%02dT10:15:30.25-07:00' % (i + 1))
+        stamps.append('2010-%03dT08:00Z' % (i + 200))
+    return stamps
+
+
+def check(stamps):
+    for stamp in stamps:
+        old, new = old_parse_date_w3cdtf(stamp), dates.parse_w3cdtf(stamp)
+        assert old == new, '%s: old parser says %r, new one says %r' % (stamp, old, new)
+
+
+def bench(func, stamps, repeat):
+    def run():
+        for stamp in stamps:
+            func(stamp)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return len(stamps) / best
+
+
+def main():
+    stamps = sample()
+    check(stamps)
+
+    old = bench(old_parse_date_w3cdtf, stamps, 5)
+    dates._cache.clear()
+    cold = bench(lambda s: (dates._cache.clear(), dates.parse_w3cdtf(s)), stamps, 5)
+    warm = bench(dates.parse_w3cdtf, stamps, 5)
+
+    print '%d timestamps' % len(stamps)
+    print 'old parser:           %10.0f dates/sec' % old
+    print 'new parser, no cache: %10.0f dates/sec (%.1fx)' % (cold, cold / old)
+    print 'new parser, cached:   %10.0f dates/sec (%.1fx)' % (warm, warm / old)
+
+
+if __name__ == '__main__':
+    main()
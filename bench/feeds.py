@@ -0,0 +1,45 @@
+"""Synthetic Atom feeds for the benchmarks."""
+
+import datetime
+
+
+ENTRY = '''
+<entry>
+  <id>tag:example.com,2010:entry-%(i)d</id>
+  <title>Entry number %(i)d</title>
+  <summary>This is the summary of entry number %(i)d.</summary>
+  <published>%(published)s</published>
+  <link rel="alternate" type="text/html" href="http://example.com/entry/%(i)d"/>
+  <link rel="preview" type="image/jpeg" href="http://example.com/entry/%(i)d.jpg"/>
+%(links)s%(extensions)s  <author>
+    <name>Author %(author)d</name>
+    <uri>http://example.com/people/%(author)d</uri>
+  </author>
+  <a:verb>http://activitystrea.ms/schema/1.0/post</a:verb>
+  <a:object-type>http://activitystrea.ms/schema/1.0/article</a:object-type>
+</entry>'''
+
+LINK = '  <link rel="related" href="http://example.com/entry/%d/related/%d"/>\n'
+EXTENSION = '  <x:extension%d xmlns:x="http://example.com/ns">value %d</x:extension%d>\n'
+
+
+def synthetic_feed(entries, links=0, extensions=0, authors=5, first=0):
+    """Return the text of an Atom feed with `entries` entries, numbered from
+    `first`, each with `links` extra links and `extensions` extension
+    elements."""
+    start = datetime.datetime(2010, 9, 1)
+    parts = ['<?xml version="1.0"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:a="http://activitystrea.ms/spec/1.0/">\n'
+        '<title>Synthetic</title>\n'
+        '<author><name>Feed Author</name></author>\n']
+    for i in range(first, first + entries):
+        published = (start + datetime.timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        parts.append(ENTRY % {
+            'i': i,
+            'published': published,
+            'author': i % authors,
+            'links': ''.join(LINK % (i, j) for j in range(links)),
+            'extensions': ''.join(EXTENSION % (j, j, j) for j in range(extensions)),
+        })
+    parts.append('\n</feed>\n')
+    return ''.join(parts)
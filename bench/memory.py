@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+Measures how much memory the parsed activitystreams objects of a large
+synthetic feed take, with the slotted classes in
+giraffe.aggregator.activitystreams and with the dict-based classes they
+replaced.
+
+"""
+
+from cStringIO import StringIO
+from os.path import abspath, dirname, join
+import sys
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+from feeds import synthetic_feed
+from giraffe.aggregator.activitystreams import atom
+
+
+# The classes as they were before, trimmed to what the Atom parser fills in.
+class OldActivity(object):
+    def __init__(self, actor=None, object=None, target=None, verb=None, time=None, generator=None, icon_url=None, service_provider=None, links=None):
+        self.actor = actor
+        self.object = object
+        self.target = target
+        self.verb = verb
+        self.time = time
+        self.service_provider = service_provider
+        self.generator = generator
+        self.icon_url = icon_url
+        self.links = links if links is not None else []
+
+
+class OldObject(object):
+    def __init__(self, id=None, name=None, url=None, object_type=None, summary=None, image=None, in_reply_to_object=None):
+        self.id = id
+        self.name = name
+        self.url = url
+        self.object_type = object_type
+        self.summary = summary
+        self.image = image
+        self.in_reply_to_object = in_reply_to_object
+        self.attached_objects = []
+        self.reply_objects = []
+        self.reaction_activities = []
+        self.action_links = []
+        self.upstream_duplicate_ids = []
+        self.downstream_duplicate_ids = []
+        self.links = []
+
+
+class OldMediaLink(object):
+    def __init__(self, url=None, media_type=None, width=None, height=None, duration=None):
+        self.url = url
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+        self.duration = duration
+
+
+def old_object(obj):
+    if obj is None:
+        return None
+    image = None
+    if obj.image is not None:
+        image = OldMediaLink(url=obj.image.url)
+    return OldObject(id=obj.id, name=obj.name, url=obj.url, object_type=obj.object_type,
+        summary=obj.summary, image=image)
+
+
+def old_activity(activity):
+    return OldActivity(actor=old_object(activity.actor), object=old_object(activity.object),
+        target=old_object(activity.target), verb=activity.verb, time=activity.time,
+        icon_url=activity.icon_url)
+
+
+def footprint(obj, seen):
+    """Return the bytes used by `obj` itself and the containers it owns,
+    counting each container once."""
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        values = attrs.values()
+    else:
+        values = [getattr(obj, name) for name in type(obj).__slots__]
+
+    for value in values:
+        if isinstance(value, (list, tuple)) and id(value) not in seen:
+            seen.add(id(value))
+            size += sys.getsizeof(value)
+        elif hasattr(value, '__dict__') or hasattr(type(value), '__slots__'):
+            size += footprint(value, seen)
+    return size
+
+
+def measure(activities):
+    seen = set()
+    return sum(footprint(activity, seen) for activity in activities)
+
+
+def main(entries=20000):
+    feed = synthetic_feed(entries)
+    activities = list(atom.iter_activities_from_feed(StringIO(feed)))
+    old_activities = [old_activity(activity) for activity in activities]
+
+    new_total = measure(activities)
+    old_total = measure(old_activities)
+
+    print '%d activities parsed from a %.1f MB feed' % (len(activities), len(feed) / 1048576.0)
+    print 'dict-based classes: %6.1f MB (%d bytes per activity)' % (old_total / 1048576.0, old_total / len(activities))
+    print 'slotted classes:    %6.1f MB (%d bytes per activity)' % (new_total / 1048576.0, new_total / len(activities))
+    print 'saving:             %5.0f%%' % (100.0 * (old_total - new_total) / old_total)
+
+
+if __name__ == '__main__':
+    main()
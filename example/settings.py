@@ -29,3 +29,142 @@ CELERY_RESULT_BACKEND = 'amqp'
 
 import djcelery
 djcelery.setup_loader()
+
+
+#
+# giraffe.aggregator settings
+#
+
+# With 'sync', PuSH notifications are ingested before the callback responds.
+# With 'deferred', the callback stores the payload and responds right away,
+# and a celery task ingests it along with any others queued for the same
+# subscription (up to AGGREGATOR_INGEST_BATCH_SIZE payloads at a time).
+# A worker that hasn't finished its batch after
+# AGGREGATOR_INGEST_CLAIM_TIMEOUT seconds is assumed dead, and another
+# worker takes the batch over.
+AGGREGATOR_INGEST_MODE = 'sync'
+AGGREGATOR_INGEST_BATCH_SIZE = 20
+AGGREGATOR_INGEST_CLAIM_TIMEOUT = 600
+
+# Polling fetches up to AGGREGATOR_POLL_WORKERS hosts' feeds at once, giving
+# up on each request after AGGREGATOR_POLL_TIMEOUT seconds.
+AGGREGATOR_POLL_WORKERS = 10
+AGGREGATOR_POLL_TIMEOUT = 30
+
+# Run celerybeat to poll feeds on a schedule. Every
+# AGGREGATOR_POLL_DISPATCH_EVERY seconds, up to
+# AGGREGATOR_POLL_DISPATCH_LIMIT subscriptions that are due are polled in
+# batches of AGGREGATOR_POLL_BATCH_SIZE; any more wait for the next round.
+# Each feed's interval doubles while it has nothing new and halves when it
+# does, staying between AGGREGATOR_POLL_MIN_INTERVAL and
+# AGGREGATOR_POLL_MAX_INTERVAL seconds.
+AGGREGATOR_POLL_DISPATCH_EVERY = 60
+AGGREGATOR_POLL_DISPATCH_LIMIT = 1000
+AGGREGATOR_POLL_BATCH_SIZE = 50
+AGGREGATOR_POLL_MIN_INTERVAL = 300
+AGGREGATOR_POLL_MAX_INTERVAL = 86400
+
+# How many recently ingested objects each process remembers, so objects that
+# appear over and over (like a feed's author) don't need looking up every
+# time. 0 turns the cache off.
+AGGREGATOR_OBJECT_CACHE_SIZE = 0
+
+# Read the activity stream from per-user timelines, which are kept to the
+# newest AGGREGATOR_TIMELINE_LENGTH activities from each user's
+# subscriptions. Run the backfilltimeline command before turning this on.
+AGGREGATOR_TIMELINES = False
+AGGREGATOR_TIMELINE_LENGTH = 1000
+
+# How long, in seconds, the rendered HTML of each activity on the activity
+# stream is kept in the cache. Cards are dropped when ingest changes their
+# objects, and whenever the card template changes.
+AGGREGATOR_CARD_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Where to keep compiled aggregator templates between processes. Run the
+# precompiletemplates command when deploying to fill it in. Turn off
+# AGGREGATOR_JINJA_AUTO_RELOAD in production so templates aren't checked for
+# changes on every render.
+#AGGREGATOR_JINJA_BYTECODE_CACHE_DIR = '/var/cache/giraffe/jinja'
+AGGREGATOR_JINJA_AUTO_RELOAD = True
+
+# The hub to subscribe through when a feed doesn't name one, and how long,
+# in seconds, to remember the hub found in the feeds of each host.
+# New subscriptions are seeded with the activities in the feed fetched to
+# find the hub unless AGGREGATOR_SEED_ON_SUBSCRIBE is off.
+AGGREGATOR_DEFAULT_HUB = 'http://pubsubhubbub.appspot.com/'
+AGGREGATOR_HUB_CACHE_TIMEOUT = 24 * 60 * 60
+AGGREGATOR_SEED_ON_SUBSCRIBE = True
+
+# Run celerybeat to renew the leases hubs grant push subscriptions. Each
+# lease is renewed at a random time in its last AGGREGATOR_LEASE_RENEW_WINDOW
+# seconds. Every AGGREGATOR_LEASE_DISPATCH_EVERY seconds, the renewals that
+# are due are sent in batches of AGGREGATOR_LEASE_BATCH_SIZE spread over that
+# period, with up to AGGREGATOR_LEASE_RENEW_WORKERS hubs contacted at once.
+# No more than AGGREGATOR_LEASE_DISPATCH_LIMIT are sent each time; any more
+# wait for the next round. A renewal the hub hasn't verified after
+# AGGREGATOR_LEASE_RENEW_RETRY seconds is sent again, and a hub that doesn't
+# answer within AGGREGATOR_LEASE_RENEW_TIMEOUT seconds is given up on.
+AGGREGATOR_LEASE_RENEW_WINDOW = 86400
+AGGREGATOR_LEASE_DISPATCH_EVERY = 3600
+AGGREGATOR_LEASE_DISPATCH_LIMIT = 1000
+AGGREGATOR_LEASE_BATCH_SIZE = 50
+AGGREGATOR_LEASE_RENEW_RETRY = 3600
+AGGREGATOR_LEASE_RENEW_WORKERS = 10
+AGGREGATOR_LEASE_RENEW_TIMEOUT = 30
+
+# Keep a Bloom filter of stored activities, so entries that are delivered
+# again unchanged skip the database. Size it for the number of activities
+# you expect to store (it takes about 3.6MB per million at the default error
+# rate), and run the primeseenfilter command once so brand new activities
+# can skip their lookups too. Each process saves its filter into
+# AGGREGATOR_SEEN_FILTER_FILE every AGGREGATOR_SEEN_FILTER_SAVE_EVERY
+# seconds.
+AGGREGATOR_SEEN_FILTER = False
+AGGREGATOR_SEEN_FILTER_CAPACITY = 1000000
+AGGREGATOR_SEEN_FILTER_ERROR_RATE = 0.001
+#AGGREGATOR_SEEN_FILTER_FILE = '/var/lib/giraffe/seen.bloom'
+AGGREGATOR_SEEN_FILTER_SAVE_EVERY = 300
+
+# Set the giraffe.aggregator.trace logger to DEBUG to trace how activities
+# are identified and saved. Only this fraction of the trace messages are
+# logged, to keep the cost down under load.
+AGGREGATOR_TRACE_SAMPLE_RATE = 0.01
+
+# Store activity, object and subscription hashes as 20 raw bytes instead of
+# 40 hex characters, halving their unique indexes. Decide before running
+# the aggregator's migration 0010, which converts the columns; to change
+# your mind, migrate back to 0009 first.
+AGGREGATOR_BINARY_KEYS = False
+
+# The publisher's Atom feed is kept in the cache, and only rendered again
+# when an asset is saved or deleted or after this many seconds.
+PUBLISHER_FEED_CACHE_TIMEOUT = 24 * 60 * 60
+
+# New assets are rendered once for all their subscribers, and kept in the
+# cache for this many seconds while they're delivered.
+PUBLISHER_NOTIFICATION_TIMEOUT = 24 * 60 * 60
+
+# Notifications to subscribers time out after PUBLISHER_DELIVERY_TIMEOUT
+# seconds, and are tried up to PUBLISHER_DELIVERY_ATTEMPTS times, waiting
+# about PUBLISHER_DELIVERY_BACKOFF seconds after the first failure and twice
+# as long after each one after that, up to PUBLISHER_DELIVERY_MAX_BACKOFF.
+# Notifications that never get through are kept for the replaydeadletters
+# command. No more than PUBLISHER_DELIVERY_HOST_LIMIT notifications are sent
+# to one host at once.
+PUBLISHER_DELIVERY_TIMEOUT = 10
+PUBLISHER_DELIVERY_ATTEMPTS = 6
+PUBLISHER_DELIVERY_BACKOFF = 30
+PUBLISHER_DELIVERY_MAX_BACKOFF = 3600
+PUBLISHER_DELIVERY_HOST_LIMIT = 4
+
+# Stop contacting a subscriber's host for PUBLISHER_BREAKER_RESET seconds
+# after PUBLISHER_BREAKER_THRESHOLD requests to it fail in a row. Its
+# notifications and verifications are parked meanwhile, and sent once a
+# trial request gets through. Run celerybeat to send the trials.
+PUBLISHER_BREAKER_THRESHOLD = 5
+PUBLISHER_BREAKER_RESET = 300
+
+# New assets are announced to subscribers in batches of this many delivery
+# tasks, each batch sent over one connection to the broker. Run celerybeat
+# to delete subscriptions whose leases have run out.
+PUBLISHER_FANOUT_BATCH_SIZE = 100
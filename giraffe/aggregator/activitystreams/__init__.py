@@ -1,15 +1,30 @@
+"""
+The in-memory model of activity streams.
+
+Big feeds turn into thousands of these objects, so they use `__slots__`
+rather than instance dicts. List-valued attributes aren't given their list
+until they're first read, so objects that never use them don't pay for one.
+
+"""
+
+def _list_attribute(slot):
+    def get(self):
+        value = getattr(self, slot)
+        if value is None:
+            value = []
+            setattr(self, slot, value)
+        return value
+
+    def set(self, value):
+        setattr(self, slot, value)
+
+    return property(get, set)
 
 
 class Activity(object):
-    actor = None
-    object = None
-    target = None
-    verb = None
-    time = None
-    generator = None
-    icon_url = None
-    service_provider = None
-    links = None
+    __slots__ = ('actor', 'object', 'target', 'verb', 'time', 'generator', 'icon_url', 'service_provider', '_links')
+
+    links = _list_attribute('_links')
 
     def __init__(self, actor=None, object=None, target=None, verb=None, time=None, generator=None, icon_url=None, service_provider=None, links=None):
         self.actor = actor
@@ -20,27 +35,21 @@ class Activity(object):
         self.service_provider = service_provider
         self.generator = generator
         self.icon_url = icon_url
+        self._links = links
 
-        if links is not None:
-            self.links = links
-        else:
-            self.links = []
 
 class Object(object):
-    id = None
-    name = None
-    url = None
-    object_type = None
-    summary = None
-    image = None
-    in_reply_to_object = None
-    attached_objects = None
-    reply_objects = None
-    reaction_activities = None
-    action_links = None
-    upstream_duplicate_ids = None
-    downstream_duplicate_ids = None
-    links = None
+    __slots__ = ('id', 'name', 'url', 'object_type', 'summary', 'image', 'in_reply_to_object',
+        '_attached_objects', '_reply_objects', '_reaction_activities', '_action_links',
+        '_upstream_duplicate_ids', '_downstream_duplicate_ids', '_links')
+
+    attached_objects = _list_attribute('_attached_objects')
+    reply_objects = _list_attribute('_reply_objects')
+    reaction_activities = _list_attribute('_reaction_activities')
+    action_links = _list_attribute('_action_links')
+    upstream_duplicate_ids = _list_attribute('_upstream_duplicate_ids')
+    downstream_duplicate_ids = _list_attribute('_downstream_duplicate_ids')
+    links = _list_attribute('_links')
 
     def __init__(self, id=None, name=None, url=None, object_type=None, summary=None, image=None, in_reply_to_object=None, attached_objects=None, reply_objects=None, reaction_activities=None, action_links=None, upstream_duplicate_ids=None, downstream_duplicate_ids=None, links=None):
         self.id = id
@@ -50,49 +59,17 @@ class Object(object):
         self.summary = summary
         self.image = image
         self.in_reply_to_object = in_reply_to_object
-
-        if attached_objects is not None:
-            self.attached_objects = attached_objects
-        else:
-            self.attached_objects = []
-
-        if reply_objects is not None:
-            self.reply_objects = reply_objects
-        else:
-            self.reply_objects = []
-
-        if reaction_activities is not None:
-            self.reaction_activities = reaction_activities
-        else:
-            self.reaction_activities = []
-
-        if action_links is not None:
-            self.action_links = action_links
-        else:
-            self.action_links = []
-
-        if upstream_duplicate_ids is not None:
-            self.upstream_duplicate_ids = upstream_duplicate_ids
-        else:
-            self.upstream_duplicate_ids = []
-
-        if downstream_duplicate_ids is not None:
-            self.downstream_duplicate_ids = downstream_duplicate_ids
-        else:
-            self.downstream_duplicate_ids = []
-
-        if links is not None:
-            self.links = links
-        else:
-            self.links = []
+        self._attached_objects = attached_objects
+        self._reply_objects = reply_objects
+        self._reaction_activities = reaction_activities
+        self._action_links = action_links
+        self._upstream_duplicate_ids = upstream_duplicate_ids
+        self._downstream_duplicate_ids = downstream_duplicate_ids
+        self._links = links
 
 
 class MediaLink(object):
-    url = None
-    media_type = None
-    width = None
-    height = None
-    duration = None
+    __slots__ = ('url', 'media_type', 'width', 'height', 'duration')
 
     def __init__(self, url=None, media_type=None, width=None, height=None, duration=None):
         self.url = url
@@ -103,8 +80,7 @@ class MediaLink(object):
 
 
 class ActionLink(object):
-    url = None
-    caption = None
+    __slots__ = ('url', 'caption')
 
     def __init__(self, url=None, caption=None):
         self.url = url
@@ -112,16 +88,9 @@ class ActionLink(object):
 
 
 class Link(object):
-    url = None
-    media_type = None
-    rel = None
+    __slots__ = ('url', 'media_type', 'rel')
 
     def __init__(self, url=None, media_type=None, rel=None):
         self.url = url
         self.media_type = media_type
         self.rel = rel
-
-
-
-
-
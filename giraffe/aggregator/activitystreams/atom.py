@@ -1,15 +1,14 @@
 
 
 from giraffe.aggregator.activitystreams import Activity, Object, MediaLink, ActionLink, Link
+from giraffe.aggregator.activitystreams.dates import parse_w3cdtf
 
 
-import re
-import datetime
-import time
+import xml.etree.ElementTree as etree
 
 
 class AtomActivity(Activity):
-    pass
+    __slots__ = ()
 
 
 # This is a weird enum-like thing.
@@ -66,55 +65,162 @@ def make_activities_from_feed(feed_elem):
     return activities
 
 
+def iterparse_feed(source, on_header=None):
+    """Incrementally parse the Atom feed read from the file-like `source`.
+
+    Yields an `(entry_elem, feed_elem)` pair as soon as each entry has been
+    parsed. `feed_elem` only holds the feed-level children seen so far
+    (`atom:author`, `atom:link` and so on), so consumers can still fall back
+    on feed-level context. Each entry is cleared and detached from the feed
+    once the consumer has moved on, so memory use doesn't grow with the size
+    of the feed.
+
+    If given, `on_header` is called with `feed_elem` once the feed header has
+    been read: when the first entry starts, or at the end of a feed with no
+    entries. If it returns true, parsing stops there.
+
+    """
+    feed_elem = None
+    depth = 0
+    for event, elem in etree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if feed_elem is None:
+                feed_elem = elem
+            elif depth == 1 and elem.tag == ATOM_ENTRY and on_header is not None:
+                stop = on_header(feed_elem)
+                on_header = None
+                if stop:
+                    return
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1 and elem.tag == ATOM_ENTRY:
+            yield elem, feed_elem
+            elem.clear()
+            feed_elem.remove(elem)
+
+    if on_header is not None and feed_elem is not None:
+        on_header(feed_elem)
+
+
+def iter_activities_from_feed(source):
+    """Like `make_activities_from_feed`, but reads the feed incrementally
+    from the file-like `source` and yields activities entry by entry."""
+    for entry_elem, feed_elem in iterparse_feed(source):
+        for activity in make_activities_from_entry(entry_elem, feed_elem):
+            yield activity
+
+
+# Parsing an element walks its children once, handing each one to the
+# handler for its tag in one of these tables. Handlers collect what they find
+# in a dict of fields. Most only keep the first matching child, as find()
+# would.
+
+def _keep_first(field):
+    def handler(fields, elem):
+        if field not in fields:
+            fields[field] = elem
+    return handler
+
+
+def _keep_first_text(field):
+    def handler(fields, elem):
+        if field not in fields:
+            fields[field] = elem.text
+    return handler
+
+
+def _append_object(fields, elem):
+    fields.setdefault('object_elems', []).append(elem)
+
+
+def _handle_link(fields, link_elem):
+    type = link_elem.get("type")
+    rel = link_elem.get("rel")
+    if rel is None or rel == "alternate":
+        if type is None or type == "text/html":
+            fields['url'] = link_elem.get("href")
+    if rel == "preview":
+        if type is None or type == "image/jpeg" or type == "image/gif" or type == "image/png":
+            # FIXME: Should pull out the width/height/duration attributes from AtomMedia too.
+            fields['image'] = MediaLink(url=link_elem.get("href"))
+
+
+ENTRY_HANDLERS = {
+    ACTIVITY_OBJECT: _append_object,
+    ATOM_AUTHOR: _keep_first('author_elem'),
+    ATOM_SOURCE: _keep_first('source_elem'),
+    ACTIVITY_TARGET: _keep_first('target_elem'),
+    ATOM_PUBLISHED: _keep_first_text('published'),
+    ACTIVITY_VERB: _keep_first_text('verb'),
+    ATOM_ICON: _keep_first_text('icon_url'),
+}
+
+OBJECT_HANDLERS = {
+    ATOM_ID: _keep_first_text('id'),
+    ATOM_SUMMARY: _keep_first_text('summary'),
+    ATOM_TITLE: _keep_first_text('name'),
+    ATOM_LINK: _handle_link,
+    ACTIVITY_OBJECT_TYPE: _keep_first_text('object_type'),
+}
+
+# The ATOM_AUTHOR parsing mode looks in atom:name instead of atom:title, and
+# falls back on atom:uri if there's no link rel="alternate".
+AUTHOR_HANDLERS = dict(OBJECT_HANDLERS)
+del AUTHOR_HANDLERS[ATOM_TITLE]
+AUTHOR_HANDLERS[ATOM_NAME] = _keep_first_text('name')
+AUTHOR_HANDLERS[ATOM_URI] = _keep_first_text('uri')
+
+
+def _dispatch_children(elem, handlers):
+    fields = {}
+    for child in elem:
+        handler = handlers.get(child.tag)
+        if handler is not None:
+            handler(fields, child)
+    return fields
+
+
 def make_activities_from_entry(entry_elem, feed_elem):
-    object_elems = entry_elem.findall(ACTIVITY_OBJECT)
+    fields = _dispatch_children(entry_elem, ENTRY_HANDLERS)
+
+    object_elems = fields.get('object_elems')
 
     activity_is_implied = False
 
-    if len(object_elems) == 0:
+    if not object_elems:
         # Implied activity, so the entry itself represents the object.
         activity_is_implied = True
         object_elems = [ entry_elem ]
 
-    author_elem = entry_elem.find(ATOM_AUTHOR)
+    author_elem = fields.get('author_elem')
     if author_elem is None:
-        source_elem = entry_elem.find(ATOM_SOURCE)
+        source_elem = fields.get('source_elem')
         if source_elem is not None:
             author_elem = source_elem.find(ATOM_AUTHOR)
         if author_elem is None:
             author_elem = feed_elem.find(ATOM_AUTHOR)
 
-    target_elem = entry_elem.find(ACTIVITY_TARGET)
+    target_elem = fields.get('target_elem')
 
-    published_elem = entry_elem.find(ATOM_PUBLISHED)
     published_datetime = None
-    if published_elem is not None:
-        published_w3cdtf = published_elem.text
-        published_datetime = _parse_date_w3cdtf(published_w3cdtf)
+    if 'published' in fields:
+        published_datetime = parse_w3cdtf(fields['published'])
         if published_datetime is None:
             # Just make up a date, I guess?
-            published_datetime = _parse_date_w3cdtf("1970-01-01T00:00:00Z")
+            published_datetime = parse_w3cdtf("1970-01-01T00:00:00Z")
 
-    verb_elem = entry_elem.find(ACTIVITY_VERB)
-    verb = None
-    if verb_elem is not None:
-        verb = verb_elem.text
-    else:
-        verb = POST_VERB
-
-    generator_elem = entry_elem.find(ATOM_GENERATOR)
+    verb = fields.get('verb', POST_VERB)
 
-    icon_url = None
-    icon_elem = entry_elem.find(ATOM_ICON)
-    if icon_elem is not None:
-        icon_url = icon_elem.text
+    icon_url = fields.get('icon_url')
 
     target = None
-    if target_elem:
+    if target_elem is not None and len(target_elem):
         target = make_object_from_elem(target_elem, feed_elem, ObjectParseMode.ACTIVITY_OBJECT)
 
     actor = None
-    if author_elem:
+    if author_elem is not None and len(author_elem):
         actor = make_object_from_elem(author_elem, feed_elem, ObjectParseMode.ATOM_AUTHOR)
 
     activities = []
@@ -131,144 +237,15 @@ def make_activities_from_entry(entry_elem, feed_elem):
 
 
 def make_object_from_elem(object_elem, feed_elem, mode):
+    if mode == ObjectParseMode.ATOM_AUTHOR:
+        fields = _dispatch_children(object_elem, AUTHOR_HANDLERS)
+    else:
+        fields = _dispatch_children(object_elem, OBJECT_HANDLERS)
 
-    id = None
-    id_elem = object_elem.find(ATOM_ID)
-    if id_elem is not None:
-        id = id_elem.text
-
-    summary = None
-    summary_elem = object_elem.find(ATOM_SUMMARY)
-    if summary_elem is not None:
-        summary = summary_elem.text
+    url = fields.get('url')
+    if url is None:
+        url = fields.get('uri')
 
-    name_tag_name = ATOM_TITLE
-    # The ATOM_AUTHOR parsing mode looks in atom:name instead of atom:title
-    if mode == ObjectParseMode.ATOM_AUTHOR:
-        name_tag_name = ATOM_NAME
-    name = None
-    name_elem = object_elem.find(name_tag_name)
-    if name_elem is not None:
-        name = name_elem.text
-
-    url = None
-    image = None
-    for link_elem in object_elem.findall(ATOM_LINK):
-        type = link_elem.get("type")
-        rel = link_elem.get("rel")
-        if rel is None or rel == "alternate":
-            if type is None or type == "text/html":
-                url = link_elem.get("href")
-        if rel == "preview":
-            if type is None or type == "image/jpeg" or type == "image/gif" or type == "image/png":
-                # FIXME: Should pull out the width/height/duration attributes from AtomMedia too.
-                image = MediaLink(url=link_elem.get("href"))
-
-    # In the atom:author parse mode we fall back on atom:uri if there's no link rel="alternate"
-    if url is None and mode == ObjectParseMode.ATOM_AUTHOR:
-        uri_elem = object_elem.find(ATOM_URI)
-        if uri_elem is not None:
-            url = uri_elem.text
-
-    object_type_elem = object_elem.find(ACTIVITY_OBJECT_TYPE)
-    object_type = None
-    if object_type_elem is not None:
-        object_type = object_type_elem.text
-
-    return Object(id=id, name=name, url=url, object_type=object_type, image=image, summary=summary)
-
-
-# This is pilfered from Universal Feed Parser.
-def _parse_date_w3cdtf(dateString):
-    def __extract_date(m):
-        year = int(m.group('year'))
-        if year < 100:
-            year = 100 * int(time.gmtime()[0] / 100) + int(year)
-        if year < 1000:
-            return 0, 0, 0
-        julian = m.group('julian')
-        if julian:
-            julian = int(julian)
-            month = julian / 30 + 1
-            day = julian % 30 + 1
-            jday = None
-            while jday != julian:
-                t = time.mktime((year, month, day, 0, 0, 0, 0, 0, 0))
-                jday = time.gmtime(t)[-2]
-                diff = abs(jday - julian)
-                if jday > julian:
-                    if diff < day:
-                        day = day - diff
-                    else:
-                        month = month - 1
-                        day = 31
-                elif jday < julian:
-                    if day + diff < 28:
-                       day = day + diff
-                    else:
-                        month = month + 1
-            return year, month, day
-        month = m.group('month')
-        day = 1
-        if month is None:
-            month = 1
-        else:
-            month = int(month)
-            day = m.group('day')
-            if day:
-                day = int(day)
-            else:
-                day = 1
-        return year, month, day
-
-    def __extract_time(m):
-        if not m:
-            return 0, 0, 0
-        hours = m.group('hours')
-        if not hours:
-            return 0, 0, 0
-        hours = int(hours)
-        minutes = int(m.group('minutes'))
-        seconds = m.group('seconds')
-        if seconds:
-            seconds = int(float(seconds))
-        else:
-            seconds = 0
-        return hours, minutes, seconds
-
-    def __extract_tzd(m):
-        '''Return the Time Zone Designator as an offset in seconds from UTC.'''
-        if not m:
-            return 0
-        tzd = m.group('tzd')
-        if not tzd:
-            return 0
-        if tzd == 'Z':
-            return 0
-        hours = int(m.group('tzdhours'))
-        minutes = m.group('tzdminutes')
-        if minutes:
-            minutes = int(minutes)
-        else:
-            minutes = 0
-        offset = (hours*60 + minutes) * 60
-        if tzd[0] == '+':
-            return -offset
-        return offset
-
-    __date_re = ('(?P<year>\d\d\d\d)'
-                 '(?:(?P<dsep>-|)'
-                 '(?:(?P<julian>\d\d\d)'
-                 '|(?P<month>\d\d)(?:(?P=dsep)(?P<day>\d\d))?))?')
-    __tzd_re = '(?P<tzd>[-+](?P<tzdhours>\d\d)(?::?(?P<tzdminutes>\d\d))|Z)'
-    __tzd_rx = re.compile(__tzd_re)
-    __time_re = ('(?P<hours>\d\d)(?P<tsep>:|)(?P<minutes>\d\d)'
-                 '(?:(?P=tsep)(?P<seconds>\d\d(?:[.,]\d+)?))?'
-                 + __tzd_re)
-    __datetime_re = '%s(?:T%s)?' % (__date_re, __time_re)
-    __datetime_rx = re.compile(__datetime_re)
-    m = __datetime_rx.match(dateString)
-    if (m is None) or (m.group() != dateString): return
-    gmt = __extract_date(m) + __extract_time(m) + (0, 0, 0)
-    if gmt[0] == 0: return
-    return datetime.datetime.utcfromtimestamp(time.mktime(gmt) + __extract_tzd(m) - time.timezone)
+    return Object(id=fields.get('id'), name=fields.get('name'), url=url,
+        object_type=fields.get('object_type'), image=fields.get('image'),
+        summary=fields.get('summary'))
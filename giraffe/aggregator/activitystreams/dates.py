@@ -0,0 +1,99 @@
+"""
+Parsing for the W3C date and time format used in activity streams.
+
+`parse_w3cdtf` is called for every entry we parse, so the expressions are
+compiled once, the common `YYYY-MM-DDTHH:MM:SSZ` shape skips the general
+parser, and recent results are remembered since timestamps often repeat
+within a feed.
+
+"""
+
+import datetime
+import re
+
+from giraffe.aggregator.lru import LRUCache
+
+
+CACHE_SIZE = 512
+
+_cache = LRUCache(CACHE_SIZE)
+
+# \Z rather than $, which would let a trailing newline through.
+_fast_rx = re.compile(r'(\d\d\d\d)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z\Z')
+
+# These are pilfered from Universal Feed Parser.
+_date_re = ('(?P<year>\d\d\d\d)'
+            '(?:(?P<dsep>-|)'
+            '(?:(?P<julian>\d\d\d)'
+            '|(?P<month>\d\d)(?:(?P=dsep)(?P<day>\d\d))?))?')
+_tzd_re = '(?P<tzd>[-+](?P<tzdhours>\d\d)(?::?(?P<tzdminutes>\d\d))|Z)'
+_time_re = ('(?P<hours>\d\d)(?P<tsep>:|)(?P<minutes>\d\d)'
+            '(?:(?P=tsep)(?P<seconds>\d\d(?:[.,]\d+)?))?'
+            + _tzd_re)
+_datetime_rx = re.compile('%s(?:T%s)?\\Z' % (_date_re, _time_re))
+
+
+def parse_w3cdtf(date_string):
+    """Return the naive UTC datetime for the W3CDTF `date_string`, or None if
+    it isn't a valid date.
+
+    ISO 8601's basic format (`20100901T120000Z`) and decimal commas in the
+    seconds are accepted too. Dates that don't exist, like February 30th,
+    are invalid rather than rolled over into the next month.
+
+    """
+    if not date_string:
+        return None
+    result = _cache.get(date_string, _cache)
+    if result is _cache:
+        result = _parse(date_string)
+        _cache[date_string] = result
+    return result
+
+
+def _parse(date_string):
+    m = _fast_rx.match(date_string)
+    if m is not None:
+        try:
+            return datetime.datetime(*[int(part) for part in m.groups()])
+        except ValueError:
+            return None
+
+    m = _datetime_rx.match(date_string)
+    if m is None:
+        return None
+
+    year = int(m.group('year'))
+    if year < 1000:
+        return None
+
+    julian = m.group('julian')
+    if julian:
+        date = datetime.date(year, 1, 1) + datetime.timedelta(days=int(julian) - 1)
+        month, day = date.month, date.day
+    else:
+        month = int(m.group('month') or 1)
+        day = int(m.group('day') or 1)
+
+    hours = minutes = seconds = 0
+    if m.group('hours'):
+        hours = int(m.group('hours'))
+        minutes = int(m.group('minutes'))
+        if m.group('seconds'):
+            seconds = int(float(m.group('seconds').replace(',', '.')))
+
+    try:
+        result = datetime.datetime(year, month, day, hours, minutes, seconds)
+    except ValueError:
+        return None
+
+    tzd = m.group('tzd')
+    if tzd and tzd != 'Z':
+        offset = datetime.timedelta(hours=int(m.group('tzdhours')),
+            minutes=int(m.group('tzdminutes') or 0))
+        if tzd[0] == '+':
+            result -= offset
+        else:
+            result += offset
+
+    return result
@@ -1,11 +1,7 @@
 
 
 from activitystreams import Activity, Object, MediaLink, ActionLink, Link
-
-
-import re
-import datetime
-import time
+from giraffe.aggregator.activitystreams.dates import parse_w3cdtf
 
 
 def make_activities_from_stream_dict(stream_dict):
@@ -48,7 +44,7 @@ def make_activity_from_activity_dict(activity_dict, implied_object=None):
 
     if "postedTime" in activity_dict:
         published_w3cdtf = activity_dict["postedTime"]
-        published_datetime = _parse_date_w3cdtf(published_w3cdtf)
+        published_datetime = parse_w3cdtf(published_w3cdtf)
 
     if "verb" in activity_dict:
         verb = activity_dict["verb"]
@@ -76,12 +72,6 @@ def make_object_from_object_dict(object_dict, implied_in_reply_to_object=None):
     url = None
     object_type = None
     in_reply_to_object = None
-    reply_objects = []
-    reaction_activities = []
-    attached_objects = []
-    upstream_duplicate_ids = []
-    downstream_duplicate_ids = []
-    links = []
 
     if "id" in object_dict:
         id = object_dict["id"]
@@ -111,12 +101,6 @@ def make_object_from_object_dict(object_dict, implied_in_reply_to_object=None):
         url=url,
         object_type=object_type,
         in_reply_to_object=in_reply_to_object,
-        reply_objects=reply_objects,
-        reaction_activities=reaction_activities,
-        attached_objects=attached_objects,
-        upstream_duplicate_ids=upstream_duplicate_ids,
-        downstream_duplicate_ids=downstream_duplicate_ids,
-        links=links,
         )
 
 
@@ -144,100 +128,3 @@ def make_media_link_from_media_link_dict(media_link_dict):
         height=height,
         duration=duration,
         )
-
-
-
-# This is pilfered from Universal Feed Parser.
-def _parse_date_w3cdtf(dateString):
-    def __extract_date(m):
-        year = int(m.group('year'))
-        if year < 100:
-            year = 100 * int(time.gmtime()[0] / 100) + int(year)
-        if year < 1000:
-            return 0, 0, 0
-        julian = m.group('julian')
-        if julian:
-            julian = int(julian)
-            month = julian / 30 + 1
-            day = julian % 30 + 1
-            jday = None
-            while jday != julian:
-                t = time.mktime((year, month, day, 0, 0, 0, 0, 0, 0))
-                jday = time.gmtime(t)[-2]
-                diff = abs(jday - julian)
-                if jday > julian:
-                    if diff < day:
-                        day = day - diff
-                    else:
-                        month = month - 1
-                        day = 31
-                elif jday < julian:
-                    if day + diff < 28:
-                       day = day + diff
-                    else:
-                        month = month + 1
-            return year, month, day
-        month = m.group('month')
-        day = 1
-        if month is None:
-            month = 1
-        else:
-            month = int(month)
-            day = m.group('day')
-            if day:
-                day = int(day)
-            else:
-                day = 1
-        return year, month, day
-
-    def __extract_time(m):
-        if not m:
-            return 0, 0, 0
-        hours = m.group('hours')
-        if not hours:
-            return 0, 0, 0
-        hours = int(hours)
-        minutes = int(m.group('minutes'))
-        seconds = m.group('seconds')
-        if seconds:
-            seconds = int(float(seconds))
-        else:
-            seconds = 0
-        return hours, minutes, seconds
-
-    def __extract_tzd(m):
-        '''Return the Time Zone Designator as an offset in seconds from UTC.'''
-        if not m:
-            return 0
-        tzd = m.group('tzd')
-        if not tzd:
-            return 0
-        if tzd == 'Z':
-            return 0
-        hours = int(m.group('tzdhours'))
-        minutes = m.group('tzdminutes')
-        if minutes:
-            minutes = int(minutes)
-        else:
-            minutes = 0
-        offset = (hours*60 + minutes) * 60
-        if tzd[0] == '+':
-            return -offset
-        return offset
-
-    __date_re = ('(?P<year>\d\d\d\d)'
-                 '(?:(?P<dsep>-|)'
-                 '(?:(?P<julian>\d\d\d)'
-                 '|(?P<month>\d\d)(?:(?P=dsep)(?P<day>\d\d))?))?')
-    __tzd_re = '(?P<tzd>[-+](?P<tzdhours>\d\d)(?::?(?P<tzdminutes>\d\d))|Z)'
-    __tzd_rx = re.compile(__tzd_re)
-    __time_re = ('(?P<hours>\d\d)(?P<tsep>:|)(?P<minutes>\d\d)'
-                 '(?:(?P=tsep)(?P<seconds>\d\d(?:[.,]\d+)?))?'
-                 + __tzd_re)
-    __datetime_re = '%s(?:T%s)?' % (__date_re, __time_re)
-    __datetime_rx = re.compile(__datetime_re)
-    m = __datetime_rx.match(dateString)
-    if (m is None) or (m.group() != dateString): return
-    gmt = __extract_date(m) + __extract_time(m) + (0, 0, 0)
-    if gmt[0] == 0: return
-    return datetime.datetime.utcfromtimestamp(time.mktime(gmt) + __extract_tzd(m) - time.timezone)
@@ -0,0 +1,114 @@
+from math import ceil, log
+import os
+import struct
+import tempfile
+import threading
+
+
+# The number of bits set in each possible byte.
+_BIT_COUNTS = [bin(i).count('1') for i in range(256)]
+
+
+class BloomFilter(object):
+
+    """A thread-safe set of hex digest strings that can say for sure that a
+    key was never added, but only that one probably was.
+
+    Keys are expected to be hex digests (like the SHA-1 `uniq_hash` of an
+    activity), so their bits are used directly as the filter's hash
+    functions. Filters can be saved to and loaded from files, and merged with
+    filters of the same shape.
+
+    """
+
+    HEADER = '!4sIIB'
+    MAGIC = 'GBF1'
+
+    def __init__(self, capacity=None, error_rate=0.001, bits=None, hashes=None):
+        if bits is None:
+            bits = int(ceil(-capacity * log(error_rate) / (log(2) ** 2)))
+            hashes = max(1, int(round(bits / float(capacity) * log(2))))
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+        # Whether every key that should be in the filter has been added, so
+        # keys it doesn't have can be trusted to be new.
+        self.primed = False
+        self.lock = threading.Lock()
+
+    def _positions(self, key):
+        # Double hashing: the i'th position is h1 + i * h2.
+        h1 = int(key[:16], 16)
+        h2 = int(key[16:32], 16) | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in xrange(self.hashes)]
+
+    def add(self, key):
+        array = self.array
+        self.lock.acquire()
+        try:
+            for position in self._positions(key):
+                array[position >> 3] |= 1 << (position & 7)
+        finally:
+            self.lock.release()
+
+    def __contains__(self, key):
+        array = self.array
+        for position in self._positions(key):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def fill_ratio(self):
+        return sum(_BIT_COUNTS[byte] for byte in self.array) / float(self.bits)
+
+    def error_rate(self):
+        """Return the current chance that a key that was never added is
+        reported as probably added."""
+        return self.fill_ratio() ** self.hashes
+
+    def merge(self, other):
+        """Add all the keys of `other`, a filter of the same shape."""
+        if (other.bits, other.hashes) != (self.bits, self.hashes):
+            raise ValueError("Can't merge Bloom filters of different shapes")
+        self.lock.acquire()
+        try:
+            array = self.array
+            for i, byte in enumerate(other.array):
+                if byte:
+                    array[i] |= byte
+            self.primed = self.primed or other.primed
+        finally:
+            self.lock.release()
+
+    @classmethod
+    def load(cls, path):
+        f = open(path, 'rb')
+        try:
+            header = f.read(struct.calcsize(cls.HEADER))
+            magic, bits, hashes, primed = struct.unpack(cls.HEADER, header)
+            if magic != cls.MAGIC:
+                raise ValueError("%s isn't a Bloom filter file" % path)
+            bloom = cls(bits=bits, hashes=hashes)
+            bloom.array = bytearray(f.read())
+            bloom.primed = bool(primed)
+        finally:
+            f.close()
+        if len(bloom.array) != (bits + 7) // 8:
+            raise ValueError("Bloom filter file %s is truncated" % path)
+        return bloom
+
+    def save(self, path):
+        """Write the filter to the file at `path`, replacing it atomically."""
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(struct.pack(self.HEADER, self.MAGIC, self.bits, self.hashes, self.primed))
+                f.write(str(self.array))
+            finally:
+                f.close()
+            os.rename(temp_path, path)
+        except:
+            os.unlink(temp_path)
+            raise
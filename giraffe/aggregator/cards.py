@@ -0,0 +1,95 @@
+"""
+Rendered activity cards, cached by activity.
+
+Activities don't change once they're ingested, so the HTML of each card on
+the activity stream is kept in Django's cache, keyed by the activity's
+`uniq_hash` and the version of the card template. Ingest forgets the cards
+of activities whose objects it updates.
+
+The rotation of actor images is picked per request, so cards are rendered
+with `ROTATION_MARKER` in its place, and the `rotate` template filter fills
+in fresh angles as the page is rendered.
+
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.template import Context
+
+from giraffe.aggregator import keys, models
+from giraffe.aggregator.context_processors import ROTATION_MARKER
+from giraffe.aggregator.loaders import Loader
+
+
+log = logging.getLogger(__name__)
+
+CARD_TEMPLATE = 'aggregator/bits/activity.html'
+
+_template_version = None
+
+
+def template_version():
+    """Return a short hash of the card template's source, so changing the
+    template stops old cards from being used."""
+    global _template_version
+    if _template_version is None:
+        source = Loader.env.loader.get_source(Loader.env, CARD_TEMPLATE)[0]
+        _template_version = keys.sha1_hex(source)[:8]
+    return _template_version
+
+
+def card_key(uniq_hash):
+    return 'aggregator:card:%s:%s' % (template_version(), uniq_hash)
+
+
+def cache_timeout():
+    return getattr(settings, 'AGGREGATOR_CARD_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+
+def _rotations():
+    while True:
+        yield ROTATION_MARKER
+
+
+def get_cached(activities):
+    """Return the cached cards of `activities`, as a dict of HTML keyed by
+    uniq_hash. Activities whose cards aren't cached are left out."""
+    keys = dict((card_key(activity.uniq_hash), activity.uniq_hash) for activity in activities)
+    found = cache.get_many(keys.keys())
+    log.debug("Found %d of %d activity cards in the cache", len(found), len(keys))
+    return dict((keys[key], html) for key, html in found.iteritems())
+
+
+def render(activities):
+    """Render and cache the cards of `activities`, returning them as a dict
+    of HTML keyed by uniq_hash."""
+    template = Loader.env.get_template(CARD_TEMPLATE)
+    cards = {}
+    for activity in activities:
+        cards[activity.uniq_hash] = template.render(Context({
+            'activity': activity,
+            'rot': _rotations(),
+        }))
+
+    if cards:
+        cache.set_many(dict((card_key(hash), html) for hash, html in cards.iteritems()),
+            cache_timeout())
+    return cards
+
+
+def forget_objects(object_ids):
+    """Drop the cached cards of all activities that refer to any of the
+    `Object` rows with the given ids."""
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+
+    hashes = models.Activity.objects.filter(Q(actor__in=object_ids)
+        | Q(object__in=object_ids) | Q(target__in=object_ids)).values_list('uniq_hash', flat=True)
+    card_keys = [card_key(keys.hex_digest(hash)) for hash in hashes]
+    log.debug("Forgetting %d activity cards", len(card_keys))
+    if card_keys:
+        cache.delete_many(card_keys)
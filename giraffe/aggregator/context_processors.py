@@ -1,6 +1,11 @@
 import random
 
 
+# Stands in for a rotation in cached HTML. NUL can't appear in XML, so it
+# can't turn up in any ingested text.
+ROTATION_MARKER = u'\x00rotation\x00'
+
+
 def random_rotation():
     while True:
         yield random.gauss(0, 3)
@@ -8,3 +13,16 @@ def random_rotation():
 
 def random_rotator(request):
     return { 'rot': random_rotation() }
+
+
+def rotate(html, rotations):
+    """Replace each rotation marker in `html` with the next angle from
+    `rotations`."""
+    parts = html.split(ROTATION_MARKER)
+    if len(parts) == 1:
+        return html
+    rotated = [parts[0]]
+    for part in parts[1:]:
+        rotated.append(unicode(rotations.next()))
+        rotated.append(part)
+    return u''.join(rotated)
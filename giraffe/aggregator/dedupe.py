@@ -0,0 +1,124 @@
+"""
+Merges activities that were stored more than once.
+
+Before every path identified activities with `models.activity_key`, the same
+activity could be stored with different `uniq_hash`es, depending on whether
+its verb kept the activitystrea.ms prefix, how its time was stored, and so
+on. `merge_duplicates` works out the canonical hash of every stored
+activity, keeps the oldest activity with each hash, moves the timeline
+entries of the others onto it and deletes them.
+
+"""
+
+import logging
+
+from django.db import transaction
+
+from giraffe.aggregator import models
+from giraffe.aggregator.keys import hex_digest
+
+
+log = logging.getLogger(__name__)
+
+FIELDS = ('id', 'uniq_hash', 'verb', 'time', 'actor__foreign_id', 'object__foreign_id',
+    'target__foreign_id')
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def find_misfiled(chunk_size=1000):
+    """Return a dict mapping the id of every activity whose stored
+    `uniq_hash` isn't its canonical one to its canonical hash."""
+    misfiled = {}
+    last_id = 0
+    while True:
+        chunk = models.Activity.objects.filter(id__gt=last_id).order_by('id')
+        chunk = list(chunk.values_list(*FIELDS)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        for id, hash, verb, time, actor_id, object_id, target_id in chunk:
+            canonical = models.activity_hash(models.activity_key(verb, time, actor_id, object_id, target_id))
+            if canonical != hex_digest(hash):
+                misfiled[id] = canonical
+    return misfiled
+
+
+def group_duplicates(misfiled, chunk_size=500):
+    """Return a dict mapping each canonical hash in `misfiled` to the ids of
+    all the activities that should have it, including any that already
+    do."""
+    groups = {}
+    for id, hash in misfiled.iteritems():
+        groups.setdefault(hash, []).append(id)
+    for hashes in _chunks(groups.keys(), chunk_size):
+        for hash, id in models.Activity.objects.filter(uniq_hash__in=hashes).values_list('uniq_hash', 'id'):
+            groups[hex_digest(hash)].append(id)
+    return groups
+
+
+def _move_timeline_entries(keeper_of, chunk_size):
+    """Point the timeline entries of the duplicate activities in `keeper_of`
+    at the activities they're kept as, dropping any the user already has."""
+    keepers = set(keeper_of.itervalues())
+    had = set()
+    for ids in _chunks(keepers, chunk_size):
+        had.update(models.TimelineEntry.objects.filter(activity__in=ids).values_list('user', 'activity'))
+
+    moves, drops = {}, []
+    for ids in _chunks(keeper_of.keys(), chunk_size):
+        entries = models.TimelineEntry.objects.filter(activity__in=ids).values_list('id', 'user', 'activity')
+        for entry_id, user_id, activity_id in entries:
+            keeper = keeper_of[activity_id]
+            if (user_id, keeper) in had:
+                drops.append(entry_id)
+            else:
+                had.add((user_id, keeper))
+                moves.setdefault(keeper, []).append(entry_id)
+
+    for ids in _chunks(drops, chunk_size):
+        models.TimelineEntry.objects.filter(id__in=ids).delete()
+    for keeper, entry_ids in moves.iteritems():
+        for ids in _chunks(entry_ids, chunk_size):
+            models.TimelineEntry.objects.filter(id__in=ids).update(activity=keeper)
+
+
+@transaction.commit_on_success
+def merge_duplicates(chunk_size=500, dry_run=False):
+    """Give every activity its canonical `uniq_hash`, merging activities
+    that turn out to be the same.
+
+    Returns a `(rehashed, merged)` pair: the number of activities that kept
+    their row but got a new hash, and the number deleted as duplicates.
+
+    """
+    misfiled = find_misfiled()
+    groups = group_duplicates(misfiled, chunk_size)
+
+    keeper_of = {}
+    rehash = {}
+    for hash, ids in groups.iteritems():
+        keeper = min(ids)
+        for id in ids:
+            if id != keeper:
+                keeper_of[id] = keeper
+        if keeper in misfiled:
+            rehash[keeper] = hash
+
+    log.debug("Found %d activities to rehash and %d to merge", len(rehash), len(keeper_of))
+    if dry_run:
+        return len(rehash), len(keeper_of)
+
+    _move_timeline_entries(keeper_of, chunk_size)
+    for ids in _chunks(keeper_of.keys(), chunk_size):
+        models.Activity.objects.filter(id__in=ids).delete()
+    # Only now are the canonical hashes free to use.
+    for id, hash in rehash.iteritems():
+        models.Activity.objects.filter(id=id).update(uniq_hash=hash)
+
+    return len(rehash), len(keeper_of)
@@ -0,0 +1,70 @@
+"""
+Finding the PubSubHubbub hub of a feed.
+
+The hub is advertised with an `atom:link rel="hub"` in the feed header, so
+discovery stops parsing at the first entry unless the entries are wanted
+too. Feeds on the same host nearly always share a hub, so discovered hub
+URLs are cached per host for `AGGREGATOR_HUB_CACHE_TIMEOUT` seconds.
+Feeds that don't name a hub use `AGGREGATOR_DEFAULT_HUB`.
+
+"""
+
+import logging
+from urlparse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+
+import giraffe.aggregator.activitystreams.atom as as_atom
+
+
+log = logging.getLogger(__name__)
+
+
+def default_hub():
+    return getattr(settings, 'AGGREGATOR_DEFAULT_HUB', 'http://pubsubhubbub.appspot.com/')
+
+
+def hub_cache_key(feed_url):
+    return 'aggregator:hub:%s' % urlsplit(feed_url)[1].lower()
+
+
+def cached_hub(feed_url):
+    """Return the hub last discovered for a feed on the same host as
+    `feed_url`, or None if there isn't one cached."""
+    return cache.get(hub_cache_key(feed_url))
+
+
+def remember_hub(feed_url, hub_url):
+    timeout = getattr(settings, 'AGGREGATOR_HUB_CACHE_TIMEOUT', 24 * 60 * 60)
+    cache.set(hub_cache_key(feed_url), hub_url, timeout)
+
+
+def find_hub_link(feed_elem):
+    for link_elem in feed_elem.findall(as_atom.ATOM_LINK):
+        if link_elem.get('rel') == 'hub' and link_elem.get('href'):
+            return link_elem.get('href')
+    return None
+
+
+def read_feed(source, with_activities=True):
+    """Read the hub URL and, if `with_activities` is true, the activities
+    from the Atom feed read from the file-like `source`.
+
+    Returns a `(hub_url, as_activities)` pair. `hub_url` is None if the
+    feed doesn't name a hub. Without `with_activities`, parsing stops at the
+    first entry and `as_activities` is empty.
+
+    """
+    hubs = []
+
+    def on_header(feed_elem):
+        hubs.append(find_hub_link(feed_elem))
+        return not with_activities
+
+    as_activities = []
+    for entry_elem, feed_elem in as_atom.iterparse_feed(source, on_header):
+        as_activities.extend(as_atom.make_activities_from_entry(entry_elem, feed_elem))
+
+    hub_url = hubs[0] if hubs else None
+    return hub_url, as_activities
@@ -0,0 +1,437 @@
+"""
+The pipeline that turns activity stream feeds into `Activity` rows.
+
+Both the PuSH callback and feed polling ingest through here. Ingest runs in
+stages, in order:
+
+ * `parse` reads activitystreams activities from an Atom feed,
+ * `normalise` cleans up the parsed verbs and object types,
+ * `resolve_objects` loads, creates or updates the `Object` rows the
+   activities refer to, and
+ * `upsert_activities` creates or updates the `Activity` rows.
+
+`ingest_feed` runs all the stages. The time spent in each stage is added up
+in `stage_timings`. If the seen filter is on (see `giraffe.aggregator.seen`),
+activities that were probably already stored just as they are get dropped
+after normalising.
+
+"""
+
+from functools import wraps
+import logging
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import signals
+
+from giraffe.aggregator import cards, keys, models, seen, timeline
+from giraffe.aggregator.lru import LRUCache
+import giraffe.aggregator.activitystreams.atom as as_atom
+
+
+log = logging.getLogger(__name__)
+
+# Maps each stage name to a [calls, total seconds] pair.
+stage_timings = {}
+
+
+def timed(stage):
+    def decorator(func):
+        timing = stage_timings.setdefault(stage, [0, 0.0])
+
+        @wraps(func)
+        def timed_func(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                timing[0] += 1
+                timing[1] += elapsed
+                log.debug("Ingest stage %s took %.1fms", stage, elapsed * 1000)
+        return timed_func
+    return decorator
+
+
+def reset_stage_timings():
+    for timing in stage_timings.itervalues():
+        timing[:] = [0, 0.0]
+
+
+def ingest_feed(source, subscription):
+    """Ingest the Atom feed read from the file-like `source` as activities of
+    `subscription`.
+
+    Returns the number of activities that were new to us.
+
+    """
+    return ingest_activities(parse(source), subscription)
+
+
+def ingest_activities(as_activities, subscription, also=None):
+    """Store `as_activities` as activities of `subscription`, returning the
+    number that were new to us. If given, `also` is called in the same
+    transaction the activities are stored in."""
+    normalise(as_activities)
+
+    # Activities have to have a time to be stored.
+    undated = [as_activity for as_activity in as_activities if as_activity.time is None]
+    if undated:
+        log.warning("Skipping %d activities with no time for subscription %r",
+            len(undated), subscription.pk)
+        as_activities = [as_activity for as_activity in as_activities if as_activity.time is not None]
+
+    seen_keys = None
+    if seen.enabled():
+        # Leave out the activities we've probably stored just as they are.
+        seen_keys = seen.keys(as_activities, subscription, object_values)
+        changed = [i for i, key in enumerate(seen_keys) if not seen.probably_unchanged(key)]
+        as_activities = [as_activities[i] for i in changed]
+        seen_keys = [seen_keys[i] for i in changed]
+
+    identity_map = IdentityMap()
+    try:
+        created = _store_activities(as_activities, subscription, identity_map, also)
+    except IntegrityError:
+        if not identity_map.cached:
+            raise
+        # Another process may have deleted objects we had cached since we
+        # checked them, so look them up and try again.
+        log.info("Objects in the object cache were stale; storing activities for subscription %r again",
+            subscription.pk)
+        for key in identity_map.cached:
+            object_cache.pop(key)
+        identity_map = IdentityMap()
+        created = _store_activities(as_activities, subscription, identity_map, also)
+    # Only remember the objects once they're safely committed.
+    identity_map.remember()
+    cards.forget_objects(identity_map.updated)
+    if seen_keys is not None:
+        seen.remember(seen_keys)
+    return created
+
+
+@transaction.commit_on_success
+def _store_activities(as_activities, subscription, identity_map, also=None):
+    created = 0
+    if as_activities:
+        for as_activity in as_activities:
+            identity_map.add(as_activity.object)
+            identity_map.add(as_activity.actor)
+            identity_map.add(as_activity.target)
+        resolve_objects(identity_map)
+
+        created = upsert_activities(as_activities, identity_map.resolve, subscription)
+
+    if also is not None:
+        also()
+    return created
+
+
+@timed('parse')
+def parse(source):
+    return list(as_atom.iter_activities_from_feed(source))
+
+
+def _strip_schema_prefix(value):
+    if value is None:
+        return ''
+    return value.replace(models.AS_SCHEMA_PREFIX, "", 1)
+
+
+def _normalise_object(as_object):
+    while as_object is not None:
+        as_object.object_type = _strip_schema_prefix(as_object.object_type)
+        as_object = as_object.in_reply_to_object
+
+
+@timed('normalise')
+def normalise(as_activities):
+    """Strip the activitystrea.ms schema prefix from the verbs and object
+    types of `as_activities` in place, using '' for missing ones, and put
+    their times in the form they're identified by."""
+    for as_activity in as_activities:
+        as_activity.verb = models.canonical_verb(as_activity.verb)
+        if as_activity.time is not None:
+            as_activity.time = models.canonical_time(as_activity.time)
+        _normalise_object(as_activity.object)
+        _normalise_object(as_activity.actor)
+        _normalise_object(as_activity.target)
+
+
+def _update_fields(instance, values):
+    changed = False
+    for field, value in values.iteritems():
+        if getattr(instance, field) != value:
+            setattr(instance, field, value)
+            changed = True
+    return changed
+
+
+def object_values(as_object):
+    values = {
+        'foreign_id': as_object.id,
+        'name': as_object.name,
+        'permalink_url': as_object.url,
+        'summary': as_object.summary,
+        'object_type': as_object.object_type,
+    }
+
+    if as_object.image is not None:
+        values['image_url'] = as_object.image.url
+        values['image_width'] = as_object.image.width
+        values['image_height'] = as_object.image.height
+
+    return values
+
+
+class IdentityMap(object):
+
+    """The activitystreams objects seen during one ingest and the `Object`
+    rows they resolve to.
+
+    Objects are keyed by the hash of their foreign ID, so an actor that turns
+    up in every entry of a feed is only looked up and saved once. Anonymous
+    objects have no foreign ID, so they're keyed by their own identity.
+
+    """
+
+    def __init__(self):
+        self.as_objects = {}
+        self.objects = {}
+        self.hashes = {}
+        # Ids of the existing objects that were changed.
+        self.updated = set()
+        # Keys of the objects that were found in the object cache.
+        self.cached = set()
+
+    def key(self, as_object):
+        foreign_id = as_object.id
+        if not foreign_id:
+            return id(as_object)
+        try:
+            return self.hashes[foreign_id]
+        except KeyError:
+            hash = self.hashes[foreign_id] = keys.sha1_hex(foreign_id)
+            return hash
+
+    def add(self, as_object):
+        while as_object is not None:
+            # Later copies of the same object win, as they would if we saved
+            # them one at a time.
+            self.as_objects[self.key(as_object)] = as_object
+            as_object = as_object.in_reply_to_object
+
+    def resolve(self, as_object):
+        if as_object is None:
+            return None
+        return self.objects[self.key(as_object)]
+
+    def remember(self):
+        """Save the rows of the resolved objects in the object cache."""
+        if not object_cache.size:
+            return
+        for key, object in self.objects.iteritems():
+            if isinstance(key, basestring):
+                object_cache[key] = _object_row(object)
+
+
+# Rows of recently ingested objects, keyed by foreign_id_hash, so feeds that
+# keep mentioning the same objects don't have to look them up every time.
+# Set AGGREGATOR_OBJECT_CACHE_SIZE to enable it.
+#
+# Each process has its own cache, so rows are forgotten whenever this process
+# saves or deletes an object. Other processes may delete or replace rows we
+# have cached, so resolve_objects checks that every cached row it uses is
+# still stored under the same id before trusting it.
+object_cache = LRUCache(getattr(settings, 'AGGREGATOR_OBJECT_CACHE_SIZE', 0))
+
+
+def forget_object(sender, instance, **kwargs):
+    if instance.foreign_id_hash is not None:
+        object_cache.pop(instance.foreign_id_hash)
+
+signals.post_save.connect(forget_object, sender=models.Object)
+signals.post_delete.connect(forget_object, sender=models.Object)
+
+
+def _object_row(object):
+    return dict((field.attname, getattr(object, field.attname))
+        for field in object._meta.fields)
+
+
+@timed('resolve_objects')
+def resolve_objects(identity_map):
+    """Load, create or update the `Object` rows for all the objects in
+    `identity_map` in a constant number of lookups.
+
+    New rows are inserted together (see `models.bulk_insert`), but
+    anonymous objects and existing rows that changed are still saved one
+    at a time.
+
+    """
+    objects = identity_map.objects
+
+    keyed, anonymous = {}, {}
+    for key, as_object in identity_map.as_objects.iteritems():
+        if isinstance(key, basestring):
+            keyed[key] = as_object
+        else:
+            anonymous[key] = as_object
+
+    unknown, cached_rows = [], {}
+    for hash in keyed:
+        row = object_cache.get(hash)
+        if row is None:
+            unknown.append(hash)
+        else:
+            cached_rows[hash] = row
+    if cached_rows:
+        # Only trust cached rows that are still stored under the same id.
+        ids = [row['id'] for row in cached_rows.itervalues()]
+        stored = dict((id, keys.hex_digest(hash)) for id, hash
+            in models.Object.objects.filter(id__in=ids).values_list('id', 'foreign_id_hash'))
+        for hash, row in cached_rows.iteritems():
+            if stored.get(row['id']) == hash:
+                objects[hash] = models.Object(**row)
+                identity_map.cached.add(hash)
+            else:
+                object_cache.pop(hash)
+                unknown.append(hash)
+    if unknown:
+        for object in models.Object.objects.filter(foreign_id_hash__in=unknown):
+            objects[object.foreign_id_hash] = object
+    log.debug("Found %d of %d objects in the object cache",
+        len(keyed) - len(unknown), len(keyed))
+
+    new_keyed, new_anonymous, dirty = [], [], set()
+    for hash, as_object in keyed.iteritems():
+        object = objects.get(hash)
+        if object is None:
+            object = objects[hash] = models.Object()
+            new_keyed.append(object)
+            _update_fields(object, object_values(as_object))
+        elif _update_fields(object, object_values(as_object)):
+            dirty.add(object)
+
+    for key, as_object in anonymous.iteritems():
+        object = objects[key] = models.Object()
+        new_anonymous.append(object)
+        _update_fields(object, object_values(as_object))
+
+    for object in new_keyed + new_anonymous:
+        object.fill_derived_fields()
+
+    if new_keyed:
+        models.bulk_insert(models.Object, new_keyed)
+        if new_keyed[0].pk is None:
+            # bulk_create doesn't tell us the new rows' ids, so go get them.
+            hashes = [object.foreign_id_hash for object in new_keyed]
+            for id, hash in models.Object.objects.filter(foreign_id_hash__in=hashes).values_list('id', 'foreign_id_hash'):
+                objects[keys.hex_digest(hash)].id = id
+    # We can't find anonymous objects again after a bulk insert.
+    for object in new_anonymous:
+        object.save()
+
+    for key, as_object in identity_map.as_objects.iteritems():
+        if as_object.in_reply_to_object is None:
+            continue
+        object = objects[key]
+        in_reply_to = identity_map.resolve(as_object.in_reply_to_object)
+        if object.in_reply_to_id != in_reply_to.id:
+            object.in_reply_to = in_reply_to
+            dirty.add(object)
+
+    for object in dirty:
+        object.save()
+    identity_map.updated.update(object.id for object in dirty)
+
+
+@timed('upsert_activities')
+def upsert_activities(as_activities, resolve, subscription, trust_seen=True):
+    """Save `as_activities` as `Activity` rows for `subscription`, using
+    `resolve` to find their objects.
+
+    Activities the seen filter knows are new are inserted without looking
+    for them first, unless `trust_seen` is false.
+
+    Returns the number of activities that were created.
+
+    """
+    activities = {}
+    for as_activity in as_activities:
+        activity = models.Activity(
+            verb=as_activity.verb,
+            time=as_activity.time,
+            actor=resolve(as_activity.actor),
+            object=resolve(as_activity.object),
+            target=resolve(as_activity.target),
+            subscription=subscription,
+            user=subscription.user,
+        )
+        activity.uniq_hash = activity.make_uniq_hash()
+        activities[activity.uniq_hash] = activity
+
+    if not activities:
+        return 0
+
+    # Don't look for activities the seen filter knows are new.
+    trusted_new = set()
+    if trust_seen and seen.enabled():
+        trusted_new = seen.definitely_new(activities.keys())
+
+    new = []
+    existing = {}
+    unknown = [hash for hash in activities if hash not in trusted_new]
+    if unknown:
+        existing = models.Activity.objects.filter(uniq_hash__in=unknown)
+        existing = dict((activity.uniq_hash, activity) for activity in existing)
+    for hash, activity in activities.iteritems():
+        old = existing.get(hash)
+        if old is None:
+            new.append(activity)
+            continue
+
+        changed = _update_fields(old, {
+            'verb': activity.verb,
+            'time': activity.time,
+            'actor_id': activity.actor_id,
+            'object_id': activity.object_id,
+            'target_id': activity.target_id,
+            'subscription_id': activity.subscription_id,
+            'user_id': activity.user_id,
+        })
+        if changed:
+            log.debug("Updating activity %r", old.id)
+            old.save()
+
+    log.debug("Making %d new activities", len(new))
+    if seen.enabled():
+        seen.count_false_positives(activity.uniq_hash for activity in new
+            if activity.uniq_hash not in trusted_new)
+    if trusted_new:
+        seen.stats['trusted_new'] += len(trusted_new)
+        savepoint = transaction.savepoint()
+        try:
+            models.bulk_insert(models.Activity, new)
+        except IntegrityError:
+            # Another process stored some of them since our filter last
+            # heard from it, so look them up after all.
+            transaction.savepoint_rollback(savepoint)
+            seen.stats['collisions'] += 1
+            log.debug("Trusted new activities were already stored; looking them up")
+            return upsert_activities(as_activities, resolve, subscription, trust_seen=False)
+        transaction.savepoint_commit(savepoint)
+    else:
+        models.bulk_insert(models.Activity, new)
+    if new and new[0].pk is None:
+        hashes = [activity.uniq_hash for activity in new]
+        ids = dict((keys.hex_digest(hash), id) for hash, id
+            in models.Activity.objects.filter(uniq_hash__in=hashes).values_list('uniq_hash', 'id'))
+        for activity in new:
+            activity.id = ids[activity.uniq_hash]
+
+    timeline.fan_out(new, subscription)
+
+    return len(new)
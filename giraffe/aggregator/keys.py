@@ -0,0 +1,100 @@
+"""
+The hashes the aggregator identifies subscriptions, objects and activities
+by.
+
+`sha1_hex` makes them. They're stored in `HashField` columns: 40 character
+hex strings by default, or the 20 raw bytes of the digest if
+`AGGREGATOR_BINARY_KEYS` is on, which halves the size of their unique
+indexes. Code always sees hex strings either way, except in the results of
+`values()` and `values_list()`, which should go through `hex_digest`.
+
+Choose `AGGREGATOR_BINARY_KEYS` before running migration 0010, which
+converts the columns. To change it later, migrate back to 0009, change the
+setting and migrate forward again.
+
+"""
+
+import binascii
+import hashlib
+
+from django.conf import settings
+from django.db import models
+from django.utils.importlib import import_module
+
+
+DIGEST_SIZE = 20
+
+
+def sha1_hex(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    m = hashlib.sha1()
+    m.update(s)
+    return m.hexdigest()
+
+
+def binary_keys():
+    return getattr(settings, 'AGGREGATOR_BINARY_KEYS', False)
+
+
+def hex_digest(value):
+    """Return the hex form of a hash read from the database, which is raw
+    bytes if it came from a binary column."""
+    if value is None or isinstance(value, unicode):
+        return value
+    value = str(value)
+    if len(value) == DIGEST_SIZE:
+        return binascii.hexlify(value)
+    return value
+
+
+def to_binary(value, connection):
+    """Return the hex digest `value` as raw bytes the database driver of
+    `connection` will store as binary."""
+    database = import_module(connection.settings_dict['ENGINE'] + '.base').Database
+    return database.Binary(binascii.unhexlify(value))
+
+
+class BinaryHashField(models.Field):
+
+    """A hex digest stored as its raw bytes."""
+
+    __metaclass__ = models.SubfieldBase
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', DIGEST_SIZE)
+        super(BinaryHashField, self).__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        engine = connection.settings_dict['ENGINE']
+        if 'postgresql' in engine:
+            return 'bytea'
+        if 'mysql' in engine:
+            return 'binary(%d)' % self.max_length
+        if 'oracle' in engine:
+            return 'raw(%d)' % self.max_length
+        return 'blob'
+
+    def to_python(self, value):
+        return hex_digest(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        return to_binary(value, connection)
+
+
+def HashField(**kwargs):
+    """Return a field for a `sha1_hex` hash, stored as configured by
+    `AGGREGATOR_BINARY_KEYS`."""
+    if binary_keys():
+        return BinaryHashField(**kwargs)
+    return models.CharField(max_length=40, **kwargs)
+
+
+try:
+    from south.modelsinspector import add_introspection_rules
+except ImportError:
+    pass
+else:
+    add_introspection_rules([], [r"^giraffe\.aggregator\.keys\.BinaryHashField"])
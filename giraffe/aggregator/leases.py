@@ -0,0 +1,166 @@
+"""
+Keeps the PubSubHubbub leases of push-mode subscriptions from running out.
+
+When a hub verifies a subscription it may grant a lease of
+`hub.lease_seconds`. We note when the lease expires and pick a time to renew
+it, at random within the last `AGGREGATOR_LEASE_RENEW_WINDOW` seconds of the
+lease, so subscriptions verified together don't all come up for renewal
+together.
+
+`dispatch_due_renewals` is run periodically to hand the subscriptions that
+are due off to `tasks.renew_leases` in batches. Each batch asks the hubs to
+renew with a bounded pool of threads, one per hub host at a time.
+
+"""
+
+from datetime import datetime, timedelta
+import logging
+import random
+import socket
+from urllib import urlencode
+from urlparse import urljoin, urlsplit
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse
+import httplib2
+
+from giraffe.aggregator import discovery, models, tasks
+from giraffe.aggregator.pool import run_in_pool
+
+
+log = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def callback_url(sub_pk):
+    callback_root = 'http://%s/' % Site.objects.get_current().domain
+    return urljoin(callback_root, reverse('aggregator-callback', kwargs={"sub_pk": sub_pk}))
+
+
+def request_subscription(http, hub_url, topic_url, sub_pk):
+    """Ask the hub at `hub_url` to (re)subscribe us to `topic_url`.
+
+    Returns whether the hub accepted the request. The subscription isn't
+    confirmed until the hub verifies it through the callback.
+
+    """
+    subreq = {
+        'hub.callback': callback_url(sub_pk),
+        'hub.mode': 'subscribe',
+        'hub.topic': topic_url,
+        'hub.verify': 'async',
+    }
+    resp, cont = http.request(uri=hub_url, method='POST', body=urlencode(subreq),
+        headers={'Content-Type': 'application/x-www-form-urlencoded'})
+
+    if resp.status not in (202, 204):
+        log.warning('HTTP response %d %s trying to request subscription to feed %s from hub %s',
+            resp.status, resp.reason, topic_url, hub_url)
+        return False
+    return True
+
+
+def renewal_time(lease_seconds, now):
+    window = min(_setting('AGGREGATOR_LEASE_RENEW_WINDOW', 86400), lease_seconds / 2)
+    return now + timedelta(seconds=lease_seconds - random.uniform(0, window))
+
+
+def record_lease(subscription, lease_seconds, now=None):
+    """Note the lease a hub granted `subscription` on verification, and
+    when to renew it. Doesn't save the subscription."""
+    if now is None:
+        now = datetime.now()
+
+    try:
+        lease_seconds = int(lease_seconds)
+    except (TypeError, ValueError):
+        lease_seconds = None
+
+    if lease_seconds is None or lease_seconds <= 0:
+        # The lease doesn't run out (or the hub didn't say when it does).
+        subscription.lease_expires = None
+        subscription.next_renewal = None
+        return
+
+    subscription.lease_expires = now + timedelta(seconds=lease_seconds)
+    subscription.next_renewal = renewal_time(lease_seconds, now)
+
+
+def dispatch_due_renewals(now=None):
+    """Enqueue lease renewals for the push-mode subscriptions that are due.
+
+    Returns the number of subscriptions dispatched.
+
+    """
+    if now is None:
+        now = datetime.now()
+    limit = _setting('AGGREGATOR_LEASE_DISPATCH_LIMIT', 1000)
+    batch_size = _setting('AGGREGATOR_LEASE_BATCH_SIZE', 50)
+    spread = _setting('AGGREGATOR_LEASE_DISPATCH_EVERY', 3600)
+
+    due = models.Subscription.objects.filter(mode='push', next_renewal__lte=now)
+    sub_pks = list(due.order_by('next_renewal').values_list('pk', flat=True)[:limit])
+    if not sub_pks:
+        return 0
+
+    # If the hub doesn't verify the renewal by then, try again. Verification
+    # sets the next renewal properly.
+    retry_at = now + timedelta(seconds=_setting('AGGREGATOR_LEASE_RENEW_RETRY', 3600))
+    models.Subscription.objects.filter(pk__in=sub_pks).update(next_renewal=retry_at)
+
+    # Spread the batches out until the next dispatch, rather than sending
+    # them all at once.
+    batches = range(0, len(sub_pks), batch_size)
+    for n, i in enumerate(batches):
+        countdown = spread * n / len(batches)
+        tasks.renew_leases.apply_async(args=[sub_pks[i:i + batch_size]], countdown=countdown)
+
+    log.debug("Dispatched lease renewals for %d subscriptions", len(sub_pks))
+    return len(sub_pks)
+
+
+def renew_leases(subscriptions, workers=None):
+    """Ask the hubs of the given subscriptions to renew their leases.
+
+    Returns a dict mapping each subscription's pk to whether its hub accepted
+    the request, or None if the request failed outright.
+
+    """
+    if workers is None:
+        workers = _setting('AGGREGATOR_LEASE_RENEW_WORKERS', 10)
+
+    by_host = {}
+    for subscription in subscriptions:
+        if not subscription.hub_url:
+            # Subscribed before hubs were recorded: use the hub we'd pick now,
+            # and keep it so later renewals don't have to.
+            hub_url = discovery.cached_hub(subscription.topic_url) or discovery.default_hub()
+            log.info("Renewing subscription %r with hub %s", subscription.pk, hub_url)
+            models.Subscription.objects.filter(pk=subscription.pk).update(hub_url=hub_url)
+            subscription.hub_url = hub_url
+        host = urlsplit(subscription.hub_url)[1].lower()
+        by_host.setdefault(host, []).append(subscription)
+
+    results = {}
+    for host_results in run_in_pool(renew_host, by_host.values(), workers):
+        if host_results is not None:
+            results.update(host_results)
+    return results
+
+
+def renew_host(subscriptions):
+    http = httplib2.Http(timeout=_setting('AGGREGATOR_LEASE_RENEW_TIMEOUT', 30))
+    results = {}
+    for subscription in subscriptions:
+        try:
+            results[subscription.pk] = request_subscription(http, subscription.hub_url,
+                subscription.topic_url, subscription.pk)
+        except (socket.error, httplib2.HttpLib2Error), exc:
+            log.warning('%s trying to renew subscription to feed %s with hub %s: %s',
+                type(exc).__name__, subscription.topic_url, subscription.hub_url, str(exc))
+            results[subscription.pk] = None
+    return results
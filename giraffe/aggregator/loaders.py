@@ -6,6 +6,10 @@ Use:
  * <input type="hidden" name="csrfmiddlewaretoken" value="{{ csrf_token }}">
    instead of {% csrf_token %}.
 
+Compiled templates are kept in AGGREGATOR_JINJA_BYTECODE_CACHE_DIR if it's
+set, so new processes don't have to compile them again; the
+precompiletemplates command fills it in ahead of time.
+
 """
 
 from django.template.loader import BaseLoader
@@ -15,6 +19,8 @@ from django.core import urlresolvers
 from django.conf import settings
 import jinja2
 
+from giraffe.aggregator.context_processors import rotate
+
 
 class Template(jinja2.Template):
     def render(self, context):
@@ -25,16 +31,27 @@ class Template(jinja2.Template):
         return super(Template, self).render(context_dict)
 
 
+def make_bytecode_cache():
+    directory = getattr(settings, 'AGGREGATOR_JINJA_BYTECODE_CACHE_DIR', None)
+    if not directory:
+        return None
+    return jinja2.FileSystemBytecodeCache(directory)
+
+
 class Loader(BaseLoader):
     is_usable = True
 
-    env = jinja2.Environment(loader=jinja2.FileSystemLoader(app_template_dirs))
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(app_template_dirs),
+        bytecode_cache=make_bytecode_cache(),
+        auto_reload=getattr(settings, 'AGGREGATOR_JINJA_AUTO_RELOAD', True))
     env.template_class = Template
 
     # These are available to all templates.
     env.globals['url_for'] = urlresolvers.reverse
     env.globals['MEDIA_URL'] = settings.MEDIA_URL
 
+    env.filters['rotate'] = rotate
+
     def load_template(self, template_name, template_dirs=None):
         if not template_name.startswith('aggregator/'):
             raise TemplateDoesNotExist(template_name)
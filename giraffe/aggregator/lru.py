@@ -0,0 +1,88 @@
+import threading
+
+
+class LRUCache(object):
+
+    """A thread-safe dict-like cache holding at most `size` items, which
+    forgets the least recently used item when it's full."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.map = {}
+            # A circular doubly linked list of [prev, next, key, value] links,
+            # most recently used first.
+            self.root = root = []
+            root[:] = [root, root, None, None]
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.map)
+
+    def __contains__(self, key):
+        return key in self.map
+
+    def get(self, key, default=None):
+        self.lock.acquire()
+        try:
+            link = self.map.get(key)
+            if link is None:
+                return default
+            self._move_to_front(link)
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def __setitem__(self, key, value):
+        if self.size <= 0:
+            return
+        self.lock.acquire()
+        try:
+            link = self.map.get(key)
+            if link is not None:
+                link[3] = value
+                self._move_to_front(link)
+                return
+
+            if len(self.map) >= self.size:
+                oldest = self.root[0]
+                self._unlink(oldest)
+                del self.map[oldest[2]]
+
+            root = self.root
+            link = [root, root[1], key, value]
+            root[1][0] = link
+            root[1] = link
+            self.map[key] = link
+        finally:
+            self.lock.release()
+
+    def pop(self, key, default=None):
+        self.lock.acquire()
+        try:
+            link = self.map.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _move_to_front(self, link):
+        self._unlink(link)
+        root = self.root
+        link[0] = root
+        link[1] = root[1]
+        root[1][0] = link
+        root[1] = link
@@ -0,0 +1,12 @@
+import django.core.management.base
+
+from giraffe.aggregator import timeline
+
+
+class Command(django.core.management.base.BaseCommand):
+    help = "Adds existing activities to their users' timelines, then trims them."
+
+    def handle(self, *args, **options):
+        created = timeline.backfill()
+        timeline.trim_all()
+        print "Added %d timeline entries" % created
@@ -0,0 +1,20 @@
+from optparse import make_option
+
+import django.core.management.base
+
+from giraffe.aggregator import dedupe
+
+
+class Command(django.core.management.base.BaseCommand):
+    help = 'Merges activities that were stored more than once under different hashes.'
+    option_list = django.core.management.base.BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help="Only count the activities that would change"),
+    )
+
+    def handle(self, *args, **options):
+        rehashed, merged = dedupe.merge_duplicates(dry_run=options['dry_run'])
+        if options['dry_run']:
+            print "Would rehash %d activities and merge %d duplicates" % (rehashed, merged)
+        else:
+            print "Rehashed %d activities and merged %d duplicates" % (rehashed, merged)
@@ -0,0 +1,21 @@
+from optparse import make_option
+
+import django.core.management.base
+
+from giraffe.aggregator import models, poller
+
+
+class Command(django.core.management.base.BaseCommand):
+    help = 'Polls the feeds of all the poll-mode subscriptions.'
+    option_list = django.core.management.base.BaseCommand.option_list + (
+        make_option('--workers', type='int', default=None,
+            help='How many hosts to poll at once'),
+    )
+
+    def handle(self, *args, **options):
+        subscriptions = models.Subscription.objects.filter(mode='poll')
+        results = poller.poll_subscriptions(subscriptions, workers=options['workers'])
+
+        failed = [pk for pk, created in results.iteritems() if created is None]
+        created = sum(created for created in results.itervalues() if created)
+        print "Polled %d feeds: %d new activities, %d failures" % (len(results), created, len(failed))
@@ -0,0 +1,17 @@
+import django.core.management.base
+
+from giraffe.aggregator.loaders import Loader
+
+
+class Command(django.core.management.base.BaseCommand):
+    help = 'Compiles all the aggregator templates into the Jinja bytecode cache.'
+
+    def handle(self, *args, **options):
+        env = Loader.env
+        if env.bytecode_cache is None:
+            print "AGGREGATOR_JINJA_BYTECODE_CACHE_DIR isn't set, so templates will only be checked"
+
+        names = list(env.list_templates(filter_func=lambda name: name.startswith('aggregator/')))
+        for name in names:
+            env.get_template(name)
+        print "Compiled %d templates" % len(names)
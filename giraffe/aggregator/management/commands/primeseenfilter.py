@@ -0,0 +1,12 @@
+import django.core.management.base
+
+from giraffe.aggregator import seen
+
+
+class Command(django.core.management.base.BaseCommand):
+    help = 'Builds the seen filter from every stored activity and saves it.'
+
+    def handle(self, *args, **options):
+        bloom = seen.prime()
+        print "Primed seen filter: %.1f%% full, %.4f%% false positive rate" % (
+            bloom.fill_ratio() * 100, bloom.error_rate() * 100)
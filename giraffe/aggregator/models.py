@@ -1,20 +1,35 @@
-import hashlib
+import base64
+from datetime import datetime
 
-from django.db import models
+from django.db import connections, models, router, transaction
 
 from giraffe.aggregator import tasks
+from giraffe.aggregator.keys import HashField, sha1_hex
+from giraffe.aggregator.trace import trace
 
 
 class Subscription(models.Model):
 
     display_name = models.CharField(max_length=75, null=True, blank=True)
     topic_url = models.CharField(max_length=255)
-    topic_url_hash = models.CharField(max_length=40, db_index=True, blank=True, unique=True)
+    topic_url_hash = HashField(db_index=True, blank=True, unique=True)
     user = models.ForeignKey('auth.User', null=True, blank=True, related_name="aggregator_subscriptions")
     mode = models.CharField(max_length=20, choices=(
         ('poll', 'Poll'),
         ('push', 'Push'),
     ), default='poll')
+    # Validators from the last time we polled the feed, for conditional GETs.
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.CharField(max_length=50, blank=True, default='')
+    # How often we poll the feed, in seconds, and when we'll next poll it.
+    # See giraffe.aggregator.schedule.
+    poll_interval = models.IntegerField(default=900)
+    next_poll = models.DateTimeField(null=True, blank=True, db_index=True)
+    # The hub we subscribed through, when the lease it granted us runs out,
+    # and when we'll ask it to renew. See giraffe.aggregator.leases.
+    hub_url = models.CharField(max_length=255, blank=True, default='')
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    next_renewal = models.DateTimeField(null=True, blank=True, db_index=True)
 
     @classmethod
     def lookup_by_topic_url(cls, url):
@@ -38,10 +53,31 @@ def subscribe(sender, instance, created, **kwargs):
 models.signals.post_save.connect(subscribe, sender=Subscription)
 
 
+class PendingPayload(models.Model):
+
+    """A PuSH notification body waiting to be ingested by a worker."""
+
+    subscription = models.ForeignKey("Subscription", related_name="pending_payloads")
+    # The raw body, base64 encoded so feeds in any encoding survive the trip.
+    encoded_body = models.TextField()
+    received = models.DateTimeField(default=datetime.now)
+    # The worker ingesting it, so no other worker does too.
+    claimed = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def get_body(self):
+        return base64.b64decode(self.encoded_body)
+
+    def set_body(self, body):
+        self.encoded_body = base64.b64encode(body)
+
+    body = property(get_body, set_body)
+
+
 class Object(models.Model):
 
     foreign_id = models.CharField(max_length=255, null=True)
-    foreign_id_hash = models.CharField(max_length=40, db_index=True, unique=True, null=True)
+    foreign_id_hash = HashField(db_index=True, unique=True, null=True)
     name = models.CharField(max_length=255, blank=True, null=True)
     summary = models.CharField(max_length=255, blank=True, null=True)
     permalink_url = models.CharField(max_length=255, blank=True, null=True)
@@ -61,13 +97,16 @@ class Object(models.Model):
         hash = sha1_hex(foreign_id)
         return cls.objects.get(foreign_id_hash=hash)
 
-    def save(self):
+    def fill_derived_fields(self):
         if self.foreign_id:
             self.foreign_id_hash = sha1_hex(self.foreign_id)
         else:
             self.foreign_id_hash = None
         if self.time is None:
             self.time = datetime.now()
+
+    def save(self):
+        self.fill_derived_fields()
         super(Object, self).save()
 
     def __unicode__(self):
@@ -92,71 +131,131 @@ class Activity(models.Model):
     time = models.DateTimeField(db_index=True)
     subscription = models.ForeignKey("Subscription", related_name="activities")
     user = models.ForeignKey("auth.User", null=True, blank=True, related_name="activities")
-    uniq_hash = models.CharField(max_length=40, db_index=True, unique=True, blank=True)
+    uniq_hash = HashField(db_index=True, unique=True, blank=True)
 
     @classmethod
     def lookup_by_as_activity(cls, as_activity):
-        parts = []
-        verb = as_activity.verb
-        if verb is not None:
-            verb = verb.replace("http://activitystrea.ms/schema/1.0/", "", 1)
-
-        parts.append(verb)
-        parts.append(as_activity.time.isoformat())
-        if as_activity.actor is not None:
-            parts.append(as_activity.actor.id)
-        else:
-            parts.append("")
+        key = as_activity_key(as_activity)
+        hash = activity_hash(key)
+        trace("Looking up activity %s", hash, activity_key=key, uniq_hash=hash)
+        return cls.objects.get(uniq_hash=hash)
 
-        if as_activity.object is not None:
-            parts.append(as_activity.object.id)
-        else:
-            parts.append("")
+    def make_uniq_hash(self):
+        key = activity_key(self.verb, self.time,
+            *[object.foreign_id if object is not None else None
+              for object in (self.actor, self.object, self.target)])
+        hash = activity_hash(key)
+        trace("Activity %r has hash %s", self.id, hash, activity_id=self.id,
+            activity_key=key, uniq_hash=hash)
+        return hash
 
-        if as_activity.target is not None:
-            parts.append(as_activity.target.id)
-        else:
-            parts.append("")
+    def save(self):
+        self.uniq_hash = self.make_uniq_hash()
+        super(Activity, self).save()
 
-        print "Base string for lookup is "+(" ".join(parts))
 
-        hash = sha1_hex("\t".join(parts))
+class TimelineEntry(models.Model):
 
-        print "Hash for lookup is "+hash
+    """An activity in a user's timeline.
 
-        return cls.objects.get(uniq_hash=hash)
+    Timelines are filled in as activities are ingested (see
+    `giraffe.aggregator.timeline`), so reading one is a single scan of the
+    (user, time, id) index rather than a sort of every activity.
 
-    def save(self):
-        parts = []
-        parts.append(self.verb)
-        parts.append(self.time.isoformat())
-        if self.actor is not None:
-            parts.append(self.actor.foreign_id)
-        else:
-            parts.append("")
+    """
 
-        if self.object is not None:
-            parts.append(self.object.foreign_id)
-        else:
-            parts.append("")
+    user = models.ForeignKey("auth.User", related_name="aggregator_timeline")
+    activity = models.ForeignKey("Activity", related_name="timeline_entries")
+    time = models.DateTimeField()
 
-        if self.target is not None:
-            parts.append(self.target.foreign_id)
-        else:
-            parts.append("")
+    class Meta:
+        unique_together = (('user', 'activity'),)
 
-        print "Base string for save is "+(" ".join(parts))
 
-        hash = sha1_hex("\t".join(parts))
-        self.uniq_hash = hash
+AS_SCHEMA_PREFIX = "http://activitystrea.ms/schema/1.0/"
 
-        print "Hash for save is "+hash
-        print "Id for save is "+repr(self.id)
 
-        super(Activity, self).save()
+def canonical_verb(verb):
+    """Return `verb` without the activitystrea.ms schema prefix, or '' if
+    there isn't one."""
+    if not verb:
+        return ''
+    if verb.startswith(AS_SCHEMA_PREFIX):
+        return verb[len(AS_SCHEMA_PREFIX):]
+    return verb
+
+
+def canonical_time(time):
+    """Return `time` as a naive UTC datetime to the second, as every
+    database can store it."""
+    offset = time.utcoffset()
+    if offset is not None:
+        time = (time - offset).replace(tzinfo=None)
+    return time.replace(microsecond=0)
+
+
+def activity_key(verb, time, actor_id, object_id, target_id):
+    """Return the string that identifies an activity, from its verb, time
+    and the foreign IDs of its objects.
+
+    Every way of identifying activities (parsed or stored) goes through
+    here, so they all agree. Missing verbs, times and IDs count as ''.
+
+    """
+    parts = [canonical_verb(verb)]
+    parts.append(canonical_time(time).isoformat() if time is not None else '')
+    parts.extend(id or '' for id in (actor_id, object_id, target_id))
+    return u"\t".join(parts)
+
+
+def as_activity_key(as_activity):
+    """Return the `activity_key` of the parsed activitystreams activity
+    `as_activity`."""
+    return activity_key(as_activity.verb, as_activity.time,
+        *[as_object.id if as_object is not None else None
+          for as_object in (as_activity.actor, as_activity.object, as_activity.target)])
 
 
-def sha1_hex(s):
-    m = hashlib.sha1()
-    m.update(s)
-    return m.hexdigest()
+def activity_hash(key):
+    """Return the `uniq_hash` for the activity key `key`."""
+    return sha1_hex(key)
+
+
+# Most databases limit the number of parameters in one query (SQLite to 999).
+MAX_INSERT_PARAMS = 999
+
+
+def bulk_insert(model, instances):
+    """Insert all the given new instances of `model`, in one query per few
+    hundred rows.
+
+    Django 1.4's `bulk_create` is used where there is one. On older Django
+    the rows go in a multi-row INSERT of our own. Either way the instances'
+    ids aren't set, and their models' save() methods and signals are
+    skipped, so callers have to fill in any derived fields first.
+
+    """
+    if not instances:
+        return
+    if hasattr(model.objects, 'bulk_create'):
+        model.objects.bulk_create(instances)
+        return
+
+    connection = connections[router.db_for_write(model)]
+    fields = [field for field in model._meta.local_fields
+        if not isinstance(field, models.AutoField)]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES ' % (qn(model._meta.db_table),
+        ', '.join(qn(field.column) for field in fields))
+    row = '(%s)' % ', '.join(['%s'] * len(fields))
+
+    cursor = connection.cursor()
+    per_query = max(1, MAX_INSERT_PARAMS // len(fields))
+    for i in range(0, len(instances), per_query):
+        chunk = instances[i:i + per_query]
+        params = []
+        for instance in chunk:
+            params.extend(field.get_db_prep_save(field.pre_save(instance, True), connection=connection)
+                for field in fields)
+        cursor.execute(sql + ', '.join([row] * len(chunk)), params)
+    transaction.commit_unless_managed(using=connection.alias)
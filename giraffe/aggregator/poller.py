@@ -0,0 +1,108 @@
+"""
+Polls the feeds of poll-mode subscriptions.
+
+Subscriptions are grouped by the host their feeds are on. Each host's feeds
+are fetched one after another over a single `httplib2.Http`, so they share
+a keep-alive connection, and up to `AGGREGATOR_POLL_WORKERS` hosts are
+polled at once. Feeds are fetched conditionally using the validators saved
+from the last poll, and a 304 response skips parsing entirely. After each
+poll, the subscription's next poll is scheduled by
+`giraffe.aggregator.schedule`.
+
+"""
+
+from cStringIO import StringIO
+import logging
+import socket
+from urlparse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+import httplib2
+
+from giraffe.aggregator import ingest, models, schedule
+from giraffe.aggregator.pool import run_in_pool
+
+
+log = logging.getLogger(__name__)
+
+
+def poll_subscriptions(subscriptions, workers=None):
+    """Poll the feeds of all the given subscriptions.
+
+    Returns a dict mapping each subscription's pk to the number of new
+    activities found in its feed, or None if the feed couldn't be fetched.
+
+    """
+    if workers is None:
+        workers = getattr(settings, 'AGGREGATOR_POLL_WORKERS', 10)
+
+    by_host = {}
+    for subscription in subscriptions:
+        host = urlsplit(subscription.topic_url)[1].lower()
+        by_host.setdefault(host, []).append(subscription)
+
+    results = {}
+    for host_results in run_in_pool(poll_host, by_host.values(), workers):
+        if host_results is not None:
+            results.update(host_results)
+    return results
+
+
+def poll_host(subscriptions):
+    timeout = getattr(settings, 'AGGREGATOR_POLL_TIMEOUT', 30)
+    http = httplib2.Http(timeout=timeout)
+    results = {}
+    for subscription in subscriptions:
+        created = None
+        try:
+            created = poll_subscription(subscription, http)
+        except Exception, exc:
+            # Don't let one bad feed stop the rest of the host's being polled.
+            log.exception('%s polling feed %s: %s', type(exc).__name__,
+                subscription.topic_url, str(exc))
+            transaction.rollback_unless_managed()
+        finally:
+            schedule.reschedule(subscription, created)
+        results[subscription.pk] = created
+    return results
+
+
+def poll_subscription(subscription, http):
+    headers = {}
+    if subscription.etag:
+        headers['If-None-Match'] = subscription.etag
+    if subscription.last_modified:
+        headers['If-Modified-Since'] = subscription.last_modified
+
+    try:
+        resp, content = http.request(subscription.topic_url, headers=headers)
+    except (socket.error, httplib2.HttpLib2Error), exc:
+        log.warning('%s trying to fetch feed %s: %s', type(exc).__name__,
+            subscription.topic_url, str(exc))
+        return None
+
+    if resp.status == 304:
+        log.debug("Feed %s is unchanged", subscription.topic_url)
+        return 0
+    if resp.status != 200:
+        log.warning('HTTP response %d %s trying to fetch feed %s', resp.status,
+            resp.reason, subscription.topic_url)
+        return None
+
+    try:
+        created = ingest.ingest_feed(StringIO(content), subscription)
+    except SyntaxError, exc:
+        log.warning('%s parsing feed %s: %s', type(exc).__name__,
+            subscription.topic_url, str(exc))
+        return None
+
+    subscription.etag = resp.get('etag', '')
+    subscription.last_modified = resp.get('last-modified', '')
+    # Only touch the validators, so we don't clobber changes made to the
+    # subscription while we were polling.
+    models.Subscription.objects.filter(pk=subscription.pk).update(
+        etag=subscription.etag, last_modified=subscription.last_modified)
+
+    log.debug("Found %d new activities in feed %s", created, subscription.topic_url)
+    return created
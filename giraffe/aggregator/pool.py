@@ -0,0 +1,46 @@
+from Queue import Queue, Empty
+import logging
+import threading
+
+from django.db import connection
+
+
+log = logging.getLogger(__name__)
+
+
+def run_in_pool(func, items, size):
+    """Call `func` on each of `items` using at most `size` threads at once.
+
+    Returns a list of the results, in the same order as `items`. Exceptions
+    raised by `func` are logged and give a result of None.
+
+    """
+    items = list(items)
+    results = [None] * len(items)
+
+    queue = Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+
+    def work():
+        try:
+            while True:
+                try:
+                    i, item = queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results[i] = func(item)
+                except Exception, exc:
+                    log.exception(exc)
+        finally:
+            # Each thread gets its own database connection, so clean it up.
+            connection.close()
+
+    threads = [threading.Thread(target=work) for i in range(min(size, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
@@ -0,0 +1,85 @@
+"""
+Decides when to poll the feeds of poll-mode subscriptions.
+
+Each subscription has its own `poll_interval`. Every poll that finds no new
+activities doubles the interval, up to `AGGREGATOR_POLL_MAX_INTERVAL`
+seconds, and every poll that finds some halves it, down to
+`AGGREGATOR_POLL_MIN_INTERVAL` seconds. That way dormant feeds are hardly
+fetched at all while busy ones stay fresh.
+
+`dispatch_due_polls` is run periodically to hand the subscriptions that are
+due off to `tasks.poll_subscriptions` in batches.
+
+"""
+
+from datetime import datetime, timedelta
+import logging
+import random
+
+from django.conf import settings
+from django.db.models import Q
+
+from giraffe.aggregator import models, tasks
+
+
+log = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def next_interval(interval, created):
+    """Return the poll interval to use after a poll that found `created` new
+    activities (or None if the poll failed)."""
+    if created:
+        interval = interval / 2
+    else:
+        interval = interval * 2
+    interval = max(interval, _setting('AGGREGATOR_POLL_MIN_INTERVAL', 300))
+    interval = min(interval, _setting('AGGREGATOR_POLL_MAX_INTERVAL', 86400))
+    return interval
+
+
+def reschedule(subscription, created, now=None):
+    if now is None:
+        now = datetime.now()
+
+    interval = next_interval(subscription.poll_interval, created)
+    # Spread polls out a little so feeds that were due together drift apart.
+    delay = interval * random.uniform(0.9, 1.1)
+
+    subscription.poll_interval = interval
+    subscription.next_poll = now + timedelta(seconds=delay)
+    models.Subscription.objects.filter(pk=subscription.pk).update(
+        poll_interval=subscription.poll_interval, next_poll=subscription.next_poll)
+
+
+def dispatch_due_polls(now=None):
+    """Enqueue polls for the poll-mode subscriptions that are due.
+
+    Returns the number of subscriptions dispatched.
+
+    """
+    if now is None:
+        now = datetime.now()
+    limit = _setting('AGGREGATOR_POLL_DISPATCH_LIMIT', 1000)
+    batch_size = _setting('AGGREGATOR_POLL_BATCH_SIZE', 50)
+
+    due = models.Subscription.objects.filter(mode='poll')
+    due = due.filter(Q(next_poll__isnull=True) | Q(next_poll__lte=now))
+    sub_pks = list(due.order_by('next_poll').values_list('pk', flat=True)[:limit])
+    if not sub_pks:
+        return 0
+
+    # Push the due subscriptions back until well after their polls should
+    # have finished, so the next dispatch doesn't poll them again. The poll
+    # itself reschedules them properly.
+    retry_at = now + timedelta(seconds=_setting('AGGREGATOR_POLL_MIN_INTERVAL', 300))
+    models.Subscription.objects.filter(pk__in=sub_pks).update(next_poll=retry_at)
+
+    for i in range(0, len(sub_pks), batch_size):
+        tasks.poll_subscriptions.delay(sub_pks[i:i + batch_size])
+
+    log.debug("Dispatched polls for %d subscriptions", len(sub_pks))
+    return len(sub_pks)
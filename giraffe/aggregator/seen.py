@@ -0,0 +1,236 @@
+"""
+Remembers which activities ingest has already stored, so redelivered
+entries can skip the database.
+
+Hubs and polls deliver the same entries over and over. When
+`AGGREGATOR_SEEN_FILTER` is on, each process keeps a Bloom filter of two
+kinds of keys:
+
+ * the `uniq_hash` of every activity it has stored, and
+ * a content key, hashing the `uniq_hash` with the subscription and
+   everything ingest stores about the activity's objects.
+
+An entry whose `uniq_hash` and content key are both probably in the filter
+is probably unchanged since we last stored it, so ingest leaves it out
+altogether. An entry whose `uniq_hash` is definitely not in a primed filter
+is new, so ingest doesn't look for an existing row before inserting it; if
+another process got there first, ingest falls back on looking it up.
+
+A filter is primed once it has had every stored activity added to it, by the
+primeseenfilter management command. Filters are saved to
+`AGGREGATOR_SEEN_FILTER_FILE` every `AGGREGATOR_SEEN_FILTER_SAVE_EVERY`
+seconds, merged with what other processes have saved there.
+
+`stats` counts how the filter's answers turn out, to help size it with
+`AGGREGATOR_SEEN_FILTER_CAPACITY` and `AGGREGATOR_SEEN_FILTER_ERROR_RATE`.
+
+"""
+
+import fcntl
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from giraffe.aggregator import models
+from giraffe.aggregator.bloom import BloomFilter
+from giraffe.aggregator.keys import hex_digest, sha1_hex
+
+
+log = logging.getLogger(__name__)
+
+CONTENT_FIELDS = ('foreign_id', 'name', 'permalink_url', 'summary', 'object_type',
+    'image_url', 'image_width', 'image_height')
+
+stats = {
+    # Activities checked against the filter.
+    'checked': 0,
+    # Activities left out of ingest as probably unchanged.
+    'unchanged': 0,
+    # Activities inserted without looking for an existing row first.
+    'trusted_new': 0,
+    # Activities the filter probably had that turned out not to be stored.
+    'false_positives': 0,
+    # Inserts of trusted new activities that found them already stored.
+    'collisions': 0,
+}
+
+_filter = None
+_filter_lock = threading.Lock()
+_last_saved = [time.time()]
+
+
+def enabled():
+    return getattr(settings, 'AGGREGATOR_SEEN_FILTER', False)
+
+
+def _filter_path():
+    return getattr(settings, 'AGGREGATOR_SEEN_FILTER_FILE', None)
+
+
+def new_filter():
+    # Each activity adds two keys.
+    return BloomFilter(2 * getattr(settings, 'AGGREGATOR_SEEN_FILTER_CAPACITY', 1000000),
+        getattr(settings, 'AGGREGATOR_SEEN_FILTER_ERROR_RATE', 0.001))
+
+
+def reset():
+    """Forget this process's filter and stats, so the filter is loaded from
+    the filter file again the next time it's used."""
+    global _filter
+    _filter_lock.acquire()
+    try:
+        _filter = None
+    finally:
+        _filter_lock.release()
+    for name in stats:
+        stats[name] = 0
+    _last_saved[0] = time.time()
+
+
+def get_filter():
+    """Return this process's filter, loading it from the filter file the
+    first time."""
+    global _filter
+    if _filter is not None:
+        return _filter
+
+    _filter_lock.acquire()
+    try:
+        if _filter is None:
+            bloom = new_filter()
+            path = _filter_path()
+            if path and os.path.exists(path):
+                try:
+                    bloom.merge(BloomFilter.load(path))
+                except ValueError, exc:
+                    log.warning("Couldn't load seen filter from %s: %s", path, str(exc))
+            _filter = bloom
+    finally:
+        _filter_lock.release()
+    return _filter
+
+
+def save_filter(bloom=None):
+    """Merge the filter into the filter file, and the filter file into the
+    filter, so both have every key either had."""
+    path = _filter_path()
+    if not path:
+        return
+    if bloom is None:
+        bloom = get_filter()
+
+    lock_file = open(path + '.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            try:
+                bloom.merge(BloomFilter.load(path))
+            except ValueError, exc:
+                log.warning("Replacing unusable seen filter %s: %s", path, str(exc))
+        bloom.save(path)
+    finally:
+        lock_file.close()
+    _last_saved[0] = time.time()
+    log.debug("Saved seen filter to %s", path)
+
+
+def maybe_save_filter():
+    if time.time() - _last_saved[0] >= getattr(settings, 'AGGREGATOR_SEEN_FILTER_SAVE_EVERY', 300):
+        save_filter()
+
+
+def uniq_hash(as_activity):
+    """Return the `uniq_hash` the activity will be stored with."""
+    return models.activity_hash(models.as_activity_key(as_activity))
+
+
+def _content_parts(as_object, object_values):
+    values = object_values(as_object)
+    return [unicode(values.get(field, u'') or u'') for field in CONTENT_FIELDS]
+
+
+def content_key(hash, as_activity, subscription, object_values):
+    """Return a hash of `uniq_hash` and everything ingest would store about
+    the activity for `subscription`, using `object_values` to find the
+    stored values of its objects."""
+    parts = [hash, unicode(subscription.pk)]
+    for as_object in (as_activity.actor, as_activity.object, as_activity.target):
+        while as_object is not None:
+            parts.extend(_content_parts(as_object, object_values))
+            as_object = as_object.in_reply_to_object
+        parts.append(u'')
+    return sha1_hex(u'\t'.join(parts))
+
+
+def keys(as_activities, subscription, object_values):
+    """Return a list of `(uniq_hash, content_key)` pairs for the given
+    normalised activities."""
+    result = []
+    for as_activity in as_activities:
+        hash = uniq_hash(as_activity)
+        result.append((hash, content_key(hash, as_activity, subscription, object_values)))
+    return result
+
+
+def probably_unchanged(key):
+    stats['checked'] += 1
+    bloom = get_filter()
+    hash, content = key
+    if hash in bloom and content in bloom:
+        stats['unchanged'] += 1
+        return True
+    return False
+
+
+def definitely_new(hashes):
+    """Return the set of `hashes` a primed filter says are definitely not
+    stored yet."""
+    bloom = get_filter()
+    if not bloom.primed:
+        return set()
+    return set(hash for hash in hashes if hash not in bloom)
+
+
+def count_false_positives(hashes):
+    """Count the given hashes of newly stored activities that the filter
+    said were probably already stored."""
+    bloom = get_filter()
+    stats['false_positives'] += sum(1 for hash in hashes if hash in bloom)
+
+
+def remember(keys):
+    """Add the given `(uniq_hash, content_key)` pairs, which are now safely
+    stored, to the filter."""
+    bloom = get_filter()
+    for hash, content in keys:
+        bloom.add(hash)
+        bloom.add(content)
+    maybe_save_filter()
+
+
+def prime(chunk_size=1000):
+    """Add the `uniq_hash` of every stored activity to a new filter, mark it
+    primed, and save it to the filter file.
+
+    Returns the filter.
+
+    """
+    global _filter
+    bloom = new_filter()
+    last_id = 0
+    while True:
+        chunk = models.Activity.objects.filter(id__gt=last_id).order_by('id')
+        chunk = list(chunk.values_list('id', 'uniq_hash')[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        for id, hash in chunk:
+            bloom.add(hex_digest(hash))
+    bloom.primed = True
+
+    _filter = bloom
+    save_filter(bloom)
+    return bloom
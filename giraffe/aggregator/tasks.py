@@ -1,11 +1,11 @@
+from cStringIO import StringIO
+from datetime import datetime, timedelta
 import logging
-from urllib import urlencode
-from urlparse import urljoin
-from xml.etree import ElementTree
+import uuid
 
-from celery.decorators import task
-from django.contrib.sites.models import Site
-from django.core.urlresolvers import reverse
+from celery.decorators import periodic_task, task
+from django.conf import settings
+from django.db.models import Q
 import httplib2
 
 
@@ -13,41 +13,155 @@ import httplib2
 def subscribe(feed_url, sub_pk):
     log = logging.getLogger('%s.subscribe' % __name__)
 
+    from giraffe.aggregator import discovery, ingest, leases, models
+
+    # Seed the subscription from the feed we fetch to find the hub, so it
+    # doesn't start out empty until the first poll or notification.
+    seed = getattr(settings, 'AGGREGATOR_SEED_ON_SUBSCRIBE', True)
+
     h = httplib2.Http()
-    resp, cont = h.request(feed_url)
-    if resp.status != 200:
-        # No feed means we can't subscribe to notifications.
-        log.warning('HTTP response %d %s trying to fetch feed %s', resp.status, resp.reason, feed_url)
-        return
+    # Unless we're fetching the feed anyway, trust the hub other feeds on its
+    # host use.
+    hub_url = None if seed else discovery.cached_hub(feed_url)
+    if hub_url is None:
+        resp, cont = h.request(feed_url)
+        if resp.status != 200:
+            # No feed means we can't subscribe to notifications.
+            log.warning('HTTP response %d %s trying to fetch feed %s', resp.status, resp.reason, feed_url)
+            return
 
-    # Look for the hub link.
-    try:
-        doc = ElementTree.fromstring(cont)
-        elems = doc.findall('{http://www.w3.org/2005/Atom}link')
-        log.debug("elems is %r", elems);
-        hubs = [elem for elem in elems if elem.attrib['rel'] == 'hub']
-        hub_url = hubs[0].attrib['href']
-    except Exception, exc:
-        log.warning('%s trying to find hub in feed %s: %s', type(exc).__name__, feed_url, str(exc))
-        hub_url = "http://pubsubhubbub.appspot.com/"
+        # Look for the hub link.
+        try:
+            found_hub_url, as_activities = discovery.read_feed(StringIO(cont), with_activities=seed)
+        except SyntaxError, exc:
+            log.warning('%s trying to find hub in feed %s: %s', type(exc).__name__, feed_url, str(exc))
+            found_hub_url, as_activities = None, []
+
+        if found_hub_url is not None:
+            hub_url = found_hub_url
+            discovery.remember_hub(feed_url, hub_url)
+        else:
+            # The feed says what it wants, so don't second-guess it with the
+            # hub of another feed on its host.
+            log.warning('Found no hub in feed %s', feed_url)
+            hub_url = discovery.default_hub()
+        log.debug("Hub for feed %s is %s", feed_url, hub_url)
+
+        if as_activities:
+            subscription = models.Subscription.objects.get(pk=sub_pk)
+            created = ingest.ingest_activities(as_activities, subscription)
+            log.debug("Seeded subscription %r with %d activities", sub_pk, created)
+            # The first poll can then be a conditional GET.
+            models.Subscription.objects.filter(pk=sub_pk).update(
+                etag=resp.get('etag', ''), last_modified=resp.get('last-modified', ''))
 
     # Try to subscribe.
-    callback_root = 'http://%s/' % Site.objects.get_current().domain
-    callback = urljoin(callback_root, reverse('aggregator-callback', kwargs={"sub_pk":sub_pk}))
-    log.debug("My hub.callback will be %s", callback)
-    subreq = {
-        'hub.callback': callback,
-        'hub.mode': 'subscribe',
-        'hub.topic': feed_url,
-        'hub.verify': 'async',
-    }
-    resp, cont = h.request(uri=hub_url, method='POST', body=urlencode(subreq),
-        headers={'Content-Type': 'application/x-www-form-urlencoded'})
-
-    if resp.status not in (202, 204):
-        log.warning('HTTP response %d %s trying to request subscription to feed %s from hub %s',
-            resp.status, resp.reason, feed_url, hub_url)
+    log.debug("My hub.callback will be %s", leases.callback_url(sub_pk))
+    if leases.request_subscription(h, hub_url, feed_url, sub_pk):
+        # Remember the hub, so we can renew our lease with it.
+        models.Subscription.objects.filter(pk=sub_pk).update(hub_url=hub_url)
 
     # Even if the response was correct, we want to mark the subscription as
     # push when the hub verifies the subscription, so we're done.
     return
+
+
+@task
+def ingest_pending(sub_pk):
+    """Ingest the PuSH payloads stored for the subscription `sub_pk`.
+
+    All the payloads queued for the subscription are ingested together as one
+    batch, so the tasks enqueued for any later payloads usually find nothing
+    left to do.
+
+    """
+    log = logging.getLogger('%s.ingest_pending' % __name__)
+
+    from giraffe.aggregator import ingest, models
+
+    batch_size = getattr(settings, 'AGGREGATOR_INGEST_BATCH_SIZE', 20)
+    # Claims older than this belong to workers that died, so take them over.
+    now = datetime.now()
+    stale = now - timedelta(seconds=getattr(settings, 'AGGREGATOR_INGEST_CLAIM_TIMEOUT', 600))
+    unclaimed = Q(claimed=None) | Q(claimed_at__lt=stale)
+
+    pending = models.PendingPayload.objects.filter(subscription=sub_pk).filter(unclaimed)
+    pks = list(pending.order_by('id').values_list('id', flat=True)[:batch_size + 1])
+    if not pks:
+        log.debug("No payloads left for subscription %r", sub_pk)
+        return
+    more = len(pks) > batch_size
+
+    # Claim the batch, so another worker ingesting the subscription's
+    # payloads at the same time leaves these alone.
+    token = uuid.uuid4().hex
+    pending.filter(pk__in=pks[:batch_size]).update(claimed=token, claimed_at=now)
+    claimed = models.PendingPayload.objects.filter(claimed=token)
+    payloads = list(claimed.select_related('subscription').order_by('id'))
+    if not payloads:
+        log.debug("Another worker claimed the payloads for subscription %r", sub_pk)
+        return
+
+    as_activities = []
+    for payload in payloads:
+        try:
+            as_activities.extend(ingest.parse(StringIO(payload.body)))
+        except SyntaxError, exc:
+            log.warning('%s parsing payload %r for subscription %r: %s',
+                type(exc).__name__, payload.pk, sub_pk, str(exc))
+
+    log.debug("Ingesting %d activities from %d payloads for subscription %r",
+        len(as_activities), len(payloads), sub_pk)
+    try:
+        # Delete the payloads in the same transaction the activities are
+        # stored in, so they're ingested exactly once.
+        ingest.ingest_activities(as_activities, payloads[0].subscription, also=claimed.delete)
+    except:
+        claimed.update(claimed=None, claimed_at=None)
+        raise
+
+    if more:
+        ingest_pending.delay(sub_pk)
+
+
+@task
+def poll_subscriptions(sub_pks=None):
+    """Poll the feeds of the given poll-mode subscriptions, or all of them if
+    `sub_pks` is None."""
+    from giraffe.aggregator import models, poller
+
+    subscriptions = models.Subscription.objects.filter(mode='poll')
+    if sub_pks is not None:
+        subscriptions = subscriptions.filter(pk__in=sub_pks)
+    return poller.poll_subscriptions(subscriptions)
+
+
+@periodic_task(run_every=timedelta(seconds=getattr(settings, 'AGGREGATOR_POLL_DISPATCH_EVERY', 60)))
+def dispatch_due_polls():
+    from giraffe.aggregator import schedule
+
+    return schedule.dispatch_due_polls()
+
+
+@periodic_task(run_every=timedelta(days=1))
+def trim_timelines():
+    from giraffe.aggregator import timeline
+
+    timeline.trim_all()
+
+
+@task
+def renew_leases(sub_pks):
+    """Ask the hubs of the given push-mode subscriptions to renew our
+    leases."""
+    from giraffe.aggregator import leases, models
+
+    subscriptions = models.Subscription.objects.filter(mode='push', pk__in=sub_pks)
+    return leases.renew_leases(subscriptions)
+
+
+@periodic_task(run_every=timedelta(seconds=getattr(settings, 'AGGREGATOR_LEASE_DISPATCH_EVERY', 3600)))
+def dispatch_lease_renewals():
+    from giraffe.aggregator import leases
+
+    return leases.dispatch_due_renewals()
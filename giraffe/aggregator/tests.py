@@ -0,0 +1,781 @@
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from datetime import datetime, timedelta, tzinfo
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import signals
+from django.test import TestCase
+import httplib2
+
+from giraffe.aggregator import cards, dedupe, discovery, ingest, keys, leases, models, poller, seen, tasks, timeline, views
+from giraffe.aggregator.activitystreams import Activity, Object, atom, dates
+from giraffe.aggregator.bloom import BloomFilter
+from giraffe.aggregator.context_processors import ROTATION_MARKER, rotate
+
+
+class FixedOffset(tzinfo):
+    def __init__(self, hours):
+        self.offset = timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+
+FEED = '''<feed xmlns="http://www.w3.org/2005/Atom" xmlns:a="http://activitystrea.ms/spec/1.0/">
+<author><id>tag:example.com,2010:feed-author</id><name>Feed Author</name></author>
+%s
+</feed>'''
+
+ENTRY = '''<entry>
+<id>%(id)s</id>
+<title>An entry</title>
+<published>2010-09-01T12:00:00Z</published>
+%(extra)s
+</entry>'''
+
+
+def feed(*entries):
+    return StringIO(FEED % ''.join(ENTRY % {'id': id, 'extra': extra} for id, extra in entries))
+
+
+class ListAttributeTest(TestCase):
+
+    def test_append_to_unset(self):
+        first, second = Object(), Object()
+        first.links.append('http://example.com/')
+        self.assertEqual(first.links, ['http://example.com/'])
+        self.assertEqual(second.links, [])
+
+
+class DatesTest(TestCase):
+
+    def assertParses(self, date_string, expected):
+        self.assertEqual(dates.parse_w3cdtf(date_string), expected)
+
+    def test_common(self):
+        self.assertParses('2010-09-01T12:00:00Z', datetime(2010, 9, 1, 12, 0, 0))
+        self.assertParses('2010-09-01T12:00:00.5Z', datetime(2010, 9, 1, 12, 0, 0))
+        self.assertParses('2010-09', datetime(2010, 9, 1))
+        self.assertParses('2010', datetime(2010, 1, 1))
+
+    def test_invalid(self):
+        for date_string in ('', None, '10-09-01', '2010-09-01T12:00:00', 'yesterday'):
+            self.assertParses(date_string, None)
+
+    def test_trailing_newline(self):
+        self.assertParses('2010-09-01T12:00:00Z\n', None)
+        self.assertParses('2010-09-01T12:00:00+01:00\n', None)
+
+    def test_basic_format(self):
+        # Unlike the old parser, which only matched part of it.
+        self.assertParses('20100901T120000Z', datetime(2010, 9, 1, 12, 0, 0))
+
+    def test_decimal_comma(self):
+        # The old parser raised ValueError.
+        self.assertParses('2010-09-01T12:00:00,5Z', datetime(2010, 9, 1, 12, 0, 0))
+
+    def test_no_rollover(self):
+        # The old parser made this March 2nd.
+        self.assertParses('2010-02-30', None)
+        self.assertParses('2010-09-01T24:00:00Z', None)
+
+    def test_ordinal(self):
+        self.assertParses('2010-244', datetime(2010, 9, 1))
+        self.assertParses('2010244', datetime(2010, 9, 1))
+        self.assertParses('2012-060', datetime(2012, 2, 29))
+
+    def test_timezones(self):
+        self.assertParses('2010-09-01T12:00:00+02:00', datetime(2010, 9, 1, 10, 0, 0))
+        self.assertParses('2010-09-01T12:00:00-0530', datetime(2010, 9, 1, 17, 30, 0))
+        self.assertParses('2010-09-01T12:00+01:00', datetime(2010, 9, 1, 11, 0, 0))
+        self.assertParses('2010-09-01T23:30:00-01:00', datetime(2010, 9, 2, 0, 30, 0))
+
+
+class AtomParseTest(TestCase):
+
+    entries = [('tag:example.com,2010:%d' % i, '') for i in range(3)]
+
+    def test_entries_cleared(self):
+        seen = []
+        for entry_elem, feed_elem in atom.iterparse_feed(feed(*self.entries)):
+            self.assertEqual(entry_elem.findtext(atom.ATOM_ID), self.entries[len(seen)][0])
+            # Earlier entries are gone by the time the next one is yielded.
+            # (Later ones may already have been read ahead.)
+            self.assertEqual(feed_elem.findall(atom.ATOM_ENTRY)[0], entry_elem)
+            self.assertTrue(all(len(elem) == 0 for elem in seen))
+            seen.append(entry_elem)
+
+        self.assertEqual(len(seen), 3)
+        self.assertTrue(all(len(elem) == 0 for elem in seen))
+        self.assertEqual(feed_elem.findall(atom.ATOM_ENTRY), [])
+        self.assertEqual(feed_elem.find(atom.ATOM_AUTHOR).findtext(atom.ATOM_NAME), 'Feed Author')
+
+    def actor_ids(self, *entries):
+        return [activity.actor.id for activity in atom.iter_activities_from_feed(feed(*entries))]
+
+    def test_feed_author_fallback(self):
+        self.assertEqual(self.actor_ids(
+                ('tag:example.com,2010:1', ''),
+                ('tag:example.com,2010:2', '<author><id>tag:example.com,2010:alice</id></author>'),
+                ('tag:example.com,2010:3', '<source><author><id>tag:example.com,2010:bob</id></author></source>')),
+            ['tag:example.com,2010:feed-author', 'tag:example.com,2010:alice', 'tag:example.com,2010:bob'])
+
+    def test_on_header(self):
+        headers = []
+        def on_header(feed_elem):
+            headers.append(feed_elem.find(atom.ATOM_AUTHOR).findtext(atom.ATOM_NAME))
+            return True
+        self.assertEqual(list(atom.iterparse_feed(feed(*self.entries), on_header)), [])
+        self.assertEqual(headers, ['Feed Author'])
+
+
+class ActivityKeyTest(TestCase):
+
+    time = datetime(2010, 9, 1, 12, 0, 0)
+
+    def key(self, verb='post', time=None, actor='tag:actor', object='tag:object', target=None):
+        return models.activity_key(verb, time or self.time, actor, object, target)
+
+    def test_verb_prefix(self):
+        self.assertEqual(self.key(verb='http://activitystrea.ms/schema/1.0/post'), self.key(verb='post'))
+
+    def test_verb_prefix_only_at_start(self):
+        verb = 'x-http://activitystrea.ms/schema/1.0/post'
+        self.assertEqual(models.canonical_verb(verb), verb)
+
+    def test_missing_verb(self):
+        self.assertEqual(self.key(verb=None), self.key(verb=''))
+        self.assertNotEqual(self.key(verb=None), self.key(verb='post'))
+
+    def test_microseconds(self):
+        self.assertEqual(self.key(time=self.time.replace(microsecond=123456)), self.key())
+
+    def test_time_zone(self):
+        aware = datetime(2010, 9, 1, 14, 0, 0, tzinfo=FixedOffset(2))
+        self.assertEqual(self.key(time=aware), self.key())
+
+    def test_missing_time(self):
+        self.assertEqual(models.activity_key('post', None, 'a', 'b', None), u'post\t\ta\tb\t')
+
+    def test_missing_ids(self):
+        self.assertEqual(self.key(actor=None, target=None), self.key(actor='', target=''))
+        self.assertNotEqual(self.key(actor=None), self.key(object=None))
+
+    def test_unicode_ids(self):
+        hash = models.activity_hash(self.key(object=u'tag:example.com,2010:caf\xe9'))
+        self.assertEqual(len(hash), 40)
+        self.assertNotEqual(hash, models.activity_hash(self.key(object=u'tag:example.com,2010:cafe')))
+
+    def test_as_activity_key(self):
+        as_activity = Activity(verb='http://activitystrea.ms/schema/1.0/post', time=self.time,
+            actor=Object(id='tag:actor'), object=Object(id='tag:object'))
+        self.assertEqual(models.as_activity_key(as_activity), self.key())
+
+
+class SubscriptionTestCase(TestCase):
+
+    """Ingests into a subscription, starting with this process's seen filter
+    and object cache empty. Set `seen_filter` to turn the seen filter on or
+    off whatever the settings say."""
+
+    seen_filter = None
+
+    def setUp(self):
+        if self.seen_filter is not None:
+            self.old_seen_filter = getattr(settings, 'AGGREGATOR_SEEN_FILTER', False)
+            settings.AGGREGATOR_SEEN_FILTER = self.seen_filter
+        seen.reset()
+        ingest.object_cache.clear()
+        signals.post_save.disconnect(models.subscribe, sender=models.Subscription)
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.subscription = models.Subscription(topic_url='http://example.com/feed', user=self.user)
+        self.subscription.save()
+
+    def tearDown(self):
+        signals.post_save.connect(models.subscribe, sender=models.Subscription)
+        seen.reset()
+        ingest.object_cache.clear()
+        if self.seen_filter is not None:
+            settings.AGGREGATOR_SEEN_FILTER = self.old_seen_filter
+
+
+class IngestKeyTest(SubscriptionTestCase):
+
+    def assertStoredAsParsed(self, source):
+        as_activities = ingest.parse(source)
+        ingest.normalise(as_activities)
+        for as_activity in as_activities:
+            activity = models.Activity.lookup_by_as_activity(as_activity)
+            self.assertEqual(activity.make_uniq_hash(), activity.uniq_hash)
+
+    def ingest_twice(self, *entries):
+        self.assertEqual(ingest.ingest_feed(feed(*entries), self.subscription), len(entries))
+        self.assertEqual(ingest.ingest_feed(feed(*entries), self.subscription), 0)
+        self.assertEqual(models.Activity.objects.count(), len(entries))
+        self.assertStoredAsParsed(feed(*entries))
+
+    def test_implied_post(self):
+        self.ingest_twice(('tag:example.com,2010:1', ''))
+
+    def test_prefixed_verb(self):
+        self.ingest_twice(('tag:example.com,2010:1',
+            '<a:verb>http://activitystrea.ms/schema/1.0/favorite</a:verb>'
+            '<a:object><id>tag:example.com,2010:thing</id><title>Thing</title></a:object>'))
+        self.assertEqual(models.Activity.objects.get().verb, 'favorite')
+
+    def test_unprefixed_verb_matches_prefixed(self):
+        object = '<a:object><id>tag:example.com,2010:thing</id></a:object>'
+        ingest.ingest_feed(feed(('tag:example.com,2010:1', '<a:verb>favorite</a:verb>' + object)),
+            self.subscription)
+        created = ingest.ingest_feed(feed(('tag:example.com,2010:1',
+            '<a:verb>http://activitystrea.ms/schema/1.0/favorite</a:verb>' + object)), self.subscription)
+        self.assertEqual(created, 0)
+
+    def test_anonymous_target(self):
+        self.ingest_twice(('tag:example.com,2010:1',
+            '<a:verb>http://activitystrea.ms/schema/1.0/post</a:verb>'
+            '<a:target><title>Somewhere</title></a:target>'))
+
+    def test_unicode_id(self):
+        self.ingest_twice((u'tag:example.com,2010:caf\xe9'.encode('utf-8'), ''))
+
+    def test_undated_entries_are_skipped(self):
+        source = StringIO(FEED % '<entry><id>tag:example.com,2010:1</id><title>Undated</title></entry>')
+        self.assertEqual(ingest.ingest_feed(source, self.subscription), 0)
+        self.assertEqual(models.Activity.objects.count(), 0)
+
+
+class ObjectCacheTest(SubscriptionTestCase):
+
+    thing = 'tag:example.com,2010:thing'
+    # Unchanged entries have to get as far as the cache.
+    seen_filter = False
+
+    def setUp(self):
+        super(ObjectCacheTest, self).setUp()
+        self.old_size, ingest.object_cache.size = ingest.object_cache.size, 100
+
+    def tearDown(self):
+        super(ObjectCacheTest, self).tearDown()
+        ingest.object_cache.size = self.old_size
+
+    def ingest_thing(self, title):
+        ingest.ingest_feed(feed(('tag:example.com,2010:1',
+            '<a:verb>http://activitystrea.ms/schema/1.0/favorite</a:verb>'
+            '<a:object><id>%s</id><title>%s</title></a:object>' % (self.thing, title))),
+            self.subscription)
+
+    def test_forgotten_on_save(self):
+        self.ingest_thing('Thing')
+        hash = keys.sha1_hex(self.thing)
+        self.assertTrue(hash in ingest.object_cache)
+        models.Object.lookup_by_foreign_id(self.thing).save()
+        self.assertFalse(hash in ingest.object_cache)
+
+    def replace_elsewhere(self, replacement=True):
+        """Delete the stored thing as if another process had, leaving its
+        row in the object cache, and give its id to another object."""
+        hash = keys.sha1_hex(self.thing)
+        row = ingest.object_cache.get(hash)
+        models.Object.lookup_by_foreign_id(self.thing).delete()
+        ingest.object_cache[hash] = row
+        if replacement:
+            models.Object(id=row['id'], foreign_id='tag:example.com,2010:other', name='Other').save()
+        return row['id']
+
+    def assertStoredAgain(self, old_id, name):
+        stored = models.Object.lookup_by_foreign_id(self.thing)
+        self.assertEqual(stored.name, name)
+        self.assertNotEqual(stored.id, old_id)
+        self.assertEqual(models.Activity.objects.get().object, stored)
+
+    def test_changed_after_replaced_elsewhere(self):
+        self.ingest_thing('Thing')
+        old_id = self.replace_elsewhere()
+        self.ingest_thing('Renamed')
+        self.assertStoredAgain(old_id, 'Renamed')
+        self.assertEqual(models.Object.objects.get(id=old_id).name, 'Other')
+
+    def test_unchanged_after_replaced_elsewhere(self):
+        self.ingest_thing('Thing')
+        old_id = self.replace_elsewhere()
+        self.ingest_thing('Thing')
+        self.assertStoredAgain(old_id, 'Thing')
+        self.assertEqual(models.Object.objects.get(id=old_id).name, 'Other')
+
+    def test_unchanged_after_deleted_elsewhere(self):
+        self.ingest_thing('Thing')
+        old_id = self.replace_elsewhere(replacement=False)
+        self.ingest_thing('Thing')
+        stored = models.Object.lookup_by_foreign_id(self.thing)
+        self.assertEqual(models.Activity.objects.get().object, stored)
+
+
+class MergeDuplicatesTest(SubscriptionTestCase):
+
+    def test_merge(self):
+        ingest.ingest_feed(feed(('tag:example.com,2010:1', ''), ('tag:example.com,2010:2', '')),
+            self.subscription)
+        first, second = models.Activity.objects.order_by('id')
+
+        # Store a copy of the first activity as it used to be stored, with
+        # a fraction of a second on its time and the hash that came from it,
+        # and give the second an old hash. (Verbs with the schema prefix
+        # don't fit in the verb column, so they can't have been stored.)
+        copy = models.Activity(verb=first.verb, time=first.time.replace(microsecond=500000),
+            object=first.object, actor=first.actor, subscription=self.subscription, user=self.user)
+        copy.uniq_hash = models.activity_hash(u"\t".join((first.verb, copy.time.isoformat(),
+            first.actor.foreign_id, first.object.foreign_id, '')))
+        self.assertNotEqual(copy.uniq_hash, first.uniq_hash)
+        models.bulk_insert(models.Activity, [copy])
+        copy = models.Activity.objects.get(uniq_hash=copy.uniq_hash)
+        models.TimelineEntry(user=self.user, activity=copy, time=copy.time).save()
+        models.Activity.objects.filter(id=second.id).update(uniq_hash=keys.sha1_hex('old second'))
+
+        self.assertEqual(dedupe.merge_duplicates(dry_run=True), (1, 1))
+        self.assertEqual(models.Activity.objects.count(), 3)
+
+        self.assertEqual(dedupe.merge_duplicates(), (1, 1))
+        self.assertEqual(sorted((id, keys.hex_digest(hash))
+                for id, hash in models.Activity.objects.values_list('id', 'uniq_hash')),
+            [(first.id, first.uniq_hash), (second.id, second.uniq_hash)])
+        self.assertEqual(list(models.TimelineEntry.objects.values_list('activity', flat=True).order_by('activity')),
+            [first.id, second.id])
+
+        self.assertEqual(dedupe.merge_duplicates(), (0, 0))
+
+
+class TimelineTest(SubscriptionTestCase):
+
+    def ingest(self, *ids):
+        return ingest.ingest_feed(feed(*[(id, '') for id in ids]), self.subscription)
+
+    def test_fan_out(self):
+        self.ingest('tag:example.com,2010:1', 'tag:example.com,2010:2')
+        self.assertEqual(sorted(models.TimelineEntry.objects.values_list('user', 'activity', 'time')),
+            sorted((self.user.id, id, time) for id, time in models.Activity.objects.values_list('id', 'time')))
+
+        # Redelivered entries aren't added again.
+        self.ingest('tag:example.com,2010:1', 'tag:example.com,2010:3')
+        self.assertEqual(models.TimelineEntry.objects.count(), 3)
+
+    def test_fan_out_without_user(self):
+        self.subscription.user = None
+        self.subscription.save()
+        self.ingest('tag:example.com,2010:1')
+        self.assertEqual(models.Activity.objects.count(), 1)
+        self.assertEqual(models.TimelineEntry.objects.count(), 0)
+
+    def test_trim(self):
+        self.ingest(*['tag:example.com,2010:%d' % i for i in range(5)])
+        entries = list(models.TimelineEntry.objects.order_by('id').values_list('id', flat=True))
+        start = datetime(2010, 9, 1, 12, 0, 0)
+        for id, minutes in zip(entries, (0, 2, 1, 1, 0)):
+            models.TimelineEntry.objects.filter(id=id).update(time=start + timedelta(minutes=minutes))
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        models.TimelineEntry(user=other, activity_id=entries[0], time=start).save()
+
+        timeline.trim(self.user.id, 10)
+        self.assertEqual(models.TimelineEntry.objects.filter(user=self.user).count(), 5)
+
+        # Of the two entries a minute in, the later one is kept.
+        timeline.trim(self.user.id, 2)
+        self.assertEqual(list(models.TimelineEntry.objects.filter(user=self.user)
+                .order_by('id').values_list('id', flat=True)),
+            [entries[1], entries[3]])
+        self.assertEqual(models.TimelineEntry.objects.filter(user=other).count(), 1)
+
+
+class CardsTest(SubscriptionTestCase):
+
+    author = ('<author><id>tag:example.com,2010:alice</id><name>Alice</name>'
+        '<link rel="preview" type="image/png" href="http://example.com/alice.png"/></author>')
+
+    def setUp(self):
+        super(CardsTest, self).setUp()
+        cache.clear()
+
+    def tearDown(self):
+        super(CardsTest, self).tearDown()
+        cache.clear()
+
+    def ingest(self, name='Alice'):
+        ingest.ingest_feed(feed(('tag:example.com,2010:1', self.author.replace('Alice', name))),
+            self.subscription)
+        return models.Activity.objects.get()
+
+    def render(self, activity):
+        """Render the activity's card the way the activity stream does."""
+        cached = cards.get_cached([activity])
+        if not cached:
+            cached = cards.render([activity])
+        return cached[activity.uniq_hash]
+
+    def test_cached_with_rotation_marker(self):
+        activity = self.ingest()
+        html = self.render(activity)
+        self.assertTrue('Alice' in html)
+        self.assertEqual(html.count(ROTATION_MARKER), 3)
+        self.assertEqual(cards.get_cached([activity]), {activity.uniq_hash: html})
+
+        angles = iter((1.5, -2.0, 0.25))
+        rotated = rotate(html, angles)
+        self.assertFalse(ROTATION_MARKER in rotated)
+        self.assertTrue('rotate(1.5deg)' in rotated and 'rotate(0.25deg)' in rotated)
+
+    def test_forgotten_when_object_updated(self):
+        activity = self.ingest()
+        self.render(activity)
+
+        activity = self.ingest(name='Alicia')
+        self.assertEqual(cards.get_cached([activity]), {})
+        html = self.render(activity)
+        self.assertTrue('Alicia' in html)
+        self.assertFalse('Alice<' in html)
+
+    def test_forget_objects(self):
+        activity = self.ingest()
+        self.render(activity)
+        other = models.Object(foreign_id='tag:example.com,2010:other', name='Other')
+        other.save()
+
+        cards.forget_objects([other.id])
+        self.assertEqual(len(cards.get_cached([activity])), 1)
+        cards.forget_objects([activity.actor_id])
+        self.assertEqual(cards.get_cached([activity]), {})
+
+    def test_template_version_in_key(self):
+        activity = self.ingest()
+        self.render(activity)
+        old_version = cards._template_version
+        try:
+            cards._template_version = 'changed'
+            self.assertEqual(cards.get_cached([activity]), {})
+        finally:
+            cards._template_version = old_version
+
+
+class HashFieldTest(TestCase):
+
+    hash = keys.sha1_hex(u'tag:example.com,2010:caf\xe9')
+
+    def test_hex_digest(self):
+        self.assertEqual(keys.hex_digest(None), None)
+        self.assertEqual(keys.hex_digest(self.hash), self.hash)
+        self.assertEqual(keys.hex_digest(self.hash.decode('hex')), self.hash)
+        self.assertEqual(keys.hex_digest(buffer(self.hash.decode('hex'))), self.hash)
+
+    def test_binary_field(self):
+        field = keys.BinaryHashField()
+        self.assertEqual(field.to_python(self.hash.decode('hex')), self.hash)
+        self.assertEqual(field.to_python(self.hash), self.hash)
+
+    def test_round_trip(self):
+        object = models.Object(foreign_id=u'tag:example.com,2010:caf\xe9')
+        object.save()
+        self.assertEqual(object.foreign_id_hash, self.hash)
+        stored = models.Object.objects.get(foreign_id_hash=self.hash)
+        self.assertEqual(stored.foreign_id_hash, self.hash)
+        self.assertEqual(models.Object.lookup_by_foreign_id(object.foreign_id), stored)
+
+
+class IngestPendingTest(SubscriptionTestCase):
+
+    def pend(self, id, **kwargs):
+        payload = models.PendingPayload(subscription=self.subscription, **kwargs)
+        payload.body = feed((id, '')).getvalue()
+        payload.save()
+        return payload
+
+    def test_ingest(self):
+        self.pend('tag:example.com,2010:1')
+        self.pend('tag:example.com,2010:2')
+        tasks.ingest_pending(self.subscription.pk)
+        self.assertEqual(models.Activity.objects.count(), 2)
+        self.assertEqual(models.PendingPayload.objects.count(), 0)
+
+    def test_claimed_payloads_are_left_alone(self):
+        self.pend('tag:example.com,2010:1', claimed='other', claimed_at=datetime.now())
+        self.pend('tag:example.com,2010:2')
+        tasks.ingest_pending(self.subscription.pk)
+        self.assertEqual(models.Activity.objects.count(), 1)
+        self.assertEqual(models.PendingPayload.objects.get().claimed, 'other')
+
+    def test_stale_claims_are_taken_over(self):
+        self.pend('tag:example.com,2010:1', claimed='dead', claimed_at=datetime.now() - timedelta(days=1))
+        tasks.ingest_pending(self.subscription.pk)
+        self.assertEqual(models.Activity.objects.count(), 1)
+        self.assertEqual(models.PendingPayload.objects.count(), 0)
+
+    def test_failed_ingest_keeps_payloads(self):
+        self.pend('tag:example.com,2010:1')
+        def fail(*args, **kwargs):
+            raise ValueError("Oops")
+        upsert_activities, ingest.upsert_activities = ingest.upsert_activities, fail
+        try:
+            self.assertRaises(ValueError, tasks.ingest_pending, self.subscription.pk)
+        finally:
+            ingest.upsert_activities = upsert_activities
+        self.assertEqual(models.PendingPayload.objects.get().claimed, None)
+
+
+class PollHostTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.disconnect(models.subscribe, sender=models.Subscription)
+        user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.subscriptions = []
+        for i in range(3):
+            subscription = models.Subscription(topic_url='http://example.com/feed/%d' % i,
+                user=user, mode='poll')
+            subscription.save()
+            self.subscriptions.append(subscription)
+
+    def tearDown(self):
+        signals.post_save.connect(models.subscribe, sender=models.Subscription)
+
+    def test_errors_dont_stop_the_host(self):
+        def poll_subscription(subscription, http):
+            if subscription.topic_url.endswith('/0'):
+                raise ValueError("Oops")
+            return 1
+        old_poll_subscription, poller.poll_subscription = poller.poll_subscription, poll_subscription
+        try:
+            results = poller.poll_host(self.subscriptions)
+        finally:
+            poller.poll_subscription = old_poll_subscription
+
+        first, second, third = [subscription.pk for subscription in self.subscriptions]
+        self.assertEqual(results, {first: None, second: 1, third: 1})
+        for subscription in models.Subscription.objects.all():
+            self.assertTrue(subscription.next_poll > datetime.now())
+
+
+class RenewLeasesTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.disconnect(models.subscribe, sender=models.Subscription)
+        user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.subscription = models.Subscription(topic_url='http://example.com/feed',
+            user=user, mode='push')
+        self.subscription.save()
+
+    def tearDown(self):
+        signals.post_save.connect(models.subscribe, sender=models.Subscription)
+
+    def test_subscription_without_hub(self):
+        renewed = []
+        def renew_host(subscriptions):
+            renewed.extend(subscription.hub_url for subscription in subscriptions)
+            return dict((subscription.pk, True) for subscription in subscriptions)
+        old_renew_host, leases.renew_host = leases.renew_host, renew_host
+        try:
+            results = leases.renew_leases([self.subscription], workers=1)
+        finally:
+            leases.renew_host = old_renew_host
+
+        self.assertEqual(results, {self.subscription.pk: True})
+        self.assertEqual(renewed, [discovery.default_hub()])
+        subscription = models.Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(subscription.hub_url, discovery.default_hub())
+
+
+class SubscribeTest(SubscriptionTestCase):
+
+    def setUp(self):
+        super(SubscribeTest, self).setUp()
+        cache.clear()
+
+        self.hubs = []
+        self.fetched = []
+        test = self
+
+        class Http(object):
+            def request(self, uri):
+                test.fetched.append(uri)
+                return httplib2.Response({'status': '200'}), feed().getvalue()
+
+        def request_subscription(http, hub_url, topic_url, sub_pk):
+            self.hubs.append(hub_url)
+            return True
+
+        self.old_http, tasks.httplib2.Http = tasks.httplib2.Http, Http
+        self.old_request, leases.request_subscription = leases.request_subscription, request_subscription
+
+    def tearDown(self):
+        super(SubscribeTest, self).tearDown()
+        tasks.httplib2.Http = self.old_http
+        leases.request_subscription = self.old_request
+        cache.clear()
+
+    def subscribe(self, seed):
+        old_seed = getattr(settings, 'AGGREGATOR_SEED_ON_SUBSCRIBE', True)
+        settings.AGGREGATOR_SEED_ON_SUBSCRIBE = seed
+        try:
+            tasks.subscribe(self.subscription.topic_url, self.subscription.pk)
+        finally:
+            settings.AGGREGATOR_SEED_ON_SUBSCRIBE = old_seed
+
+    def test_cached_hub_without_seeding(self):
+        discovery.remember_hub('http://example.com/other', 'http://hub.example.com/')
+        self.subscribe(seed=False)
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(self.hubs, ['http://hub.example.com/'])
+
+    def test_feed_without_hub_uses_default(self):
+        discovery.remember_hub('http://example.com/other', 'http://hub.example.com/')
+        self.subscribe(seed=True)
+        self.assertEqual(self.fetched, [self.subscription.topic_url])
+        self.assertEqual(self.hubs, [discovery.default_hub()])
+        subscription = models.Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(subscription.hub_url, discovery.default_hub())
+
+
+class KeysetPageTest(TestCase):
+
+    def setUp(self):
+        start = datetime(2010, 9, 1, 12, 0, 0)
+        for i in range(3):
+            models.Object(name='Object %d' % i, time=start + timedelta(minutes=i)).save()
+
+    def test_empty_page_links_back(self):
+        objects = models.Object.objects.all()
+        oldest = views.make_cursor(objects.order_by('time')[0])
+        self.assertEqual(views.keyset_page(objects, before=oldest), ([], None, oldest))
+        newest = views.make_cursor(objects.order_by('-time')[0])
+        self.assertEqual(views.keyset_page(objects, after=newest), ([], newest, None))
+
+
+class IngestQueriesTest(SubscriptionTestCase):
+
+    # The seen filter would skip some of the queries.
+    seen_filter = False
+
+    def entries(self, count):
+        return [('tag:example.com,2010:%d' % i,
+            '<a:verb>http://activitystrea.ms/schema/1.0/favorite</a:verb>'
+            '<a:object><id>tag:example.com,2010:thing-%d</id><title>Thing</title></a:object>' % i)
+            for i in range(count)]
+
+    def test_constant_queries(self):
+        # Look up the objects, insert them and find their ids, look up the
+        # activities, insert them and find their ids, and add them to the
+        # timeline: the same for any number of new entries.
+        self.assertNumQueries(7, ingest.ingest_feed, feed(*self.entries(10)), self.subscription)
+        entries = self.entries(60)[10:]
+        self.assertNumQueries(7, ingest.ingest_feed, feed(*entries), self.subscription)
+        self.assertEqual(models.Activity.objects.count(), 60)
+        # Redelivered entries only need looking up.
+        self.assertNumQueries(2, ingest.ingest_feed, feed(*entries), self.subscription)
+
+
+class BloomFilterTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'seen.bloom')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def key(self, n):
+        return keys.sha1_hex('key %d' % n)
+
+    def test_add_and_contains(self):
+        bloom = BloomFilter(100, 0.001)
+        for n in range(50):
+            bloom.add(self.key(n))
+        for n in range(50):
+            self.assertTrue(self.key(n) in bloom)
+        # False positives are possible, but not for most keys.
+        self.assertTrue(sum(self.key(n) in bloom for n in range(50, 1050)) < 50)
+
+    def test_merge(self):
+        first, second = BloomFilter(100, 0.001), BloomFilter(100, 0.001)
+        first.add(self.key(1))
+        second.add(self.key(2))
+        second.primed = True
+        first.merge(second)
+        self.assertTrue(self.key(1) in first)
+        self.assertTrue(self.key(2) in first)
+        self.assertTrue(first.primed)
+        self.assertRaises(ValueError, first.merge, BloomFilter(1000, 0.001))
+
+    def test_save_and_load(self):
+        bloom = BloomFilter(100, 0.001)
+        bloom.add(self.key(1))
+        bloom.primed = True
+        bloom.save(self.path)
+
+        loaded = BloomFilter.load(self.path)
+        self.assertEqual((loaded.bits, loaded.hashes), (bloom.bits, bloom.hashes))
+        self.assertEqual(loaded.array, bloom.array)
+        self.assertTrue(loaded.primed)
+        self.assertTrue(self.key(1) in loaded)
+
+    def test_truncated_file(self):
+        bloom = BloomFilter(100, 0.001)
+        bloom.save(self.path)
+        f = open(self.path, 'r+b')
+        try:
+            f.truncate(os.path.getsize(self.path) - 1)
+        finally:
+            f.close()
+        self.assertRaises(ValueError, BloomFilter.load, self.path)
+
+
+class SeenFilterTest(SubscriptionTestCase):
+
+    seen_filter = True
+
+    def setUp(self):
+        super(SeenFilterTest, self).setUp()
+        self.old_path = getattr(settings, 'AGGREGATOR_SEEN_FILTER_FILE', None)
+        settings.AGGREGATOR_SEEN_FILTER_FILE = None
+        self.old_capacity = getattr(settings, 'AGGREGATOR_SEEN_FILTER_CAPACITY', 1000000)
+        settings.AGGREGATOR_SEEN_FILTER_CAPACITY = 1000
+
+    def tearDown(self):
+        super(SeenFilterTest, self).tearDown()
+        settings.AGGREGATOR_SEEN_FILTER_FILE = self.old_path
+        settings.AGGREGATOR_SEEN_FILTER_CAPACITY = self.old_capacity
+
+    def prime_empty(self):
+        """Give the process a primed filter that has none of the stored
+        activities, as if another process stored them."""
+        bloom = seen.get_filter()
+        bloom.array = bytearray(len(bloom.array))
+        bloom.primed = True
+
+    def test_definitely_new(self):
+        hashes = [keys.sha1_hex('activity %d' % n) for n in range(3)]
+        bloom = seen.get_filter()
+        bloom.add(hashes[0])
+        # An unprimed filter can't tell what's stored.
+        self.assertEqual(seen.definitely_new(hashes), set())
+        bloom.primed = True
+        self.assertEqual(seen.definitely_new(hashes), set(hashes[1:]))
+
+    def test_unchanged_entries_are_skipped(self):
+        entry = ('tag:example.com,2010:1', '')
+        self.assertEqual(ingest.ingest_feed(feed(entry), self.subscription), 1)
+        self.assertNumQueries(0, ingest.ingest_feed, feed(entry), self.subscription)
+        self.assertEqual(seen.stats['unchanged'], 1)
+
+    def test_collision(self):
+        entry = ('tag:example.com,2010:1', '')
+        ingest.ingest_feed(feed(entry), self.subscription)
+        self.prime_empty()
+        self.assertEqual(ingest.ingest_feed(feed(entry), self.subscription), 0)
+        self.assertEqual(seen.stats['trusted_new'], 1)
+        self.assertEqual(seen.stats['collisions'], 1)
+        self.assertEqual(models.Activity.objects.count(), 1)
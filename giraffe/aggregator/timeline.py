@@ -0,0 +1,92 @@
+"""
+Per-user timelines of activities.
+
+As activities are ingested they're fanned out into a `TimelineEntry` for
+each user subscribed to their source. Timelines are trimmed to the newest
+`AGGREGATOR_TIMELINE_LENGTH` entries, and can be rebuilt from the existing
+activities with the `backfilltimeline` management command.
+
+"""
+
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+
+from giraffe.aggregator import models
+
+
+log = logging.getLogger(__name__)
+
+
+def timeline_length():
+    return getattr(settings, 'AGGREGATOR_TIMELINE_LENGTH', 1000)
+
+
+def subscribed_user_ids(subscription):
+    if subscription.user_id is None:
+        return []
+    return [subscription.user_id]
+
+
+def fan_out(activities, subscription):
+    """Add the given newly saved activities of `subscription` to the
+    timelines of its subscribers."""
+    user_ids = subscribed_user_ids(subscription)
+    if not user_ids or not activities:
+        return
+
+    entries = [models.TimelineEntry(user_id=user_id, activity_id=activity.id, time=activity.time)
+        for activity in activities for user_id in user_ids]
+    models.bulk_insert(models.TimelineEntry, entries)
+
+
+def backfill(chunk_size=1000):
+    """Add every existing activity to its user's timeline, if it isn't there
+    already.
+
+    Returns the number of entries created.
+
+    """
+    created = 0
+    last_id = 0
+    while True:
+        chunk = models.Activity.objects.filter(id__gt=last_id, user__isnull=False)
+        chunk = list(chunk.order_by('id').values_list('id', 'user', 'time')[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        existing = models.TimelineEntry.objects.filter(activity__in=[row[0] for row in chunk])
+        existing = set(existing.values_list('user', 'activity'))
+        entries = [models.TimelineEntry(user_id=user_id, activity_id=activity_id, time=time)
+            for activity_id, user_id, time in chunk if (user_id, activity_id) not in existing]
+        models.bulk_insert(models.TimelineEntry, entries)
+        created += len(entries)
+
+    log.debug("Backfilled %d timeline entries", created)
+    return created
+
+
+def trim(user_id, length=None):
+    """Delete all but the newest `length` entries of the user's timeline."""
+    if length is None:
+        length = timeline_length()
+    if length < 1:
+        return
+
+    entries = models.TimelineEntry.objects.filter(user=user_id).order_by('-time', '-id')
+    try:
+        oldest_kept = entries.values_list('time', 'id')[length - 1]
+    except IndexError:
+        return
+
+    time, id = oldest_kept
+    models.TimelineEntry.objects.filter(user=user_id).filter(
+        Q(time__lt=time) | Q(time=time, id__lt=id)).delete()
+
+
+def trim_all(length=None):
+    user_ids = models.TimelineEntry.objects.values_list('user', flat=True).distinct()
+    for user_id in user_ids:
+        trim(user_id, length)
@@ -0,0 +1,29 @@
+"""
+Opt-in tracing of how activities are identified and saved.
+
+Trace messages go to the `giraffe.aggregator.trace` logger at DEBUG, so
+they cost next to nothing unless that logger is enabled. Even then, only
+`AGGREGATOR_TRACE_SAMPLE_RATE` of them (a fraction between 0 and 1) are
+logged, so tracing can be left on under real ingest load. The values worth
+looking at are attached to each record as fields (`activity_key`,
+`uniq_hash` and so on), for structured log handlers to pick up.
+
+"""
+
+import logging
+import random
+
+from django.conf import settings
+
+
+log = logging.getLogger('giraffe.aggregator.trace')
+
+
+def trace(message, *args, **fields):
+    """Log `message % args` at DEBUG with the given extra `fields`, if
+    tracing is enabled and this message is sampled."""
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= getattr(settings, 'AGGREGATOR_TRACE_SAMPLE_RATE', 0.01):
+        return
+    log.debug(message, *args, extra=fields)
@@ -1,7 +1,10 @@
-import xml.etree.ElementTree as etree
+from cStringIO import StringIO
+from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.db.models import Q
+from django.http import HttpResponse, Http404
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 try:
@@ -9,16 +12,97 @@ try:
 except ImportError:
     from django.contrib.csrf.middleware import csrf_exempt
 
-from giraffe.aggregator import models
-import giraffe.aggregator.activitystreams.atom as as_atom
+from giraffe.aggregator import cards, ingest, leases, models, tasks
+
+
+PAGE_SIZE = 50
+CURSOR_FORMAT = '%Y%m%dT%H%M%S.%f'
+
+
+def make_cursor(item):
+    return '%s_%d' % (item.time.strftime(CURSOR_FORMAT), item.id)
+
+
+def parse_cursor(cursor):
+    try:
+        time, id = cursor.split('_')
+        return datetime.strptime(time, CURSOR_FORMAT), int(id)
+    except ValueError:
+        raise Http404
+
+
+def keyset_page(queryset, before=None, after=None, size=PAGE_SIZE):
+    """Return one page of `queryset`, newest first, along with cursors for the
+    pages of older and newer items (or None if there aren't any). An empty
+    page links back with the cursor it was asked for.
+
+    Pages are found by their position in (time, id) order rather than by
+    offset, so deep pages cost the same as the first one.
+
+    """
+    if after is not None:
+        time, id = parse_cursor(after)
+        queryset = queryset.filter(Q(time__gt=time) | Q(time=time, id__gt=id))
+        items = list(queryset.order_by('time', 'id')[:size + 1])
+        has_newer, has_older = len(items) > size, True
+        items = items[:size]
+        items.reverse()
+    else:
+        if before is not None:
+            time, id = parse_cursor(before)
+            queryset = queryset.filter(Q(time__lt=time) | Q(time=time, id__lt=id))
+        items = list(queryset.order_by('-time', '-id')[:size + 1])
+        has_newer, has_older = before is not None, len(items) > size
+        items = items[:size]
+
+    if not items:
+        # Let the reader go back the way they came.
+        return items, after, before
+    older = make_cursor(items[-1]) if has_older else None
+    newer = make_cursor(items[0]) if has_newer else None
+    return items, older, newer
+
+
+def hydrate_activities(activities):
+    """Load all the objects the given activities refer to in one query, so
+    rendering them doesn't take a query per relation."""
+    fields = [models.Activity._meta.get_field(name) for name in ('actor', 'object', 'target')]
+
+    ids = set()
+    for activity in activities:
+        for field in fields:
+            id = getattr(activity, field.attname)
+            if id is not None:
+                ids.add(id)
+    objects = models.Object.objects.in_bulk(list(ids))
+
+    for activity in activities:
+        for field in fields:
+            id = getattr(activity, field.attname)
+            if id in objects:
+                setattr(activity, field.get_cache_name(), objects[id])
 
 
 @login_required
 def activity_stream(request):
-    activities = models.Activity.objects.order_by('-time')[:50]
+    before, after = request.GET.get('before'), request.GET.get('after')
+    if getattr(settings, 'AGGREGATOR_TIMELINES', False):
+        entries = models.TimelineEntry.objects.filter(user=request.user).select_related('activity')
+        entries, older, newer = keyset_page(entries, before=before, after=after)
+        activities = [entry.activity for entry in entries]
+    else:
+        activities, older, newer = keyset_page(models.Activity.objects.all(),
+            before=before, after=after)
+
+    cached = cards.get_cached(activities)
+    missing = [activity for activity in activities if activity.uniq_hash not in cached]
+    hydrate_activities(missing)
+    cached.update(cards.render(missing))
 
     data = {
-        'activities': activities,
+        'cards': [cached[activity.uniq_hash] for activity in activities],
+        'older': older,
+        'newer': newer,
     }
 
     template = 'aggregator/index.html'
@@ -34,53 +118,17 @@ def callback(request, sub_pk):
     if method == "POST":
         feed_str = request.raw_post_data
 
-        et = etree.fromstring(feed_str)
-        activities = as_atom.make_activities_from_feed(et)
-
-        for as_activity in activities:
-
-            as_object = as_activity.object
-            as_actor = as_activity.actor
-            as_target = as_activity.target
-            time = as_activity.time
-            verb = as_activity.verb
-
-            object = as_object_as_object(as_object)
-            actor = as_object_as_object(as_actor)
-            target = as_object_as_object(as_target)
-
-            activity = None
-
-            try:
-                activity = models.Activity.lookup_by_as_activity(as_activity)
-                logging.debug("Loaded activity %r", activity.id)
-            except models.Activity.DoesNotExist:
-                pass
-
-            import logging
-
-            if activity is None:
-                logging.debug("Making a new activity")
-                activity = models.Activity()
+        if getattr(settings, 'AGGREGATOR_INGEST_MODE', 'sync') == 'deferred':
+            # Let the hub go as soon as we have the payload safely stored.
+            payload = models.PendingPayload(subscription=subscription)
+            payload.body = feed_str
+            payload.save()
+            tasks.ingest_pending.delay(subscription.pk)
+            return HttpResponse("THANKS!", status=202)
 
-            if verb is not None:
-                verb = verb.replace("http://activitystrea.ms/schema/1.0/", "", 1)
-            else:
-                verb = ''
+        ingest.ingest_feed(StringIO(feed_str), subscription)
 
-            activity.object = object
-            activity.actor = actor
-            activity.target = target
-            activity.time = time
-            activity.verb = verb
-            activity.subscription = subscription
-
-            if subscription.user is not None:
-                activity.user = subscription.user
-
-            activity.save()
-
-            return HttpResponse("THANKS!")
+        return HttpResponse("THANKS!")
 
     else:
         requested_topic_url = request.GET["hub.topic"]
@@ -89,51 +137,7 @@ def callback(request, sub_pk):
             return HttpResponse("WRONG!", status=400, content_type="text/plain")
 
         subscription.mode = "push"
+        leases.record_lease(subscription, request.GET.get("hub.lease_seconds"))
         subscription.save()
 
         return HttpResponse(request.GET["hub.challenge"])
-
-
-
-def as_object_as_object(as_object):
-
-    if as_object is None:
-        return None
-
-    foreign_id = as_object.id
-
-    object = None
-
-    if foreign_id:
-        try:
-            object = models.Object.lookup_by_foreign_id(foreign_id)
-        except models.Object.DoesNotExist:
-            pass
-
-    if object is None:
-        object = models.Object()
-
-    object_type = as_object.object_type
-    if object_type is not None:
-        object_type = object_type.replace("http://activitystrea.ms/schema/1.0/", "", 1)
-    else:
-        object_type = ''
-
-    object.foreign_id = foreign_id
-    object.name = as_object.name
-    object.permalink_url = as_object.url
-    object.summary = as_object.summary
-    object.object_type = object_type
-
-    if as_object.image is not None:
-        object.image_url = as_object.image.url
-        object.image_width = as_object.image.width
-        object.image_height = as_object.image.height
-
-    if as_object.in_reply_to_object is not None:
-        object.in_reply_to = as_object_as_object(as_object.in_reply_to_object)
-
-    object.save()
-
-    return object
-
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from giraffe.publisher.models import Asset, Subscription
+from giraffe.publisher.models import Asset, DeadLetter, Subscription
 
 
 class AssetAdmin(admin.ModelAdmin):
@@ -13,3 +13,12 @@ class AssetAdmin(admin.ModelAdmin):
 
 admin.site.register(Asset, AssetAdmin)
 admin.site.register(Subscription)
+
+
+class DeadLetterAdmin(admin.ModelAdmin):
+
+    list_display = ('callback', 'asset', 'attempts', 'created')
+    search_fields = ('callback', 'error')
+
+
+admin.site.register(DeadLetter, DeadLetterAdmin)
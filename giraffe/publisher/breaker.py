@@ -0,0 +1,163 @@
+"""
+A circuit breaker for each subscriber's callback host.
+
+While a host is up its circuit is closed, and requests to it are made as
+usual. After `PUBLISHER_BREAKER_THRESHOLD` requests to it in a row fail
+(with a connection error, timeout or server error), its circuit opens, and
+the tasks that would contact it are parked in the database instead of
+tying up workers waiting for it.
+
+After `PUBLISHER_BREAKER_RESET` seconds the circuit is half open: the next
+request is let through as a trial. If it succeeds the circuit closes and
+the host's parked tasks are queued again; if it fails the circuit opens
+for another `PUBLISHER_BREAKER_RESET` seconds. The unpark_deliveries
+periodic task sends a parked task as the trial for hosts nothing else is
+contacting.
+
+Circuit states are kept in Django's cache, so all the workers share them.
+
+"""
+
+import logging
+import time
+
+from celery.registry import tasks as task_registry
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import simplejson as json
+
+from giraffe.publisher import models
+
+
+log = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def threshold():
+    return getattr(settings, 'PUBLISHER_BREAKER_THRESHOLD', 5)
+
+
+def reset_timeout():
+    return getattr(settings, 'PUBLISHER_BREAKER_RESET', 300)
+
+
+def _key(kind, host):
+    return 'publisher:breaker:%s:%s' % (kind, host)
+
+
+def _state_timeout():
+    # Long enough that an open circuit isn't forgotten before its trial.
+    return reset_timeout() * 10
+
+
+def state(host):
+    opened = cache.get(_key('opened', host))
+    if opened is None:
+        return CLOSED
+    if time.time() - opened < reset_timeout():
+        return OPEN
+    return HALF_OPEN
+
+
+def allow(host):
+    """Return whether a request to `host` may be made now. Only one request
+    at a time is let through a half open circuit."""
+    current = state(host)
+    if current == CLOSED:
+        return True
+    if current == OPEN:
+        return False
+    # If the trial never reports back, allow another after a while.
+    return cache.add(_key('trial', host), True, reset_timeout())
+
+
+def cancel_trial(host):
+    """Let another request through a half open circuit, as the one that
+    was allowed through wasn't made after all."""
+    cache.delete(_key('trial', host))
+
+
+def open_circuit(host):
+    log.warning("Opening the circuit for callback host %s", host)
+    cache.set(_key('opened', host), time.time(), _state_timeout())
+    cache.delete(_key('failures', host))
+    cache.delete(_key('trial', host))
+
+
+def record_failure(host):
+    current = state(host)
+    if current == OPEN:
+        return
+    if current == HALF_OPEN:
+        # The trial failed.
+        open_circuit(host)
+        return
+
+    key = _key('failures', host)
+    cache.add(key, 0, reset_timeout())
+    try:
+        failures = cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, reset_timeout())
+        failures = 1
+    if failures >= threshold():
+        open_circuit(host)
+
+
+def record_success(host):
+    if state(host) == CLOSED:
+        cache.delete(_key('failures', host))
+        return
+
+    log.info("Closing the circuit for callback host %s", host)
+    cache.delete(_key('opened', host))
+    cache.delete(_key('failures', host))
+    cache.delete(_key('trial', host))
+    unpark(host)
+
+
+def park(host, task, args, kwargs):
+    """Keep the call of `task` with the given arguments until the circuit
+    for `host` closes. The arguments are stored as plain JSON, so they
+    mustn't include subscribers' secrets."""
+    log.debug("Parking %s for callback host %s", task.name, host)
+    models.ParkedTask(host=host, task=task.name,
+        arguments=json.dumps({'args': list(args), 'kwargs': kwargs})).save()
+
+
+def _queue(parked):
+    arguments = json.loads(parked.arguments)
+    kwargs = dict((str(name), value) for name, value in arguments['kwargs'].iteritems())
+    # Delete it first, so a task that parks itself again isn't deleted.
+    parked.delete()
+    task_registry[parked.task].apply_async(args=arguments['args'], kwargs=kwargs)
+
+
+def unpark(host, limit=None):
+    """Queue the tasks parked for `host` again. Returns how many there
+    were."""
+    parked = models.ParkedTask.objects.filter(host=host).order_by('id')
+    if limit is not None:
+        parked = parked[:limit]
+    parked = list(parked)
+    for parked_task in parked:
+        _queue(parked_task)
+    log.debug("Unparked %d tasks for callback host %s", len(parked), host)
+    return len(parked)
+
+
+def unpark_due():
+    """Queue parked tasks whose hosts' circuits aren't open: all of them if
+    the circuit has closed, or one as the trial if it's half open."""
+    hosts = models.ParkedTask.objects.values_list('host', flat=True).distinct()
+    for host in hosts:
+        current = state(host)
+        if current == CLOSED:
+            unpark(host)
+        elif current == HALF_OPEN:
+            unpark(host, limit=1)
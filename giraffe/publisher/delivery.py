@@ -0,0 +1,244 @@
+"""
+Delivers hub notifications to subscribers' callbacks.
+
+Each worker process keeps a pool of `httplib2.Http` objects for every
+callback host, so deliveries to the same host reuse their keep-alive
+connections. Requests time out after `PUBLISHER_DELIVERY_TIMEOUT` seconds.
+
+No more than `PUBLISHER_DELIVERY_HOST_LIMIT` deliveries to one host are made
+at once across all the workers, counted in Django's cache; `deliver` raises
+`HostBusy` rather than wait for one to finish. Hosts that keep failing are
+cut off for a while by `giraffe.publisher.breaker`.
+
+Failed deliveries are retried by `tasks.ping_subscriber` up to
+`PUBLISHER_DELIVERY_ATTEMPTS` times, waiting `backoff` seconds between
+attempts. Notifications that still can't be delivered are kept as
+`DeadLetter`s, to be replayed by the replaydeadletters command.
+
+"""
+
+import logging
+import random
+import socket
+import threading
+from urlparse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+import httplib2
+
+from giraffe.publisher import breaker, models, tasks
+
+
+log = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def timeout():
+    return _setting('PUBLISHER_DELIVERY_TIMEOUT', 10)
+
+
+def max_attempts():
+    return _setting('PUBLISHER_DELIVERY_ATTEMPTS', 6)
+
+
+def host_limit():
+    return _setting('PUBLISHER_DELIVERY_HOST_LIMIT', 4)
+
+
+class DeliveryError(Exception):
+
+    """A notification couldn't be delivered. If `retry` is false, trying
+    again won't help."""
+
+    def __init__(self, message, retry=True):
+        Exception.__init__(self, message)
+        self.retry = retry
+
+
+class HostBusy(Exception):
+    pass
+
+
+class HttpPool(object):
+
+    """Idle `httplib2.Http` objects for each host, so a worker's deliveries
+    to the same host can reuse their connections."""
+
+    def __init__(self):
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(host)
+            if idle:
+                return idle.pop()
+        finally:
+            self.lock.release()
+        return httplib2.Http(timeout=timeout())
+
+    def put(self, host, http):
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault(host, [])
+            if len(idle) < host_limit():
+                idle.append(http)
+                return
+        finally:
+            self.lock.release()
+        close(http)
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            idle, self.idle = self.idle, {}
+        finally:
+            self.lock.release()
+        for https in idle.itervalues():
+            for http in https:
+                close(http)
+
+
+def close(http):
+    for connection in http.connections.values():
+        connection.close()
+    http.connections.clear()
+
+
+pool = HttpPool()
+
+
+def callback_host(callback):
+    return urlsplit(callback)[1].lower()
+
+
+def _busy_key(host):
+    return 'publisher:delivery:busy:%s' % host
+
+
+def acquire_host(host):
+    """Claim one of the host's delivery slots, returning whether there was
+    one free."""
+    key = _busy_key(host)
+    # Don't let a worker that died mid-delivery hold its slot forever.
+    expiry = timeout() * 3
+    cache.add(key, 0, expiry)
+    try:
+        busy = cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, expiry)
+        busy = 1
+    if busy > host_limit():
+        release_host(host)
+        return False
+    return True
+
+
+def release_host(host):
+    try:
+        cache.decr(_busy_key(host))
+    except ValueError:
+        pass
+
+
+def backoff(attempt):
+    """Return how many seconds to wait before retrying a delivery that has
+    failed `attempt + 1` times: exponentially longer each time up to a cap,
+    of which a random half, so retries to a host that failed all at once
+    don't come back all at once."""
+    delay = min(_setting('PUBLISHER_DELIVERY_MAX_BACKOFF', 3600),
+        _setting('PUBLISHER_DELIVERY_BACKOFF', 30) * 2 ** attempt)
+    return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+
+def busy_delay():
+    """Return how many seconds to wait before trying a host that was too
+    busy again."""
+    return random.uniform(1, 5)
+
+
+def request(uri, method='GET', body=None, headers=None):
+    """Make a request to a subscriber's callback, using a pooled connection
+    to its host, and return the `(response, content)` pair.
+
+    Raises `breaker.CircuitOpen` if the host's circuit is open, `HostBusy`
+    if it has no free delivery slots, or `DeliveryError` if it couldn't be
+    reached.
+
+    """
+    host = callback_host(uri)
+    if not breaker.allow(host):
+        raise breaker.CircuitOpen(host)
+    if not acquire_host(host):
+        breaker.cancel_trial(host)
+        raise HostBusy(host)
+    try:
+        http = pool.get(host)
+        try:
+            resp, content = http.request(uri=uri, method=method, body=body, headers=headers)
+        except (socket.error, httplib2.HttpLib2Error), exc:
+            close(http)
+            breaker.record_failure(host)
+            raise DeliveryError('%s: %s' % (type(exc).__name__, str(exc)))
+        pool.put(host, http)
+    finally:
+        release_host(host)
+
+    if resp.status >= 500:
+        breaker.record_failure(host)
+    else:
+        breaker.record_success(host)
+    return resp, content
+
+
+def deliver(callback, body, headers):
+    """POST the notification `body` to `callback`.
+
+    Raises the exceptions `request` does, or `DeliveryError` if the
+    subscriber didn't accept the notification.
+
+    """
+    resp, content = request(callback, method='POST', body=body, headers=headers)
+    if 200 <= resp.status < 300:
+        return
+    message = 'HTTP response %d %s' % (resp.status, resp.reason)
+    # Other client errors mean the subscriber doesn't want the notification.
+    retry = resp.status >= 500 or resp.status in (408, 429)
+    raise DeliveryError(message, retry=retry)
+
+
+def dead_letter(callback, asset_pk, topic, attempts, error):
+    log.warning("Giving up notifying subscriber %r about asset %r after %d attempts: %s",
+        callback, asset_pk, attempts, error)
+    models.DeadLetter(callback=callback, asset_id=asset_pk, topic=topic or '',
+        attempts=attempts, error=error).save()
+
+
+def replay(dead_letters):
+    """Queue the given dead letters for delivery again, and delete them.
+    Returns how many were queued.
+
+    Each is signed with the current secret of its subscription. Letters to
+    subscribers that have since unsubscribed, or whose leases have run out,
+    are deleted without being queued.
+
+    """
+    count = 0
+    for dead_letter in dead_letters:
+        try:
+            subscription = models.Subscription.active(dead_letter.topic).get(
+                callback=dead_letter.callback)
+        except models.Subscription.DoesNotExist:
+            log.info("Dropping the notification to %r about asset %r, as it's no longer subscribed",
+                dead_letter.callback, dead_letter.asset_id)
+        else:
+            tasks.ping_subscriber.delay(dead_letter.callback, dead_letter.asset_id,
+                secret=subscription.secret or None, topic=dead_letter.topic)
+            count += 1
+        dead_letter.delete()
+    return count
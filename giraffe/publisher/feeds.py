@@ -0,0 +1,123 @@
+"""
+The blog's Atom feed, rendered once and kept in Django's cache.
+
+Subscribers poll the feed far more often than assets change, so the feed's
+body is cached along with its validators, and only rendered again once an
+`Asset` has been saved or deleted. Each change picks a new feed version,
+which is part of the cache key, so a feed rendered from the old assets while
+the change was being made is never served afterwards.
+
+The feed's last modified time is when the last change was made, kept in the
+cache too. As HTTP dates only go down to the second, each change moves it at
+least a second later than the one before, so clients that got the feed
+just before a change don't think they still have it.
+
+"""
+
+import binascii
+import hashlib
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.http import parse_etags, parse_http_date_safe, quote_etag
+
+from giraffe.publisher import models
+
+
+log = logging.getLogger(__name__)
+
+FEED_TEMPLATE = 'publisher/feed.xml'
+FEED_LENGTH = 10
+VERSION_KEY = 'publisher:feed:version'
+MODIFIED_KEY = 'publisher:feed:modified'
+
+
+def cache_timeout():
+    return getattr(settings, 'PUBLISHER_FEED_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def feed_key(version):
+    return 'publisher:feed:%s' % version
+
+
+def new_version():
+    return binascii.hexlify(os.urandom(8))
+
+
+def blog_assets():
+    """Return the public, top level assets by the blogger, newest first."""
+    blogger = User.objects.all().order_by('id')[0].person
+
+    assets = models.Asset.objects.all().order_by('-published')
+    assets = assets.filter(author=blogger)
+    assets = assets.filter(in_reply_to=None)
+    # TODO: get the assets that the user is allowed to see
+    assets = assets.filter(private_to=None)
+    return assets
+
+
+def render(last_modified):
+    """Render the feed, returning a dict of its `body`, `etag` and
+    `last_modified` time in seconds since the epoch."""
+    body = render_to_string(FEED_TEMPLATE, {
+        'assets': blog_assets()[:FEED_LENGTH],
+    }).encode('utf-8')
+    return {
+        'body': body,
+        'etag': hashlib.sha1(body).hexdigest(),
+        'last_modified': last_modified,
+    }
+
+
+def _get_or_add(key, default):
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, default, cache_timeout())
+        value = cache.get(key)
+    return value
+
+
+def get_feed():
+    """Return the cached feed, rendering it if it isn't cached."""
+    version = _get_or_add(VERSION_KEY, new_version())
+
+    key = feed_key(version)
+    feed = cache.get(key)
+    if feed is None:
+        log.debug("Rendering feed version %s", version)
+        feed = render(_get_or_add(MODIFIED_KEY, int(time.time())))
+        cache.set(key, feed, cache_timeout())
+    return feed
+
+
+def forget_feed():
+    """Stop serving the cached feed, since an asset has changed."""
+    previous = cache.get(MODIFIED_KEY) or 0
+    cache.set(MODIFIED_KEY, max(previous + 1, int(time.time())), cache_timeout())
+    cache.set(VERSION_KEY, new_version(), cache_timeout())
+
+
+def is_not_modified(request, feed):
+    """Return whether the conditional headers of `request` show the client
+    already has `feed`."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return feed['etag'] in etags or '*' in etags
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        since = parse_http_date_safe(if_modified_since.split(';')[0].strip())
+        return since is not None and feed['last_modified'] <= since
+
+    return False
+
+
+def etag_header(feed):
+    return quote_etag(feed['etag'])
+
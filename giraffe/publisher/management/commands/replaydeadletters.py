@@ -0,0 +1,31 @@
+from optparse import make_option
+
+import django.core.management.base
+
+from giraffe.publisher import delivery, models
+
+
+class Command(django.core.management.base.BaseCommand):
+    help = 'Queues the notifications that could not be delivered to subscribers for delivery again.'
+    option_list = django.core.management.base.BaseCommand.option_list + (
+        make_option('--host', dest='host', default=None,
+            help="Only replay notifications to callbacks on this host"),
+        make_option('--asset', dest='asset', type='int', default=None,
+            help="Only replay notifications about the asset with this id"),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help="Only count the notifications that would be replayed"),
+    )
+
+    def handle(self, *args, **options):
+        dead_letters = models.DeadLetter.objects.all().order_by('id')
+        if options['asset'] is not None:
+            dead_letters = dead_letters.filter(asset=options['asset'])
+        if options['host'] is not None:
+            host = options['host'].lower()
+            dead_letters = [dead_letter for dead_letter in dead_letters
+                if delivery.callback_host(dead_letter.callback) == host]
+
+        if options['dry_run']:
+            print "Would replay %d notifications" % len(dead_letters)
+            return
+        print "Replayed %d notifications" % delivery.replay(dead_letters)
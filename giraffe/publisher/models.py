@@ -99,15 +99,66 @@ class Asset(models.Model):
 class Subscription(models.Model):
 
     callback = models.CharField(max_length=200)
-    topic = models.CharField(max_length=200)
+    topic = models.CharField(max_length=200, db_index=True)
     secret = models.CharField(max_length=200, blank=True)
     user = models.ForeignKey(User, blank=True, null=True)
-    lease_until = models.DateTimeField(blank=True, null=True)
+    lease_until = models.DateTimeField(blank=True, null=True, db_index=True)
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = (('callback', 'topic'),)
 
+    @classmethod
+    def active(cls, topic):
+        """Return the subscriptions to `topic` whose leases haven't run
+        out."""
+        return cls.objects.filter(topic=topic).filter(
+            models.Q(lease_until=None) | models.Q(lease_until__gte=datetime.now()))
+
+    @classmethod
+    def expired(cls):
+        return cls.objects.filter(lease_until__lt=datetime.now())
+
+
+class DeadLetter(models.Model):
+
+    """A notification that couldn't be delivered to a subscriber, kept so it
+    can be replayed with the replaydeadletters command."""
+
+    callback = models.CharField(max_length=200)
+    asset = models.ForeignKey(Asset, related_name='dead_letters')
+    topic = models.CharField(max_length=200, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class PendingVerification(models.Model):
+
+    """A subscriber's (un)subscription request whose verification is parked
+    while its host's circuit is open. The request is kept here rather than
+    in the parked task's arguments, so its secret is only stored with the
+    other subscriptions' secrets."""
+
+    callback = models.CharField(max_length=200)
+    mode = models.CharField(max_length=20)
+    topic = models.CharField(max_length=200)
+    lease_seconds = models.IntegerField(blank=True, null=True)
+    secret = models.CharField(max_length=200, blank=True)
+    verify_token = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class ParkedTask(models.Model):
+
+    """A task that would contact a callback host whose circuit is open,
+    kept until it closes. See `giraffe.publisher.breaker`."""
+
+    host = models.CharField(max_length=200, db_index=True)
+    task = models.CharField(max_length=200)
+    arguments = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
 
 def merge_asset_authors(sender, person, into_person, **kwargs):
     Asset.objects.filter(author=person).update(author=into_person)
@@ -127,13 +178,17 @@ def ping_subscribers(sender, instance, created, **kwargs):
         return
 
     log = logging.getLogger('.'.join((__name__, 'ping_subscribers')))
-    log.debug("Saw a new asset! Looking for subscribers")
+    log.debug("Saw a new asset! Telling subscribers")
     guess_root = 'http://%s/' % Site.objects.get_current().domain
     feed_url = urljoin(guess_root, reverse('publisher-feed'))
-    subs = Subscription.objects.filter(topic=feed_url)
-
-    log.debug("Posting %d jobs to tell subscribers about the new asset", len(subs))
-    for sub in subs:
-        tasks.ping_subscriber.delay(sub.callback, instance.pk, secret=sub.secret)
+    tasks.notify_subscribers.delay(instance.pk, feed_url)
 
 models.signals.post_save.connect(ping_subscribers, sender=Asset)
+
+
+def forget_feed(sender, instance, **kwargs):
+    from giraffe.publisher import feeds
+    feeds.forget_feed()
+
+models.signals.post_save.connect(forget_feed, sender=Asset)
+models.signals.post_delete.connect(forget_feed, sender=Asset)
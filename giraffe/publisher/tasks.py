@@ -1,14 +1,17 @@
 from datetime import datetime, timedelta
 import hmac
+from itertools import islice
 from random import choice
 import logging
 import string
 from urllib import urlencode
 import urlparse
 
-from celery.decorators import task
+from celery.decorators import periodic_task, task
+from celery.task.sets import TaskSet
+from django.conf import settings
+from django.core.cache import cache
 from django.template.loader import render_to_string
-import httplib2
 
 
 ONE_YEAR_SECONDS = 31556926
@@ -20,7 +23,17 @@ def ping():
 
 
 @task
-def verify_subscription(callback, mode, topic, lease_seconds=None, secret=None, verify_token=None):
+def verify_subscription(callback, mode, topic, lease_seconds=None, secret=None, verify_token=None, defer=True):
+    """Ask the subscriber whether it really meant to (un)subscribe, and
+    (un)subscribe it if so.
+
+    If the subscriber's host can't be contacted right now and `defer` is
+    true, the verification is parked or queued again for later; otherwise
+    `breaker.CircuitOpen` or `delivery.HostBusy` is raised.
+
+    """
+    from giraffe.publisher import breaker, delivery
+
     challenge = ''.join(choice(string.letters + string.digits) for i in range(50))
 
     query = {
@@ -30,7 +43,7 @@ def verify_subscription(callback, mode, topic, lease_seconds=None, secret=None,
     }
     if mode == 'subscribe':
         query['hub.lease_seconds'] = ONE_YEAR_SECONDS if lease_seconds is None else min(ONE_YEAR_SECONDS, lease_seconds)
-    if secret is not None and urlparts.scheme == 'https':
+    if secret is not None and urlparse.urlsplit(callback).scheme == 'https':
         query['hub.secret'] = secret
     if verify_token is not None:
         query['hub.verify_token'] = verify_token
@@ -40,8 +53,30 @@ def verify_subscription(callback, mode, topic, lease_seconds=None, secret=None,
     urlparts[3] = '%s&%s' % (urlparts[3], query_str) if urlparts[3] else query_str
     verify_url = urlparse.urlunsplit(urlparts)
 
-    http = httplib2.Http()
-    resp, content = http.request(verify_url)
+    from giraffe.publisher import models
+
+    try:
+        resp, content = delivery.request(verify_url)
+    except breaker.CircuitOpen:
+        if not defer:
+            raise
+        # Park the request's id, so its secret isn't kept in the parked task.
+        try:
+            lease_seconds = int(lease_seconds) if lease_seconds is not None else None
+        except ValueError:
+            lease_seconds = None
+        pending = models.PendingVerification(callback=callback, mode=mode, topic=topic,
+            lease_seconds=lease_seconds, secret=secret or '', verify_token=verify_token or '')
+        pending.save()
+        breaker.park(delivery.callback_host(callback), verify_pending, (pending.pk,), {})
+        return
+    except delivery.HostBusy:
+        if not defer:
+            raise
+        verify_subscription.apply_async(kwargs={'callback': callback, 'mode': mode, 'topic': topic,
+            'lease_seconds': lease_seconds, 'secret': secret, 'verify_token': verify_token},
+            countdown=delivery.busy_delay())
+        return
 
     if resp.status == 404:
         # The action was refused, so don't do anything.
@@ -49,8 +84,6 @@ def verify_subscription(callback, mode, topic, lease_seconds=None, secret=None,
 
     success = 200 <= resp.status and resp.status < 300 and challenge == content
 
-    from giraffe.publisher import models
-
     if success and mode == 'unsubscribe':
         try:
             sub = models.Subscription.objects.get(callback=callback, topic=topic)
@@ -73,36 +106,159 @@ def verify_subscription(callback, mode, topic, lease_seconds=None, secret=None,
 
 
 @task
-def ping_subscriber(callback, asset_pk, secret=None):
-    log = logging.getLogger('.'.join((__name__, 'ping_subscriber')))
+def verify_pending(pending_pk):
+    """Verify the parked (un)subscription request `pending_pk`."""
+    from giraffe.publisher.models import PendingVerification
+
+    try:
+        pending = PendingVerification.objects.get(pk=pending_pk)
+    except PendingVerification.DoesNotExist:
+        return
+    pending.delete()
+    verify_subscription(callback=pending.callback, mode=pending.mode, topic=pending.topic,
+        lease_seconds=pending.lease_seconds, secret=pending.secret or None,
+        verify_token=pending.verify_token or None)
+
+
+def notification_key(asset_pk):
+    return 'publisher:notification:%s' % asset_pk
+
 
+def notification_timeout():
+    return getattr(settings, 'PUBLISHER_NOTIFICATION_TIMEOUT', 24 * 60 * 60)
+
+
+def render_notification(asset_pk):
+    """Render the feed of just the given asset that subscribers are sent
+    about it, and cache it for the delivery tasks. Returns None if there's
+    no such asset."""
     from giraffe.publisher.models import Asset
 
-    log.debug('Pinging subscriber %r about asset %r', callback, asset_pk)
     try:
         asset = Asset.objects.get(pk=asset_pk)
     except Asset.DoesNotExist:
-        # OH WELL
-        log.debug("Oops, no such asset %r; guess we won't ping about it", asset_pk)
-        return
+        return None
 
     feed = render_to_string('publisher/feed.xml', {
         'assets': [asset],
-    })
+    }).encode('utf-8')
+    cache.set(notification_key(asset_pk), feed, notification_timeout())
+    return feed
+
+
+@task
+def notify_subscribers(asset_pk, topic):
+    """Render the notification about the given asset once, and queue its
+    delivery to every subscriber to `topic`."""
+    log = logging.getLogger('.'.join((__name__, 'notify_subscribers')))
+
+    from giraffe.publisher.models import Subscription
+
+    if render_notification(asset_pk) is None:
+        log.debug("Oops, no such asset %r; guess we won't ping about it", asset_pk)
+        return
+
+    subs = Subscription.active(topic).order_by().values_list('callback', 'secret').iterator()
+    batch_size = getattr(settings, 'PUBLISHER_FANOUT_BATCH_SIZE', 100)
+    count = 0
+    while True:
+        batch = list(islice(subs, batch_size))
+        if not batch:
+            break
+        # Each batch is sent over one connection to the broker.
+        TaskSet(ping_subscriber.subtask((callback, asset_pk), {'secret': secret, 'topic': topic})
+            for callback, secret in batch).apply_async()
+        count += len(batch)
+    log.debug("Posted %d jobs to tell subscribers about asset %r", count, asset_pk)
+
+
+@task
+def ping_subscriber(callback, asset_pk, secret=None, attempt=0, topic=None):
+    log = logging.getLogger('.'.join((__name__, 'ping_subscriber')))
+
+    from giraffe.publisher import breaker, delivery
+
+    log.debug('Pinging subscriber %r about asset %r', callback, asset_pk)
+    feed = cache.get(notification_key(asset_pk))
+    if feed is None:
+        # It fell out of the cache, so render it again.
+        feed = render_notification(asset_pk)
+        if feed is None:
+            # OH WELL
+            log.debug("Oops, no such asset %r; guess we won't ping about it", asset_pk)
+            return
+
     headers = {'Content-Type': 'application/atom+xml'}
 
-    if secret is not None:
-        headers['X-Hub-Signature'] = hmac.new(secret, feed).hexdigest()
+    if secret:
+        headers['X-Hub-Signature'] = hmac.new(secret.encode('utf-8'), feed).hexdigest()
 
-    http = httplib2.Http()
     log.debug("Pinging %r with %d bytes of made-up feed", callback, len(feed))
-    resp, cont = http.request(uri=callback, method='POST', body=feed, headers=headers)
+    try:
+        delivery.deliver(callback, feed, headers)
+    except breaker.CircuitOpen:
+        log.debug("The circuit for %r's host is open; parking the notification", callback)
+        # Leave the secret out; it's looked up again when the task is unparked.
+        breaker.park(delivery.callback_host(callback), ping_parked, (callback, asset_pk),
+            {'attempt': attempt, 'topic': topic})
+        return
+    except delivery.HostBusy:
+        log.debug("Too many deliveries to %r's host already; trying again soon", callback)
+        ping_subscriber.apply_async(args=(callback, asset_pk),
+            kwargs={'secret': secret, 'attempt': attempt, 'topic': topic},
+            countdown=delivery.busy_delay())
+        return
+    except delivery.DeliveryError, exc:
+        attempts = attempt + 1
+        if not exc.retry or attempts >= delivery.max_attempts():
+            delivery.dead_letter(callback, asset_pk, topic, attempts, str(exc))
+            return
+        countdown = delivery.backoff(attempt)
+        log.info("Couldn't notify subscriber %r about asset %r (%s); trying again in %d seconds",
+            callback, asset_pk, str(exc), countdown)
+        ping_subscriber.apply_async(args=(callback, asset_pk),
+            kwargs={'secret': secret, 'attempt': attempts, 'topic': topic}, countdown=countdown)
+        return
+
+    # Sweet, that worked.
+    log.debug("Yay, told %r about asset %r!", callback, asset_pk)
 
-    if 200 <= resp.status and resp.status < 300:
-        # Sweet, that worked.
-        log.debug("Yay, got response %d telling %r about asset %d!", resp.status, callback, asset_pk)
+
+@task
+def ping_parked(callback, asset_pk, attempt=0, topic=None):
+    """Deliver a notification that was parked, signed with the current
+    secret of its subscription. If the subscription is gone or its lease has
+    run out, the notification is dropped."""
+    log = logging.getLogger('.'.join((__name__, 'ping_parked')))
+
+    from giraffe.publisher.models import Subscription
+
+    try:
+        subscription = Subscription.active(topic).get(callback=callback)
+    except Subscription.DoesNotExist:
+        log.info("Dropping the notification to %r about asset %r, as it's no longer subscribed",
+            callback, asset_pk)
         return
+    ping_subscriber(callback, asset_pk, secret=subscription.secret or None, attempt=attempt,
+        topic=topic)
+
+
+@periodic_task(run_every=timedelta(seconds=getattr(settings, 'PUBLISHER_BREAKER_RESET', 300)))
+def unpark_deliveries():
+    """Queue the parked tasks of callback hosts whose circuits are no
+    longer open."""
+    from giraffe.publisher import breaker
+
+    breaker.unpark_due()
+
+
+@periodic_task(run_every=timedelta(days=1))
+def prune_subscriptions():
+    """Delete the subscriptions whose leases have run out."""
+    log = logging.getLogger('.'.join((__name__, 'prune_subscriptions')))
+
+    from giraffe.publisher.models import Subscription
 
-    # TODO: try again?
-    log.warning("Unexpected response notifying subscriber %r about asset %d: %d %s", callback, asset_pk, resp.status, resp.reason)
-    return
+    expired = Subscription.expired()
+    log.debug("Deleting %d expired subscriptions", expired.count())
+    expired.delete()
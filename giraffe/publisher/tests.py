@@ -5,7 +5,29 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from cStringIO import StringIO
+from datetime import datetime, timedelta
+from SocketServer import ThreadingMixIn
+import cgi
+import sys
+import threading
+import time
+import urlparse
+
+from celery.app import app_or_default
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.utils.http import parse_http_date
+
+from giraffe.friends.models import Person
+from giraffe.publisher import breaker, delivery, tasks
+from giraffe.publisher.models import Asset, DeadLetter, ParkedTask, PendingVerification, Subscription
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -21,3 +43,391 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+
+class FeedTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('blogger', 'blogger@example.com', 'password')
+        self.person = Person(display_name='Blogger', user=user)
+        self.person.save()
+        self.asset = Asset(title='First post', content='Hello', author=self.person)
+        self.asset.imported = True
+        self.asset.save()
+        self.url = reverse('publisher-feed')
+
+    def queries_during(self, func, *args, **kwargs):
+        old_debug, settings.DEBUG = settings.DEBUG, True
+        connection.queries = []
+        try:
+            result = func(*args, **kwargs)
+            return result, len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+
+    def test_validators(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue('First post' in resp.content)
+        self.assertTrue(resp['ETag'].startswith('"'))
+        self.assertTrue(resp['Last-Modified'])
+
+    def test_not_modified(self):
+        resp = self.client.get(self.url)
+        resp, queries = self.queries_during(self.client.get, self.url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, '')
+        self.assertEqual(queries, 0)
+
+        resp = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_last_modified_moves_on(self):
+        first = self.client.get(self.url)
+        second = Asset(title='Second post', content='Again', author=self.person)
+        second.imported = True
+        second.save()
+        resp = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(parse_http_date(resp['Last-Modified']) > parse_http_date(first['Last-Modified']))
+
+    def test_cached(self):
+        first = self.client.get(self.url)
+        resp, queries = self.queries_during(self.client.get, self.url)
+        self.assertEqual(resp.content, first.content)
+        self.assertEqual(queries, 0)
+
+    def test_forgotten_on_save_and_delete(self):
+        etag = self.client.get(self.url)['ETag']
+        second = Asset(title='Second post', content='Again', author=self.person)
+        second.imported = True
+        second.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue('Second post' in resp.content)
+
+        Asset.objects.get(title='Second post').delete()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse('Second post' in resp.content)
+
+
+class SubscriberHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.received.append((self.client_address, body, self.headers.get('X-Hub-Signature')))
+
+        response = server.responses.pop(0) if server.responses else 204
+        if response == 'slow':
+            time.sleep(server.slow_for)
+            response = 204
+        self.send_response(response)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        # Confirm verifications by echoing the challenge.
+        query = cgi.parse_qs(urlparse.urlsplit(self.path)[3])
+        self.server.verified.append(query)
+        challenge = query.get('hub.challenge', [''])[0]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(challenge)))
+        self.end_headers()
+        self.wfile.write(challenge)
+
+    def log_message(self, *args):
+        pass
+
+
+class SubscriberServer(ThreadingMixIn, HTTPServer):
+
+    """A stand-in subscriber, answering each notification with the next of
+    `responses`: an HTTP status, or 'slow' to answer only after `slow_for`
+    seconds. Every verification is confirmed."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), SubscriberHandler)
+        self.received = []
+        self.verified = []
+        self.responses = []
+        self.slow_for = 1
+
+    def handle_error(self, request, client_address):
+        # Slow responses are written after the subscriber has given up.
+        pass
+
+    @property
+    def callback(self):
+        return 'http://127.0.0.1:%d/callback' % self.server_address[1]
+
+
+class SubscriberTestCase(TestCase):
+
+    """Runs a stand-in subscriber to deliver notifications to."""
+
+    settings = {
+        'PUBLISHER_DELIVERY_TIMEOUT': 0.5,
+        'PUBLISHER_DELIVERY_ATTEMPTS': 3,
+        'PUBLISHER_DELIVERY_HOST_LIMIT': 2,
+    }
+
+    topic = 'http://example.com/feed'
+
+    def setUp(self):
+        cache.clear()
+        self.old_settings = dict((name, getattr(settings, name)) for name in self.settings
+            if hasattr(settings, name))
+        for name, value in self.settings.iteritems():
+            setattr(settings, name, value)
+        # Run retries right away, rather than through the broker.
+        self.conf = app_or_default().conf
+        self.old_eager, self.conf.CELERY_ALWAYS_EAGER = self.conf.CELERY_ALWAYS_EAGER, True
+
+        self.server = SubscriberServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+        user = User.objects.create_user('blogger', 'blogger@example.com', 'password')
+        person = Person(display_name='Blogger', user=user)
+        person.save()
+        self.asset = Asset(title='First post', content='Hello', author=person)
+        self.asset.imported = True
+        self.asset.save()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        delivery.pool.clear()
+        self.conf.CELERY_ALWAYS_EAGER = self.old_eager
+        for name in self.settings:
+            if name in self.old_settings:
+                setattr(settings, name, self.old_settings[name])
+            else:
+                delattr(settings, name)
+
+    def ping(self, secret=None):
+        tasks.ping_subscriber(self.server.callback, self.asset.pk, secret=secret, topic=self.topic)
+
+
+class DeliveryTest(SubscriberTestCase):
+
+    def test_delivery(self):
+        self.ping(secret=u'sekrit')
+        self.assertEqual(len(self.server.received), 1)
+        address, body, signature = self.server.received[0]
+        self.assertTrue('First post' in body)
+        self.assertTrue(signature)
+        self.assertEqual(DeadLetter.objects.count(), 0)
+
+    def test_keep_alive(self):
+        self.ping()
+        self.ping()
+        addresses = set(address for address, body, signature in self.server.received)
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(len(addresses), 1)
+
+    def test_retry(self):
+        self.server.responses = [503, 500]
+        self.ping()
+        self.assertEqual(len(self.server.received), 3)
+        self.assertEqual(DeadLetter.objects.count(), 0)
+
+    def test_dead_letter(self):
+        self.server.responses = [500, 500, 500]
+        self.ping()
+        self.assertEqual(len(self.server.received), 3)
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual(dead_letter.attempts, 3)
+        self.assertEqual(dead_letter.asset, self.asset)
+        self.assertTrue('500' in dead_letter.error)
+        self.assertEqual(dead_letter.topic, self.topic)
+
+        # Replays are signed with the subscription's secret as it is now.
+        Subscription(callback=self.server.callback, topic=self.topic, secret=u'sekrit').save()
+        self.replay()
+        self.assertEqual(len(self.server.received), 4)
+        address, body, signature = self.server.received[3]
+        self.assertTrue(signature)
+        self.assertEqual(DeadLetter.objects.count(), 0)
+
+    def test_dead_letter_unsubscribed(self):
+        self.server.responses = [500, 500, 500]
+        self.ping()
+        Subscription(callback=self.server.callback, topic=self.topic,
+            lease_until=datetime.now() - timedelta(days=1)).save()
+        self.replay()
+        self.assertEqual(len(self.server.received), 3)
+        self.assertEqual(DeadLetter.objects.count(), 0)
+
+    def replay(self):
+        old_stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            call_command('replaydeadletters', host='127.0.0.1:%d' % self.server.server_address[1])
+        finally:
+            sys.stdout = old_stdout
+
+    def test_refused(self):
+        self.server.responses = [404]
+        self.ping()
+        self.assertEqual(len(self.server.received), 1)
+        self.assertEqual(DeadLetter.objects.get().attempts, 1)
+
+    def test_slow_subscriber(self):
+        self.server.responses = ['slow', 'slow', 'slow']
+        started = time.time()
+        self.ping()
+        self.assertTrue(time.time() - started < 3)
+        self.assertTrue('timed out' in DeadLetter.objects.get().error)
+
+    def test_host_limit(self):
+        host = delivery.callback_host(self.server.callback)
+        self.assertTrue(delivery.acquire_host(host))
+        self.assertTrue(delivery.acquire_host(host))
+        self.assertFalse(delivery.acquire_host(host))
+        delivery.release_host(host)
+        self.assertTrue(delivery.acquire_host(host))
+        self.assertRaises(delivery.HostBusy, delivery.deliver, self.server.callback, '', {})
+
+    def test_backoff(self):
+        for attempt in range(20):
+            delay = delivery.backoff(attempt)
+            cap = min(3600, 30 * 2 ** attempt)
+            self.assertTrue(cap / 2.0 <= delay <= cap)
+
+
+class BreakerTest(SubscriberTestCase):
+
+    settings = dict(SubscriberTestCase.settings,
+        PUBLISHER_BREAKER_THRESHOLD=2,
+        PUBLISHER_BREAKER_RESET=60)
+
+    def setUp(self):
+        super(BreakerTest, self).setUp()
+        self.host = delivery.callback_host(self.server.callback)
+        Subscription(callback=self.server.callback, topic=self.topic, secret=u'sekrit').save()
+
+    def age_circuit(self):
+        """Make the open circuit old enough to be half open."""
+        cache.set(breaker._key('opened', self.host), time.time() - 61)
+
+    def test_opens_and_parks(self):
+        self.server.responses = [500, 500]
+        self.ping()
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(breaker.state(self.host), breaker.OPEN)
+        self.assertEqual(ParkedTask.objects.count(), 1)
+        self.assertEqual(DeadLetter.objects.count(), 0)
+
+        self.ping()
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(ParkedTask.objects.count(), 2)
+
+    def test_closes_and_unparks(self):
+        self.server.responses = [500, 500]
+        self.ping()
+        self.ping()
+        self.age_circuit()
+        self.assertEqual(breaker.state(self.host), breaker.HALF_OPEN)
+
+        breaker.unpark_due()
+        self.assertEqual(breaker.state(self.host), breaker.CLOSED)
+        self.assertEqual(len(self.server.received), 4)
+        self.assertEqual(ParkedTask.objects.count(), 0)
+        self.assertEqual(DeadLetter.objects.count(), 0)
+
+    def test_parked_without_secret(self):
+        breaker.open_circuit(self.host)
+        self.ping(secret=u'sekrit')
+        self.assertFalse('sekrit' in ParkedTask.objects.get().arguments)
+
+        # Unparked notifications are signed with the subscription's secret.
+        breaker.record_success(self.host)
+        address, body, signature = self.server.received[0]
+        self.assertTrue(signature)
+
+    def test_unsubscribed_while_parked(self):
+        breaker.open_circuit(self.host)
+        self.ping(secret=u'sekrit')
+        Subscription.objects.all().delete()
+        breaker.record_success(self.host)
+        self.assertEqual(len(self.server.received), 0)
+        self.assertEqual(ParkedTask.objects.count(), 0)
+
+    def test_failed_trial_reopens(self):
+        breaker.open_circuit(self.host)
+        self.age_circuit()
+        self.server.responses = [500]
+        self.ping()
+        self.assertEqual(len(self.server.received), 1)
+        self.assertEqual(breaker.state(self.host), breaker.OPEN)
+        self.assertEqual(ParkedTask.objects.count(), 1)
+
+    def test_one_trial_at_a_time(self):
+        breaker.open_circuit(self.host)
+        self.age_circuit()
+        self.assertTrue(breaker.allow(self.host))
+        self.assertFalse(breaker.allow(self.host))
+        breaker.cancel_trial(self.host)
+        self.assertTrue(breaker.allow(self.host))
+
+    def test_client_errors_dont_open(self):
+        self.server.responses = [404, 404]
+        self.ping()
+        self.ping()
+        self.assertEqual(breaker.state(self.host), breaker.CLOSED)
+
+    def test_verification(self):
+        breaker.open_circuit(self.host)
+        kwargs = {'callback': self.server.callback, 'mode': 'subscribe',
+            'topic': 'http://example.com/other', 'secret': u'other sekrit'}
+        self.assertRaises(breaker.CircuitOpen, tasks.verify_subscription, defer=False, **kwargs)
+        tasks.verify_subscription(**kwargs)
+        parked = ParkedTask.objects.get()
+        self.assertEqual(parked.task, tasks.verify_pending.name)
+        self.assertFalse('sekrit' in parked.arguments)
+        self.assertEqual(len(self.server.received), 0)
+
+        breaker.record_success(self.host)
+        self.assertEqual(len(self.server.verified), 1)
+        self.assertEqual(PendingVerification.objects.count(), 0)
+        subscription = Subscription.objects.get(topic='http://example.com/other')
+        self.assertEqual(subscription.secret, u'other sekrit')
+
+
+class FanOutTest(SubscriberTestCase):
+
+    settings = dict(SubscriberTestCase.settings,
+        PUBLISHER_FANOUT_BATCH_SIZE=2)
+
+    def subscribe(self, path, lease_until=None):
+        callback = '%s/%s' % (self.server.callback, path)
+        Subscription(callback=callback, topic=self.topic, lease_until=lease_until).save()
+
+    def test_fan_out(self):
+        now = datetime.now()
+        for i in range(3):
+            self.subscribe('current-%d' % i, lease_until=now + timedelta(days=1))
+        self.subscribe('unleased')
+        self.subscribe('expired', lease_until=now - timedelta(days=1))
+        Subscription(callback=self.server.callback, topic='http://example.com/other').save()
+
+        tasks.notify_subscribers(self.asset.pk, self.topic)
+        self.assertEqual(len(self.server.received), 4)
+
+    def test_prune(self):
+        now = datetime.now()
+        self.subscribe('current', lease_until=now + timedelta(days=1))
+        self.subscribe('unleased')
+        self.subscribe('expired', lease_until=now - timedelta(days=1))
+
+        tasks.prune_subscriptions()
+        self.assertEqual(sorted(Subscription.objects.values_list('callback', flat=True)),
+            ['%s/%s' % (self.server.callback, path) for path in ('current', 'unleased')])
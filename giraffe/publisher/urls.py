@@ -6,7 +6,7 @@ from django.conf.urls.defaults import *
 urlpatterns = patterns('giraffe.publisher.views',
     url(r'^$', 'index', name='publisher-index'),
     url(r'^page/(?P<page>\d+)', 'index', name='publisher-index-page'),
-    url(r'^feed$', 'index', {'template': 'publisher/feed.xml', 'content_type': 'text/plain'}, name='publisher-feed'),
+    url(r'^feed$', 'feed', {'content_type': 'text/plain'}, name='publisher-feed'),
     url(r'^asset/(?P<slug>[\w-]+)$', 'asset', name='publisher-asset'),
     url(r'^test_mq$', 'test_mq'),
 
@@ -1,19 +1,19 @@
 from functools import wraps
 import logging
 
-from django.contrib.auth.models import User
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.db.models import Count
 from django.http import HttpResponse, Http404
 from django.shortcuts import render_to_response
 from django.template import RequestContext
+from django.utils.http import http_date
 try:
     from django.views.decorators.csrf import csrf_exempt
 except ImportError:
     from django.contrib.csrf.middleware import csrf_exempt
 
 from giraffe.publisher.models import Subscription, Asset
-from giraffe.publisher import tasks
+from giraffe.publisher import feeds, tasks
 
 
 def test_mq(request):
@@ -29,14 +29,7 @@ def test_mq(request):
 
 
 def index(request, page=1, template=None, content_type=None):
-    blogger = User.objects.all().order_by('id')[0].person
-
-    assets = Asset.objects.all().order_by('-published')
-    assets = assets.filter(author=blogger)
-    assets = assets.filter(in_reply_to=None)
-    # TODO: get the assets that the user is allowed to see
-    assets = assets.filter(private_to=None)
-
+    assets = feeds.blog_assets()
     assets = assets.annotate(comment_count=Count('replies_in_thread'))
 
     pager = Paginator(assets, 10)
@@ -55,6 +48,17 @@ def index(request, page=1, template=None, content_type=None):
         context_instance=RequestContext(request), mimetype=content_type)
 
 
+def feed(request, content_type='application/atom+xml'):
+    cached = feeds.get_feed()
+    if feeds.is_not_modified(request, cached):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(cached['body'], content_type=content_type)
+    response['ETag'] = feeds.etag_header(cached)
+    response['Last-Modified'] = http_date(cached['last_modified'])
+    return response
+
+
 def asset(request, slug, template=None):
     try:
         asset = Asset.objects.annotate(comment_count=Count('replies_in_thread')).get(slug=slug)
@@ -111,7 +115,7 @@ def subscribe(request):
     verify_token = request.POST.get('hub.verify_token')
 
     try:
-        sub = Subscription.objects.get(callback=callback)
+        sub = Subscription.objects.get(callback=callback, topic=topic)
     except Subscription.DoesNotExist:
         if mode == 'unsubscribe':
             # Already gone!
@@ -138,7 +142,7 @@ def subscribe(request):
         return HttpResponse('', status=202, content_type='text/plain')
     elif 'sync' in verify:
         try:
-            task(**kwargs)
+            task(defer=False, **kwargs)
         except Exception, exc:
             log.debug("%s: %s", type(exc).__name__, str(exc))
             return HttpResponse('%s: %s' % (type(exc).__name__, str(exc)), status=400, content_type='text/plain')